@@ -1,15 +1,88 @@
 from flask import Flask, render_template, request, jsonify, redirect, url_for, flash
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
 from datetime import datetime
+import re
+import threading
 import uuid
 import os
 
+from compression import ResponseCompressor
+from json_provider import COLUMNAR_MIMETYPE, FastJSONProvider, to_columnar, wants_columnar
+from task_log import TaskLog
+
 app = Flask(__name__)
+app.json = FastJSONProvider(app)
 app.secret_key = os.environ.get('SECRET_KEY', 'dev-secret-key-change-in-production')
 
-# In-memory storage for demo purposes
-tasks = []
+# gzip/brotli/zstd for response bodies of COMPRESSION_MIN_BYTES or more
+compressor = ResponseCompressor()
+
+
+@app.after_request
+def compress_response(response):
+    return compressor.apply(request, response)
+
+
+class SearchIndex:
+    """In-memory inverted index over task titles and descriptions.
+
+    Maps each word to the ids of the tasks containing it, so a search only
+    looks at tasks sharing its words. Title words score higher than
+    description words.
+    """
+    TITLE_WEIGHT = 2
+    DESCRIPTION_WEIGHT = 1
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._postings = defaultdict(dict)  # word -> {task id: score}
+        self._words = {}  # task id -> words indexed for it
+
+    @staticmethod
+    def tokenize(text):
+        return re.findall(r'\w+', (text or '').lower())
+
+    def add(self, task):
+        """Index a new task, or re-index one whose text changed."""
+        scores = defaultdict(int)
+        for word in self.tokenize(task.title):
+            scores[word] += self.TITLE_WEIGHT
+        for word in self.tokenize(task.description):
+            scores[word] += self.DESCRIPTION_WEIGHT
+        with self._lock:
+            self._remove(task.id)
+            for word, score in scores.items():
+                self._postings[word][task.id] = score
+            self._words[task.id] = set(scores)
+
+    def remove(self, task_id):
+        with self._lock:
+            self._remove(task_id)
+
+    def _remove(self, task_id):
+        for word in self._words.pop(task_id, ()):
+            postings = self._postings[word]
+            postings.pop(task_id, None)
+            if not postings:
+                del self._postings[word]
+
+    def search(self, query):
+        """Return {task id: score} for tasks containing every word in ``query``."""
+        words = set(self.tokenize(query))
+        if not words:
+            return {}
+        with self._lock:
+            postings = sorted((self._postings.get(word, {}) for word in words), key=len)
+            # Intersect starting from the rarest word
+            matches = set(postings[0])
+            for word_postings in postings[1:]:
+                matches.intersection_update(word_postings)
+            return {task_id: sum(p[task_id] for p in postings) for task_id in matches}
 
 class Task:
+    __slots__ = ('id', 'title', 'description', 'priority', 'completed', 'created_at', 'updated_at')
+
     def __init__(self, title, description="", priority="medium"):
         self.id = str(uuid.uuid4())
         self.title = title
@@ -26,14 +99,246 @@ class Task:
             'description': self.description,
             'priority': self.priority,
             'completed': self.completed,
-            'created_at': self.created_at.strftime('%Y-%m-%d %H:%M'),
-            'updated_at': self.updated_at.strftime('%Y-%m-%d %H:%M')
+            # Same as strftime('%Y-%m-%d %H:%M'), about 3x faster
+            'created_at': self.created_at.isoformat(' ', 'minutes'),
+            'updated_at': self.updated_at.isoformat(' ', 'minutes')
         }
 
+    def to_record(self):
+        """Full-precision form of the task for the persistence log"""
+        record = {name: getattr(self, name) for name in self.__slots__}
+        record['created_at'] = self.created_at.isoformat()
+        record['updated_at'] = self.updated_at.isoformat()
+        return record
+
+    @classmethod
+    def from_record(cls, record):
+        task = cls.__new__(cls)
+        for name in cls.__slots__:
+            setattr(task, name, record[name])
+        task.created_at = datetime.fromisoformat(record['created_at'])
+        task.updated_at = datetime.fromisoformat(record['updated_at'])
+        return task
+
+class TaskStore:
+    """Thread-safe in-memory task storage.
+
+    Tasks live in a dict keyed by id, so lookups, updates and deletes are
+    O(1) and iteration follows insertion order. Secondary indexes by
+    priority and completion status and the search index are kept in step
+    with every write. All mutation goes through the store's lock, so
+    concurrent requests can't lose each other's updates.
+
+    With a ``TaskLog``, every write is also appended to the log before it
+    returns, and reads first replay what other processes sharing the log
+    have written.
+
+    It also behaves enough like the old list (``append``, ``clear``,
+    ``len``, indexing, iteration) for templates and tests.
+    """
+    UPDATABLE_FIELDS = ('title', 'description', 'priority', 'completed')
+
+    def __init__(self, log=None):
+        self._lock = threading.RLock()
+        self._log = log
+        self._writing = None  # records logged by the write in progress
+        self._reset()
+        self._refresh()
+
+    def add(self, task):
+        with self._write() as records:
+            self._put(task)
+            records.append({'op': 'put', 'task': task.to_record()})
+        return task
+
+    append = add
+
+    def get(self, task_id):
+        with self._lock:
+            self._refresh()
+            return self._tasks.get(task_id)
+
+    def update(self, task_id, **fields):
+        """Apply ``fields`` to a task and re-index it; returns None if missing."""
+        unknown = set(fields) - set(self.UPDATABLE_FIELDS)
+        if unknown:
+            raise ValueError(f'Unknown task fields: {", ".join(sorted(unknown))}')
+        with self._write() as records:
+            task = self._tasks.get(task_id)
+            if task is None:
+                return None
+            self._unindex(task)
+            for name, value in fields.items():
+                setattr(task, name, value)
+            task.updated_at = datetime.now()
+            self._index(task)
+            if 'title' in fields or 'description' in fields:
+                self.search_index.add(task)
+            records.append({'op': 'put', 'task': task.to_record()})
+        return task
+
+    def toggle(self, task_id):
+        with self._write():
+            task = self._tasks.get(task_id)
+            if task is None:
+                return None
+            return self.update(task_id, completed=not task.completed)
+
+    def remove(self, task_id):
+        """Delete a task; returns it, or None if it didn't exist."""
+        with self._write() as records:
+            task = self._delete(task_id)
+            if task is not None:
+                records.append({'op': 'delete', 'id': task_id})
+        return task
+
+    def clear(self):
+        with self._write() as records:
+            self._reset()
+            records.append({'op': 'clear'})
+
+    def filter(self, priority=None, completed=None):
+        """Tasks matching the given priority and/or completion status, in insertion order."""
+        with self._lock:
+            self._refresh()
+            if priority is None and completed is None:
+                return list(self._tasks.values())
+            candidates = []
+            if priority is not None:
+                candidates.append(self._by_priority.get(priority, {}))
+            if completed is not None:
+                candidates.append(self._by_completed[bool(completed)])
+            smallest = min(candidates, key=len)
+            return [task for task_id, task in smallest.items()
+                    if all(task_id in index for index in candidates)]
+
+    def search(self, query):
+        """Return (task, score) pairs for tasks matching every word in ``query``."""
+        with self._lock:
+            self._refresh()
+            scores = self.search_index.search(query)
+            return [(self._tasks[task_id], score) for task_id, score in scores.items()]
+
+    def stats(self):
+        with self._lock:
+            self._refresh()
+            completed = len(self._by_completed[True])
+            return {
+                'total': len(self._tasks),
+                'completed': completed,
+                'pending': len(self._tasks) - completed
+            }
+
+    @contextmanager
+    def _write(self):
+        """Hold the store for a write; records appended to the yielded list are logged.
+
+        Nested writes (``toggle`` calling ``update``) log through the
+        outermost one, which waits for the fsync after releasing the locks
+        so concurrent writers can share it.
+        """
+        records = []
+        with self._lock:
+            if self._log is None:
+                yield records
+                return
+            outermost = self._writing is None
+            if outermost:
+                self._writing = []
+            try:
+                with self._log.exclusive() if outermost else nullcontext():
+                    if outermost:
+                        self._log.replay(self._apply)
+                    yield records
+                    self._writing.extend(records)
+                    if not outermost:
+                        return
+                    seq = self._log.append(self._writing) if self._writing else None
+                    if self._log.should_compact():
+                        self._log.compact({'op': 'put', 'task': task.to_record()}
+                                          for task in self._tasks.values())
+            finally:
+                if outermost:
+                    self._writing = None
+        if seq is not None:
+            self._log.commit(seq)
+
+    def _refresh(self):
+        """Replay log records written by other processes. Call with the lock held."""
+        if self._log is None or self._writing is not None:
+            return
+        with self._log.shared():
+            self._log.replay(self._apply)
+
+    def _apply(self, record):
+        if record['op'] == 'put':
+            self._put(Task.from_record(record['task']))
+        elif record['op'] == 'delete':
+            self._delete(record['id'])
+        elif record['op'] == 'clear':
+            self._reset()
+
+    def _put(self, task):
+        existing = self._tasks.get(task.id)
+        if existing is not None:
+            self._unindex(existing)
+        # Replacing an existing key keeps the task's place in the order
+        self._tasks[task.id] = task
+        self._index(task)
+        self.search_index.add(task)
+
+    def _delete(self, task_id):
+        task = self._tasks.pop(task_id, None)
+        if task is not None:
+            self._unindex(task)
+            self.search_index.remove(task_id)
+        return task
+
+    def _reset(self):
+        self._tasks = {}
+        # Dicts rather than sets so each index keeps insertion order too
+        self._by_priority = defaultdict(dict)  # priority -> {task id: task}
+        self._by_completed = {True: {}, False: {}}
+        self.search_index = SearchIndex()
+
+    def _index(self, task):
+        self._by_priority[task.priority][task.id] = task
+        self._by_completed[bool(task.completed)][task.id] = task
+
+    def _unindex(self, task):
+        priority_index = self._by_priority.get(task.priority, {})
+        priority_index.pop(task.id, None)
+        if not priority_index:
+            self._by_priority.pop(task.priority, None)
+        self._by_completed[bool(task.completed)].pop(task.id, None)
+
+    def __len__(self):
+        with self._lock:
+            self._refresh()
+            return len(self._tasks)
+
+    def __iter__(self):
+        # Iterate over a snapshot so concurrent writes can't break the loop
+        with self._lock:
+            self._refresh()
+            return iter(list(self._tasks.values()))
+
+    def __getitem__(self, index):
+        with self._lock:
+            self._refresh()
+            return list(self._tasks.values())[index]
+
+# In-memory storage for demo purposes. Set TASK_STORE_PATH to keep tasks in
+# an append-only log there, so they survive restarts and can be shared by
+# several worker processes on one host.
+TASK_STORE_PATH = os.environ.get('TASK_STORE_PATH')
+TASK_STORE_COMPACT_BYTES = int(os.environ.get('TASK_STORE_COMPACT_BYTES', 8 * 1024 * 1024))
+tasks = TaskStore(TaskLog(TASK_STORE_PATH, TASK_STORE_COMPACT_BYTES) if TASK_STORE_PATH else None)
+
 @app.route('/')
 def index():
     """Main page with task list"""
-    return render_template('index.html', tasks=tasks)
+    return render_template('index.html', tasks=tasks, stats=tasks.stats())
 
 @app.route('/add_task', methods=['POST'])
 def add_task():
@@ -46,19 +351,16 @@ def add_task():
         flash('Task title is required!', 'error')
         return redirect(url_for('index'))
     
-    task = Task(title, description, priority)
-    tasks.append(task)
+    tasks.add(Task(title, description, priority))
     flash('Task added successfully!', 'success')
     return redirect(url_for('index'))
 
 @app.route('/toggle_task/<task_id>')
 def toggle_task(task_id):
     """Toggle task completion status"""
-    task = next((t for t in tasks if t.id == task_id), None)
+    task = tasks.toggle(task_id)
     
     if task:
-        task.completed = not task.completed
-        task.updated_at = datetime.now()
         flash(f'Task "{task.title}" marked as {"completed" if task.completed else "incomplete"}!', 'info')
     else:
         flash('Task not found!', 'error')
@@ -68,11 +370,9 @@ def toggle_task(task_id):
 @app.route('/delete_task/<task_id>')
 def delete_task(task_id):
     """Delete a task"""
-    global tasks
-    task = next((t for t in tasks if t.id == task_id), None)
+    task = tasks.remove(task_id)
     
     if task:
-        tasks = [t for t in tasks if t.id != task_id]
         flash(f'Task "{task.title}" deleted successfully!', 'success')
     else:
         flash('Task not found!', 'error')
@@ -82,22 +382,29 @@ def delete_task(task_id):
 @app.route('/edit_task/<task_id>', methods=['GET', 'POST'])
 def edit_task(task_id):
     """Edit a task"""
-    task = next((t for t in tasks if t.id == task_id), None)
+    task = tasks.get(task_id)
     
     if not task:
         flash('Task not found!', 'error')
         return redirect(url_for('index'))
     
     if request.method == 'POST':
-        task.title = request.form.get('title', task.title).strip()
-        task.description = request.form.get('description', task.description).strip()
-        task.priority = request.form.get('priority', task.priority)
-        task.updated_at = datetime.now()
+        title = request.form.get('title', task.title).strip()
         
-        if not task.title:
+        if not title:
             flash('Task title is required!', 'error')
             return render_template('edit_task.html', task=task)
         
+        task = tasks.update(
+            task_id,
+            title=title,
+            description=request.form.get('description', task.description).strip(),
+            priority=request.form.get('priority', task.priority)
+        )
+        if not task:
+            flash('Task not found!', 'error')
+            return redirect(url_for('index'))
+        
         flash('Task updated successfully!', 'success')
         return redirect(url_for('index'))
     
@@ -105,8 +412,24 @@ def edit_task(task_id):
 
 @app.route('/api/tasks')
 def api_tasks():
-    """API endpoint to get all tasks as JSON"""
-    return jsonify([task.to_dict() for task in tasks])
+    """API endpoint to get all tasks as JSON, optionally filtered by priority and/or completed
+
+    Clients accepting COLUMNAR_MIMETYPE get ``{"columns": [...], "rows": [...]}`` instead of a list.
+    """
+    priority = request.args.get('priority')
+    completed = request.args.get('completed')
+    if completed is not None:
+        if completed.lower() not in ('true', 'false'):
+            return jsonify({'error': 'completed must be true or false'}), 400
+        completed = completed.lower() == 'true'
+    task_dicts = [task.to_dict() for task in tasks.filter(priority=priority, completed=completed)]
+    if not wants_columnar(request.accept_mimetypes):
+        response = jsonify(task_dicts)
+    else:
+        response = jsonify(to_columnar(task_dicts))
+        response.mimetype = COLUMNAR_MIMETYPE
+    response.vary.add('Accept')
+    return response
 
 @app.route('/api/tasks', methods=['POST'])
 def api_add_task():
@@ -122,41 +445,47 @@ def api_add_task():
         priority=data.get('priority', 'medium')
     )
     
-    tasks.append(task)
+    tasks.add(task)
     return jsonify(task.to_dict()), 201
 
+@app.route('/api/tasks/search')
+def api_search_tasks():
+    """API endpoint to search task titles and descriptions, best match first"""
+    query = request.args.get('q', '').strip()
+    limit = request.args.get('limit', 50, type=int)
+    offset = request.args.get('offset', 0, type=int)
+    if not query:
+        return jsonify({'error': 'q is required'}), 400
+    if limit < 1 or offset < 0:
+        return jsonify({'error': 'limit must be positive and offset not negative'}), 400
+    
+    matches = tasks.search(query)
+    matches.sort(key=lambda match: (-match[1], -match[0].created_at.timestamp()))
+    page = matches[offset:offset + limit]
+    return jsonify({
+        'tasks': [dict(task.to_dict(), rank=score) for task, score in page],
+        'next_offset': offset + limit if len(matches) > offset + limit else None
+    })
+
 @app.route('/api/tasks/<task_id>', methods=['PUT'])
 def api_update_task(task_id):
     """API endpoint to update a task"""
-    task = next((t for t in tasks if t.id == task_id), None)
-    
-    if not task:
+    if not tasks.get(task_id):
         return jsonify({'error': 'Task not found'}), 404
     
     data = request.get_json()
     
-    if 'title' in data:
-        task.title = data['title']
-    if 'description' in data:
-        task.description = data['description']
-    if 'priority' in data:
-        task.priority = data['priority']
-    if 'completed' in data:
-        task.completed = data['completed']
-    
-    task.updated_at = datetime.now()
+    task = tasks.update(task_id, **{name: data[name] for name in TaskStore.UPDATABLE_FIELDS if name in data})
+    if not task:
+        return jsonify({'error': 'Task not found'}), 404
     return jsonify(task.to_dict())
 
 @app.route('/api/tasks/<task_id>', methods=['DELETE'])
 def api_delete_task(task_id):
     """API endpoint to delete a task"""
-    global tasks
-    task = next((t for t in tasks if t.id == task_id), None)
-    
-    if not task:
+    if not tasks.remove(task_id):
         return jsonify({'error': 'Task not found'}), 404
     
-    tasks = [t for t in tasks if t.id != task_id]
     return jsonify({'message': 'Task deleted successfully'})
 
 @app.route('/health')
@@ -165,7 +494,8 @@ def health_check():
     return jsonify({
         'status': 'healthy',
         'timestamp': datetime.now().isoformat(),
-        'tasks_count': len(tasks)
+        'tasks_count': len(tasks),
+        'storage': 'log' if TASK_STORE_PATH else 'memory'
     })
 
 if __name__ == '__main__':
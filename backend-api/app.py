@@ -1,12 +1,57 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify, stream_with_context
 from datetime import datetime
+from functools import wraps
+import gzip
 import os
-from database import db_session, init_db, shutdown_session
-from models import Task
+import time
+from urllib.parse import urlencode
+from sqlalchemy import delete, insert, select, text, update
+from database import (
+    db_session, engine, init_db, pool_status, replicas_configured, shutdown_session, use_replica
+)
+from events import EVENTS_LISTEN_URL, EventBroadcaster, parse_last_event_id
+from jobs import JobRunner, enqueue, validate_job
+from models import Job, JOB_COLUMNS, Task, job_to_dict, project_task_rows, task_to_dict, tasks_to_dicts
+from json_provider import COLUMNAR_MIMETYPE, FastJSONProvider, to_columnar, wants_columnar
+from compression import ResponseCompressor
+from cache import create_cache, task_cache_key
+import metrics
+from profiling import RequestProfiler, is_admin
+from slow_queries import SlowQueryLog
+from queries import (
+    EXPORT_BATCH_SIZE, MAX_BATCH_SIZE, TaskPage, batch_create_rows, batch_update_statements,
+    TaskSearch, batch_events, export_statement, if_match_condition, parse_fields, parse_task_id,
+    stats_result, stats_statement, task_statement, task_write_statements, tasks_version_statement,
+    validate_batch
+)
 
 app = Flask(__name__)
+app.json = FastJSONProvider(app)
 app.secret_key = os.environ.get('SECRET_KEY', 'dev-secret-key-change-in-production')
 
+# After a client writes, its reads go to the primary for this many seconds
+# so it sees its own changes despite replica lag
+READ_YOUR_WRITES_SECONDS = float(os.environ.get('DB_READ_YOUR_WRITES_SECONDS', 5))
+PRIMARY_UNTIL_COOKIE = 'db_primary_until'
+
+# Response cache for task reads: memory:// (per-worker LRU), redis://host:port/db,
+# or none. Write handlers invalidate the entries they affect.
+cache = create_cache(
+    os.environ.get('CACHE_URL', 'memory://'),
+    ttl=float(os.environ.get('CACHE_TTL_SECONDS', 30)),
+    max_entries=int(os.environ.get('CACHE_MAX_ENTRIES', 1024))
+)
+
+# One LISTEN connection per worker feeds every /api/tasks/events stream
+broadcaster = EventBroadcaster(engine, EVENTS_LISTEN_URL)
+
+# Opt-in request profiles and slow statements, listed at /admin/profiles
+profiler = RequestProfiler()
+slow_queries = SlowQueryLog()
+
+# gzip/brotli/zstd for response bodies of COMPRESSION_MIN_BYTES or more
+compressor = ResponseCompressor()
+
 # Initialize database on startup
 with app.app_context():
     try:
@@ -19,6 +64,186 @@ with app.app_context():
 @app.teardown_appcontext
 def shutdown_app_session(exception=None):
     shutdown_session(exception)
+    metrics.update_pool_gauges(engine.pool)
+
+
+def metrics_route():
+    return request.url_rule.rule if request.url_rule else metrics.UNMATCHED_ROUTE
+
+
+@app.before_request
+def start_request_metrics():
+    g.request_started = time.perf_counter()
+    g.request_stats = metrics.begin_request()
+    slow_queries.begin_request()
+    trigger = profiler.trigger(request.headers)
+    if trigger:
+        g.profile = (trigger, profiler.start())
+
+
+@app.after_request
+def record_request_metrics(response):
+    seconds = time.perf_counter() - g.request_started
+    metrics.observe_request(request.method, metrics_route(), response.status_code, seconds)
+    if 'profile' in g:
+        trigger, session = g.pop('profile')
+        stats = g.request_stats
+        entry = profiler.finish(
+            session, trigger=trigger, method=request.method, path=request.full_path.rstrip('?'),
+            status=response.status_code, duration_ms=round(seconds * 1000, 3),
+            sql={'queries': stats.queries, 'duration_ms': round(stats.query_seconds * 1000, 3)},
+            rows_serialized=stats.rows
+        )
+        response.headers['X-Profile-Id'] = str(entry['id'])
+    return response
+
+
+@app.teardown_request
+def finish_request_metrics(exception=None):
+    # Runs after a streamed body is sent, so its queries and rows count too
+    if 'request_stats' in g:
+        metrics.end_request(g.request_stats, metrics_route())
+    slow_queries.explain_pending(engine)
+
+
+@app.after_request
+def mark_recent_write(response):
+    """Pin the client to fresh reads for a short window after it writes."""
+    if (replicas_configured() or cache.enabled) \
+            and request.method in ('POST', 'PUT', 'PATCH', 'DELETE') \
+            and response.status_code < 400:
+        response.set_cookie(PRIMARY_UNTIL_COOKIE, str(time.time() + READ_YOUR_WRITES_SECONDS),
+                            max_age=int(READ_YOUR_WRITES_SECONDS) + 1, httponly=True)
+    return response
+
+
+@app.after_request
+def compress_response(response):
+    # Registered after record_request_metrics, so it runs before it and is timed
+    return compressor.apply(request, response)
+
+
+def read_only(view):
+    """Serve a view from a read replica and the cache.
+
+    A client that wrote recently reads from the primary and skips the
+    cache instead, so it sees its own changes.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        try:
+            primary_until = float(request.cookies.get(PRIMARY_UNTIL_COOKIE, 0))
+        except ValueError:
+            primary_until = 0
+        g.fresh_reads = primary_until > time.time()
+        if not g.fresh_reads:
+            use_replica()
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def tasks_version():
+    """The tasks table's change counter and the time it last changed."""
+    row = db_session.execute(tasks_version_statement()).first()
+    return row if row is not None else (0, datetime(1970, 1, 1))
+
+
+def is_not_modified(etag, last_modified):
+    """Whether the request's validators show the client's copy is current.
+
+    If-None-Match takes precedence over If-Modified-Since, as in RFC 9110.
+    """
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    if request.if_modified_since and last_modified:
+        # HTTP dates have one-second resolution
+        return last_modified.replace(tzinfo=None, microsecond=0) \
+            <= request.if_modified_since.replace(tzinfo=None)
+    return False
+
+
+def set_validators(response, etag, last_modified):
+    """Attach ETag/Last-Modified and ask clients to revalidate before reuse."""
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    response.cache_control.no_cache = True
+    return response
+
+
+def not_modified_response(etag, last_modified):
+    return set_validators(app.response_class(status=304), etag, last_modified)
+
+
+def cache_response(key, response):
+    """Store a response body, with its validators, under ``key``."""
+    etag, _ = response.get_etag()
+    cache.set(key, b'\n'.join([
+        etag.encode(), response.headers['Last-Modified'].encode(), response.get_data()
+    ]))
+
+
+def cached_response(key, mimetype='application/json'):
+    """Rebuild a response stored by cache_response, or return None."""
+    value = None if g.get('fresh_reads') else cache.get(key)
+    if value is None:
+        return None
+    etag, last_modified, body = value.split(b'\n', 2)
+    response = app.response_class(body, mimetype=mimetype)
+    response.headers['Last-Modified'] = last_modified.decode()
+    response.set_etag(etag.decode())
+    response.cache_control.no_cache = True
+    return response
+
+
+def list_variant(etag):
+    """The ETag and mimetype for a task list in the encoding the client asked for."""
+    if wants_columnar(request.accept_mimetypes):
+        return f'{etag}-columnar', COLUMNAR_MIMETYPE
+    return etag, 'application/json'
+
+
+def task_list_response(payload, mimetype):
+    """JSON response for a page of tasks, with ``payload['tasks']`` columnar if asked for."""
+    if mimetype == COLUMNAR_MIMETYPE:
+        payload = {**payload, 'tasks': to_columnar(payload['tasks'])}
+    response = jsonify(payload)
+    response.mimetype = mimetype
+    return response
+
+
+@app.after_request
+def vary_task_lists(response):
+    """Task lists come in plain and columnar encodings, chosen by Accept."""
+    if request.endpoint in ('get_tasks', 'search_tasks'):
+        response.vary.add('Accept')
+    return response
+
+
+def invalidate_tasks(*task_ids):
+    """Drop cached copies of the given tasks.
+
+    Cached list pages need no explicit invalidation: their keys include the
+    tasks change counter, which every write bumps.
+    """
+    cache.delete(*[task_cache_key(task_id) for task_id in task_ids])
+
+
+def commit_task_write(*task_ids, events=()):
+    """Record change events, bump the tasks change counter, commit, then drop stale cache entries.
+
+    ``events`` are (type, task dict) pairs for the change feed.
+    """
+    for statement in task_write_statements(events, db_session.get_bind().dialect.name):
+        db_session.execute(statement)
+    db_session.commit()
+    invalidate_tasks(*task_ids)
+
+
+# Bulk imports, exports and purges run here (JOBS_WORKER_THREADS threads per
+# worker) or in standalone workers rather than on request threads. The
+# threads are started once the worker has forked, by gunicorn.conf.py's
+# post_worker_init hook, not when this module is imported.
+job_runner = JobRunner(engine, on_tasks_changed=invalidate_tasks)
 
 
 @app.route('/health')
@@ -26,7 +251,7 @@ def health_check():
     """Health check endpoint."""
     try:
         # Test database connection
-        db_session.execute('SELECT 1')
+        db_session.execute(text('SELECT 1'))
         db_status = 'healthy'
     except Exception as e:
         db_status = f'unhealthy: {str(e)}'
@@ -34,20 +259,184 @@ def health_check():
     return jsonify({
         'status': 'healthy',
         'timestamp': datetime.utcnow().isoformat(),
-        'database': db_status
+        'database': db_status,
+        'pool': pool_status(),
+        'cache': cache.stats(),
+        'jobs': job_runner.stats()
+    })
+
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus metrics for every worker of this instance."""
+    body, content_type = metrics.render()
+    return Response(body, content_type=content_type)
+
+
+@app.route('/admin/profiles')
+def list_profiles():
+    """Recent request profiles and slow SQL statements of this worker."""
+    if not profiler.token:
+        return jsonify({'error': 'Not found'}), 404
+    if not is_admin(request.headers, profiler.token):
+        return jsonify({'error': 'Admin token required'}), 403
+    return jsonify({
+        'pid': os.getpid(),
+        'profiles': profiler.profiles.entries(),
+        'slow_queries': slow_queries.entries.entries()
     })
 
 
 @app.route('/api/tasks', methods=['GET'])
+@read_only
 def get_tasks():
-    """Get all tasks."""
+    """Get one page of tasks.
+
+    Query parameters:
+        limit: page size (default TASKS_PAGE_SIZE, capped at TASKS_MAX_PAGE_SIZE)
+        cursor: ``next_cursor`` from the previous page
+        sort: ``created_at`` or ``updated_at``, prefixed with ``-`` for descending
+        completed: ``true`` or ``false``
+        priority: comma-separated list of priorities
+        created_after / created_before: ISO 8601 timestamps
+        fields: comma-separated columns to return (default all)
+    """
+    try:
+        # Answer revalidations and cache hits from the change counter alone
+        version, modified_at = tasks_version()
+        etag, mimetype = list_variant(f'tasks-{version}')
+        if is_not_modified(etag, modified_at):
+            return not_modified_response(etag, modified_at)
+        cache_key = f'tasks:list:{etag}:{urlencode(sorted(request.args.items(multi=True)))}'
+        response = cached_response(cache_key, mimetype)
+        if response is not None:
+            return response
+
+        page = TaskPage(request.args)
+        tasks = db_session.execute(page.statement).all()
+        response = set_validators(task_list_response(page.result(tasks), mimetype), etag, modified_at)
+        cache_response(cache_key, response)
+        return response
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/api/tasks/stats', methods=['GET'])
+@read_only
+def get_task_stats():
+    """Count tasks by completion and by priority.
+
+    Revalidated and cached on the tasks change counter, like the list.
+    """
+    try:
+        version, modified_at = tasks_version()
+        etag = f'tasks-stats-{version}'
+        if is_not_modified(etag, modified_at):
+            return not_modified_response(etag, modified_at)
+        cache_key = f'tasks:stats:{version}'
+        response = cached_response(cache_key)
+        if response is not None:
+            return response
+
+        stats = stats_result(db_session.execute(stats_statement()))
+        response = set_validators(jsonify(stats), etag, modified_at)
+        cache_response(cache_key, response)
+        return response
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/api/tasks/search', methods=['GET'])
+@read_only
+def search_tasks():
+    """Full-text search over task titles and descriptions, best match first.
+
+    Query parameters:
+        q: search terms (on Postgres, web search syntax: quoted phrases, ``or``, ``-word``)
+        limit / offset: page of results; ``next_offset`` is returned while more remain
+        completed, priority, created_after, created_before: as for GET /api/tasks
+    """
     try:
-        tasks = Task.query.all()
-        return jsonify([task.to_dict() for task in tasks])
+        version, modified_at = tasks_version()
+        etag, mimetype = list_variant(f'tasks-search-{version}')
+        if is_not_modified(etag, modified_at):
+            return not_modified_response(etag, modified_at)
+        cache_key = f'tasks:search:{etag}:{urlencode(sorted(request.args.items(multi=True)))}'
+        response = cached_response(cache_key, mimetype)
+        if response is not None:
+            return response
+
+        search = TaskSearch(request.args, db_session.get_bind().dialect.name)
+        rows = db_session.execute(search.statement).all()
+        response = set_validators(task_list_response(search.result(rows), mimetype), etag, modified_at)
+        cache_response(cache_key, response)
+        return response
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
+@app.route('/api/tasks/export', methods=['GET'])
+@read_only
+def export_tasks():
+    """Stream every task matching the list filters.
+
+    ``format=ndjson`` (default) sends one JSON object per line;
+    ``format=json`` sends a single JSON array. Rows are read through a
+    server-side cursor in batches of TASKS_EXPORT_BATCH_SIZE and written out
+    as they arrive, so memory use does not grow with the table.
+    """
+    export_format = request.args.get('format', 'ndjson')
+    if export_format not in ('ndjson', 'json'):
+        return jsonify({'error': f'Invalid value for format: {export_format}'}), 400
+    try:
+        statement = export_statement(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    rows = db_session.execute(
+        statement.execution_options(yield_per=EXPORT_BATCH_SIZE)
+    ).partitions()
+
+    def generate():
+        separator = '\n' if export_format == 'ndjson' else ','
+        if export_format == 'json':
+            yield '['
+        written = False
+        for partition in rows:
+            chunk = separator.join(app.json.dumps(task) for task in tasks_to_dicts(partition))
+            yield (separator if written else '') + chunk
+            written = True
+        if export_format == 'json':
+            yield ']'
+        elif written:
+            yield '\n'
+
+    mimetype = 'application/x-ndjson' if export_format == 'ndjson' else 'application/json'
+    return Response(stream_with_context(generate()), mimetype=mimetype)
+
+
+@app.route('/api/tasks/events', methods=['GET'])
+def task_events():
+    """Stream task changes as Server-Sent Events.
+
+    Each event's type is ``created``, ``updated`` or ``deleted`` and its
+    data is the task as JSON. Send ``Last-Event-ID`` (EventSource does so
+    when it reconnects) or ``last_event_id`` to resume after that event.
+    Streams end after TASK_EVENTS_STREAM_SECONDS; clients reconnect.
+    """
+    try:
+        last_event_id = parse_last_event_id(
+            request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return Response(broadcaster.stream(last_event_id), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
 @app.route('/api/tasks', methods=['POST'])
 def create_task():
     """Create a new task."""
@@ -64,52 +453,218 @@ def create_task():
         )
         
         db_session.add(task)
-        db_session.commit()
+        db_session.flush()
+        commit_task_write(events=[('created', task_to_dict(task))])
         
-        return jsonify(task.to_dict()), 201
+        return task_response(task, 201)
     except Exception as e:
         db_session.rollback()
         return jsonify({'error': str(e)}), 500
 
 
+@app.route('/api/tasks/batch', methods=['POST'])
+def batch_tasks():
+    """Create, update and delete many tasks in one transaction.
+
+    The body is ``{"operations": [...]}`` where each operation is
+    ``{"op": "create", "title": ...}``, ``{"op": "update", "id": ..., <fields>}``
+    or ``{"op": "delete", "id": ...}``. All operations are validated first;
+    if any is invalid nothing is written and the per-item errors are returned
+    with a 400. Otherwise the response lists one result per operation, in order.
+    """
+    data = request.get_json(silent=True)
+    if not data or not isinstance(data.get('operations'), list):
+        return jsonify({'error': 'operations list is required'}), 400
+    operations = data['operations']
+    if len(operations) > MAX_BATCH_SIZE:
+        return jsonify({'error': f'At most {MAX_BATCH_SIZE} operations per batch'}), 400
+
+    try:
+        creates, updates, deletes = validate_batch(operations)
+    except ValueError as e:
+        return jsonify({'error': 'Invalid operations', 'results': e.args[0]}), 400
+
+    table = Task.__table__
+    results = [None] * len(operations)
+    deleted = {}
+    try:
+        now = datetime.utcnow()
+        if creates:
+            created = db_session.execute(
+                insert(table).returning(*table.c, sort_by_parameter_order=True),
+                batch_create_rows(creates, now)
+            )
+            for (index, _), row in zip(creates, created):
+                results[index] = {'index': index, 'status': 201, 'task': task_to_dict(row)}
+
+        if updates:
+            for statement, params in batch_update_statements([payload for _, payload in updates], now):
+                db_session.execute(statement, params)
+            updated_ids = [task_id for _, (task_id, _) in updates]
+            found = {
+                row.id: row
+                for row in db_session.execute(select(table).where(table.c.id.in_(updated_ids)))
+            }
+            for index, (task_id, _) in updates:
+                if task_id in found:
+                    results[index] = {'index': index, 'status': 200, 'task': task_to_dict(found[task_id])}
+                else:
+                    results[index] = {'index': index, 'status': 404, 'error': 'Task not found'}
+
+        if deletes:
+            deleted = {
+                str(row.id): task_to_dict(row)
+                for row in db_session.execute(
+                    delete(table).where(table.c.id.in_([task_id for _, task_id in deletes])).returning(*table.c)
+                )
+            }
+            for index, task_id in deletes:
+                if str(task_id) in deleted:
+                    results[index] = {'index': index, 'status': 200, 'id': str(task_id)}
+                else:
+                    results[index] = {'index': index, 'status': 404, 'error': 'Task not found'}
+
+        commit_task_write(*[task_id for _, (task_id, _) in updates], *[task_id for _, task_id in deletes],
+                          events=batch_events(results, deleted))
+        return jsonify({'results': results})
+    except Exception as e:
+        db_session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+
+def task_response(row, status=200, columns=None):
+    """JSON response for a single task, with its version as the ETag.
+
+    ``columns`` limits the payload to those fields; the row must still
+    carry version and updated_at.
+    """
+    response = jsonify(task_to_dict(row) if columns is None else project_task_rows([row], columns)[0])
+    response.status_code = status
+    return set_validators(response, str(row.version), row.updated_at)
+
+
+def missing_task_response(task_id):
+    """Explain why a conditional write matched no row: 404 or 412."""
+    table = Task.__table__
+    exists = db_session.execute(select(table.c.id).where(table.c.id == task_id)).first()
+    if exists is None:
+        return jsonify({'error': 'Task not found'}), 404
+    return jsonify({'error': 'Task has been modified'}), 412
+
+
 @app.route('/api/tasks/<task_id>', methods=['GET'])
+@read_only
 def get_task(task_id):
-    """Get a specific task by ID."""
+    """Get a specific task by ID.
+
+    ``fields`` (comma-separated) selects which columns to return; only
+    complete tasks are cached. A cached copy is served only while its ETag
+    matches the row's version: other workers and jobs change tasks without
+    reaching this worker's cache.
+    """
     try:
-        task = Task.query.filter_by(id=task_id).first()
+        parsed_id = parse_task_id(task_id)
+        if parsed_id is None:
+            return jsonify({'error': 'Task not found'}), 404
+        columns = parse_fields(request.args)
+
+        # Check the validators before loading and serializing the row
+        table = Task.__table__
+        current = db_session.execute(
+            select(table.c.version, table.c.updated_at).where(table.c.id == parsed_id)
+        ).first()
+        if current is None:
+            return jsonify({'error': 'Task not found'}), 404
+        if is_not_modified(str(current.version), current.updated_at):
+            return not_modified_response(str(current.version), current.updated_at)
+        response = cached_response(task_cache_key(parsed_id)) if columns is None else None
+        if response is not None and response.get_etag()[0] == str(current.version):
+            return response
         
-        if not task:
+        row = db_session.execute(task_statement(parsed_id, columns)).first()
+        
+        if not row:
             return jsonify({'error': 'Task not found'}), 404
         
-        return jsonify(task.to_dict())
+        response = task_response(row, columns=columns)
+        if columns is None:
+            cache_response(task_cache_key(parsed_id), response)
+        return response
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
 @app.route('/api/tasks/<task_id>', methods=['PUT'])
 def update_task(task_id):
-    """Update a task."""
+    """Update a task in a single UPDATE ... RETURNING statement.
+
+    Send ``If-Match`` with the task's ETag to update only if nobody else
+    has written to it since; a stale ETag gets a 412.
+    """
     try:
-        task = Task.query.filter_by(id=task_id).first()
-        
-        if not task:
+        parsed_id = parse_task_id(task_id)
+        if parsed_id is None:
             return jsonify({'error': 'Task not found'}), 404
         
         data = request.get_json()
+        values = {
+            field: data[field]
+            for field in ('title', 'description', 'priority', 'completed')
+            if field in data
+        }
         
-        if 'title' in data:
-            task.title = data['title']
-        if 'description' in data:
-            task.description = data['description']
-        if 'priority' in data:
-            task.priority = data['priority']
-        if 'completed' in data:
-            task.completed = data['completed']
+        table = Task.__table__
+        statement = update(table).where(table.c.id == parsed_id)
+        condition = if_match_condition(request.if_match)
+        if condition is not None:
+            statement = statement.where(condition)
+        statement = statement.values(
+            **values, updated_at=datetime.utcnow(), version=table.c.version + 1
+        ).returning(*table.c)
         
-        task.updated_at = datetime.utcnow()
-        db_session.commit()
+        row = db_session.execute(statement).first()
+        if row is None:
+            db_session.rollback()
+            return missing_task_response(parsed_id)
+        commit_task_write(parsed_id, events=[('updated', task_to_dict(row))])
         
-        return jsonify(task.to_dict())
+        return task_response(row)
+    except Exception as e:
+        db_session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/api/tasks/<task_id>/toggle', methods=['POST'])
+def toggle_task(task_id):
+    """Flip a task's completed flag in the database and return the task.
+
+    The flip happens in the UPDATE itself, so concurrent toggles never
+    overwrite each other. Honors ``If-Match`` the same way as update_task.
+    """
+    try:
+        parsed_id = parse_task_id(task_id)
+        if parsed_id is None:
+            return jsonify({'error': 'Task not found'}), 404
+        
+        table = Task.__table__
+        statement = update(table).where(table.c.id == parsed_id)
+        condition = if_match_condition(request.if_match)
+        if condition is not None:
+            statement = statement.where(condition)
+        statement = statement.values(
+            completed=~table.c.completed, updated_at=datetime.utcnow(),
+            version=table.c.version + 1
+        ).returning(*table.c)
+        
+        row = db_session.execute(statement).first()
+        if row is None:
+            db_session.rollback()
+            return missing_task_response(parsed_id)
+        commit_task_write(parsed_id, events=[('updated', task_to_dict(row))])
+        
+        return task_response(row)
     except Exception as e:
         db_session.rollback()
         return jsonify({'error': str(e)}), 500
@@ -117,21 +672,102 @@ def update_task(task_id):
 
 @app.route('/api/tasks/<task_id>', methods=['DELETE'])
 def delete_task(task_id):
-    """Delete a task."""
+    """Delete a task in a single DELETE ... RETURNING statement.
+
+    The response includes the deleted task. Honors ``If-Match`` the same
+    way as update_task.
+    """
     try:
-        task = Task.query.filter_by(id=task_id).first()
-        
-        if not task:
+        parsed_id = parse_task_id(task_id)
+        if parsed_id is None:
             return jsonify({'error': 'Task not found'}), 404
         
-        db_session.delete(task)
-        db_session.commit()
+        table = Task.__table__
+        statement = delete(table).where(table.c.id == parsed_id)
+        condition = if_match_condition(request.if_match)
+        if condition is not None:
+            statement = statement.where(condition)
+        
+        row = db_session.execute(statement.returning(*table.c)).first()
+        if row is None:
+            db_session.rollback()
+            return missing_task_response(parsed_id)
+        commit_task_write(parsed_id, events=[('deleted', task_to_dict(row))])
         
-        return jsonify({'message': 'Task deleted successfully'})
+        return jsonify({'message': 'Task deleted successfully', 'task': task_to_dict(row)})
     except Exception as e:
         db_session.rollback()
         return jsonify({'error': str(e)}), 500
 
 
+@app.route('/api/jobs', methods=['POST'])
+def submit_job():
+    """Queue a background job.
+
+    The body is ``{"type": "import" | "purge_completed" | "export",
+    "payload": {...}}`` (see jobs.py). The payload is validated now, so a
+    bad one gets a 400 rather than a failed job. Returns 202 with the job
+    and its URL in Location; poll that for status and progress.
+    """
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or not data.get('type'):
+        return jsonify({'error': 'type is required'}), 400
+    try:
+        payload = validate_job(data['type'], data.get('payload') or {})
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    try:
+        row = enqueue(db_session, data['type'], payload)
+        db_session.commit()
+    except Exception as e:
+        db_session.rollback()
+        return jsonify({'error': str(e)}), 500
+    job_runner.wake()
+    response = jsonify(job_to_dict(row))
+    response.status_code = 202
+    response.headers['Location'] = f'/api/jobs/{row.id}'
+    return response
+
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Status, progress and result of a job."""
+    parsed_id = parse_task_id(job_id)
+    row = None if parsed_id is None else db_session.execute(
+        select(*JOB_COLUMNS).where(Job.id == parsed_id)
+    ).first()
+    if row is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job_to_dict(row))
+
+
+@app.route('/api/jobs/<job_id>/output', methods=['GET'])
+def get_job_output(job_id):
+    """The NDJSON file written by a finished export job.
+
+    It is stored gzip-compressed and sent as it is to clients accepting
+    gzip, otherwise decompressed.
+    """
+    parsed_id = parse_task_id(job_id)
+    row = None if parsed_id is None else db_session.execute(
+        select(Job.status, Job.output).where(Job.id == parsed_id)
+    ).first()
+    if row is None:
+        return jsonify({'error': 'Job not found'}), 404
+    if row.output is None:
+        return jsonify({'error': f'Job has no output (status: {row.status})'}), 409
+    if request.accept_encodings['gzip']:
+        response = Response(row.output, mimetype='application/x-ndjson')
+        response.headers['Content-Encoding'] = 'gzip'
+        response.vary.add('Accept-Encoding')
+        return response
+    return Response(gzip.decompress(row.output), mimetype='application/x-ndjson')
+
+
 if __name__ == '__main__':
+    # The debug reloader runs the app in a child process; the parent only
+    # watches files, so runners start in the child alone
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        job_runner.start()
     app.run(host='0.0.0.0', port=5000, debug=True)
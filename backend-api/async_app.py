@@ -0,0 +1,433 @@
+"""Asyncio variant of the task API, built on Starlette and SQLAlchemy asyncio.
+
+Serves the same /api/tasks routes and payloads as app.py, but each worker
+runs an event loop, so many requests can wait on the database at once
+instead of one per worker. Start it with SERVER_MODE=async (see start.sh).
+
+This mode talks to DATABASE_URL only: the response cache and read
+replicas are features of the sync app.
+"""
+import contextlib
+import json
+from datetime import datetime
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+from sqlalchemy import delete, insert, select, text, update
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from werkzeug.http import http_date, parse_date, parse_etags, quote_etag
+import database
+from database import DATABASE_URL, create_async_db_engine, init_db
+import metrics
+from events import EVENTS_LISTEN_URL, EventBroadcaster, parse_last_event_id
+from models import Task, project_task_rows, task_to_dict, tasks_to_dicts
+from queries import (
+    EXPORT_BATCH_SIZE, MAX_BATCH_SIZE, TaskPage, batch_create_rows, batch_update_statements,
+    TaskSearch, batch_events, export_statement, if_match_condition, parse_fields, parse_task_id,
+    stats_result, stats_statement, task_statement, task_write_statements, tasks_version_statement,
+    validate_batch
+)
+
+engine = create_async_db_engine(DATABASE_URL)
+Session = async_sessionmaker(engine, expire_on_commit=False)
+# Event fan-out runs on the sync engine, in its own thread
+broadcaster = EventBroadcaster(database.engine, EVENTS_LISTEN_URL)
+
+
+def error_response(message, status):
+    return JSONResponse({'error': message}, status_code=status)
+
+
+def is_not_modified(request, etag, last_modified):
+    """Whether the request's validators show the client's copy is current.
+
+    If-None-Match takes precedence over If-Modified-Since, as in RFC 9110.
+    """
+    if_none_match = parse_etags(request.headers.get('if-none-match'))
+    if if_none_match:
+        return if_none_match.contains_weak(etag)
+    if_modified_since = parse_date(request.headers.get('if-modified-since'))
+    if if_modified_since and last_modified:
+        # HTTP dates have one-second resolution
+        return last_modified.replace(tzinfo=None, microsecond=0) \
+            <= if_modified_since.replace(tzinfo=None)
+    return False
+
+
+def validator_headers(etag, last_modified):
+    """ETag/Last-Modified headers asking clients to revalidate before reuse."""
+    return {
+        'ETag': quote_etag(etag),
+        'Last-Modified': http_date(last_modified),
+        'Cache-Control': 'no-cache'
+    }
+
+
+def not_modified_response(etag, last_modified):
+    return Response(status_code=304, headers=validator_headers(etag, last_modified))
+
+
+def task_response(row, status=200, columns=None):
+    """JSON response for a single task, with its version as the ETag."""
+    payload = task_to_dict(row) if columns is None else project_task_rows([row], columns)[0]
+    return JSONResponse(payload, status_code=status,
+                        headers=validator_headers(str(row.version), row.updated_at))
+
+
+async def commit_task_write(session, events=()):
+    """Record change events, bump the tasks change counter and commit."""
+    for statement in task_write_statements(events, engine.dialect.name):
+        await session.execute(statement)
+    await session.commit()
+
+
+async def missing_task_response(session, task_id):
+    """Explain why a conditional write matched no row: 404 or 412."""
+    table = Task.__table__
+    exists = (await session.execute(select(table.c.id).where(table.c.id == task_id))).first()
+    if exists is None:
+        return error_response('Task not found', 404)
+    return error_response('Task has been modified', 412)
+
+
+async def read_json(request):
+    """The request's JSON body, or None if it is missing or malformed."""
+    try:
+        return await request.json()
+    except ValueError:
+        return None
+
+
+async def health_check(request):
+    """Health check endpoint."""
+    try:
+        async with Session() as session:
+            await session.execute(text('SELECT 1'))
+        db_status = 'healthy'
+    except Exception as e:
+        db_status = f'unhealthy: {str(e)}'
+
+    return JSONResponse({
+        'status': 'healthy',
+        'timestamp': datetime.utcnow().isoformat(),
+        'database': db_status,
+        'server': 'async',
+        'pool': {'pool_class': type(engine.pool).__name__, 'status': engine.pool.status()}
+    })
+
+
+async def metrics_endpoint(request):
+    """Prometheus metrics for every worker of this instance."""
+    body, content_type = metrics.render()
+    return Response(body, headers={'Content-Type': content_type})
+
+
+async def get_tasks(request):
+    """Get one page of tasks; takes the same parameters as app.get_tasks."""
+    try:
+        async with Session() as session:
+            row = (await session.execute(tasks_version_statement())).first()
+            version, modified_at = row if row is not None else (0, datetime(1970, 1, 1))
+            etag = f'tasks-{version}'
+            if is_not_modified(request, etag, modified_at):
+                return not_modified_response(etag, modified_at)
+
+            page = TaskPage(request.query_params)
+            tasks = (await session.execute(page.statement)).all()
+        return JSONResponse(page.result(tasks), headers=validator_headers(etag, modified_at))
+    except ValueError as e:
+        return error_response(str(e), 400)
+    except Exception as e:
+        return error_response(str(e), 500)
+
+
+async def get_task_stats(request):
+    """Count tasks by completion and by priority."""
+    try:
+        async with Session() as session:
+            row = (await session.execute(tasks_version_statement())).first()
+            version, modified_at = row if row is not None else (0, datetime(1970, 1, 1))
+            etag = f'tasks-stats-{version}'
+            if is_not_modified(request, etag, modified_at):
+                return not_modified_response(etag, modified_at)
+
+            stats = stats_result(await session.execute(stats_statement()))
+        return JSONResponse(stats, headers=validator_headers(etag, modified_at))
+    except Exception as e:
+        return error_response(str(e), 500)
+
+
+async def search_tasks(request):
+    """Full-text search; takes the same parameters as app.search_tasks."""
+    try:
+        async with Session() as session:
+            row = (await session.execute(tasks_version_statement())).first()
+            version, modified_at = row if row is not None else (0, datetime(1970, 1, 1))
+            etag = f'tasks-search-{version}'
+            if is_not_modified(request, etag, modified_at):
+                return not_modified_response(etag, modified_at)
+
+            search = TaskSearch(request.query_params, engine.dialect.name)
+            rows = (await session.execute(search.statement)).all()
+        return JSONResponse(search.result(rows), headers=validator_headers(etag, modified_at))
+    except ValueError as e:
+        return error_response(str(e), 400)
+    except Exception as e:
+        return error_response(str(e), 500)
+
+
+async def export_tasks(request):
+    """Stream every task matching the list filters as NDJSON or a JSON array."""
+    export_format = request.query_params.get('format', 'ndjson')
+    if export_format not in ('ndjson', 'json'):
+        return error_response(f'Invalid value for format: {export_format}', 400)
+    try:
+        statement = export_statement(request.query_params)
+    except ValueError as e:
+        return error_response(str(e), 400)
+
+    async def generate():
+        separator = '\n' if export_format == 'ndjson' else ','
+        if export_format == 'json':
+            yield '['
+        written = False
+        async with Session() as session:
+            result = await session.stream(
+                statement.execution_options(yield_per=EXPORT_BATCH_SIZE)
+            )
+            async for rows in result.partitions():
+                chunk = separator.join(json.dumps(task) for task in tasks_to_dicts(rows))
+                yield (separator if written else '') + chunk
+                written = True
+        if export_format == 'json':
+            yield ']'
+        elif written:
+            yield '\n'
+
+    media_type = 'application/x-ndjson' if export_format == 'ndjson' else 'application/json'
+    return StreamingResponse(generate(), media_type=media_type)
+
+
+async def task_events(request):
+    """Stream task changes as Server-Sent Events; see app.task_events."""
+    try:
+        last_event_id = parse_last_event_id(
+            request.headers.get('last-event-id') or request.query_params.get('last_event_id')
+        )
+    except ValueError as e:
+        return error_response(str(e), 400)
+    return StreamingResponse(broadcaster.stream_async(last_event_id), media_type='text/event-stream',
+                             headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+async def create_task(request):
+    """Create a new task."""
+    data = await read_json(request)
+    if not data or 'title' not in data:
+        return error_response('Title is required', 400)
+    try:
+        async with Session() as session:
+            task = Task(
+                title=data['title'],
+                description=data.get('description', ''),
+                priority=data.get('priority', 'medium')
+            )
+            session.add(task)
+            await session.flush()
+            await commit_task_write(session, events=[('created', task_to_dict(task))])
+        return task_response(task, 201)
+    except Exception as e:
+        return error_response(str(e), 500)
+
+
+async def batch_tasks(request):
+    """Create, update and delete many tasks in one transaction; see app.batch_tasks."""
+    data = await read_json(request)
+    if not data or not isinstance(data.get('operations'), list):
+        return error_response('operations list is required', 400)
+    operations = data['operations']
+    if len(operations) > MAX_BATCH_SIZE:
+        return error_response(f'At most {MAX_BATCH_SIZE} operations per batch', 400)
+
+    try:
+        creates, updates, deletes = validate_batch(operations)
+    except ValueError as e:
+        return JSONResponse({'error': 'Invalid operations', 'results': e.args[0]}, status_code=400)
+
+    table = Task.__table__
+    results = [None] * len(operations)
+    deleted = {}
+    try:
+        async with Session() as session:
+            now = datetime.utcnow()
+            if creates:
+                created = await session.execute(
+                    insert(table).returning(*table.c, sort_by_parameter_order=True),
+                    batch_create_rows(creates, now)
+                )
+                for (index, _), row in zip(creates, created):
+                    results[index] = {'index': index, 'status': 201, 'task': task_to_dict(row)}
+
+            if updates:
+                for statement, params in batch_update_statements([payload for _, payload in updates], now):
+                    await session.execute(statement, params)
+                updated_ids = [task_id for _, (task_id, _) in updates]
+                found = {
+                    row.id: row
+                    for row in await session.execute(select(table).where(table.c.id.in_(updated_ids)))
+                }
+                for index, (task_id, _) in updates:
+                    if task_id in found:
+                        results[index] = {'index': index, 'status': 200, 'task': task_to_dict(found[task_id])}
+                    else:
+                        results[index] = {'index': index, 'status': 404, 'error': 'Task not found'}
+
+            if deletes:
+                deleted = {
+                    str(row.id): task_to_dict(row)
+                    for row in await session.execute(
+                        delete(table).where(table.c.id.in_([task_id for _, task_id in deletes])).returning(*table.c)
+                    )
+                }
+                for index, task_id in deletes:
+                    if str(task_id) in deleted:
+                        results[index] = {'index': index, 'status': 200, 'id': str(task_id)}
+                    else:
+                        results[index] = {'index': index, 'status': 404, 'error': 'Task not found'}
+
+            await commit_task_write(session, events=batch_events(results, deleted))
+        return JSONResponse({'results': results})
+    except Exception as e:
+        return error_response(str(e), 500)
+
+
+async def get_task(request):
+    """Get a specific task by ID."""
+    parsed_id = parse_task_id(request.path_params['task_id'])
+    if parsed_id is None:
+        return error_response('Task not found', 404)
+    try:
+        columns = parse_fields(request.query_params)
+    except ValueError as e:
+        return error_response(str(e), 400)
+    try:
+        async with Session() as session:
+            if 'if-none-match' in request.headers or 'if-modified-since' in request.headers:
+                # Check the validators before loading and serializing the row
+                table = Task.__table__
+                current = (await session.execute(
+                    select(table.c.version, table.c.updated_at).where(table.c.id == parsed_id)
+                )).first()
+                if current is None:
+                    return error_response('Task not found', 404)
+                if is_not_modified(request, str(current.version), current.updated_at):
+                    return not_modified_response(str(current.version), current.updated_at)
+
+            row = (await session.execute(task_statement(parsed_id, columns))).first()
+        if row is None:
+            return error_response('Task not found', 404)
+        return task_response(row, columns=columns)
+    except Exception as e:
+        return error_response(str(e), 500)
+
+
+async def write_task(request, values):
+    """Run a single UPDATE ... RETURNING on the task named in the URL.
+
+    ``values`` are the columns to set; the version is always bumped and
+    If-Match is honored the same way as in app.update_task.
+    """
+    parsed_id = parse_task_id(request.path_params['task_id'])
+    if parsed_id is None:
+        return error_response('Task not found', 404)
+    try:
+        table = Task.__table__
+        statement = update(table).where(table.c.id == parsed_id)
+        condition = if_match_condition(parse_etags(request.headers.get('if-match')))
+        if condition is not None:
+            statement = statement.where(condition)
+        statement = statement.values(
+            **values, updated_at=datetime.utcnow(), version=table.c.version + 1
+        ).returning(*table.c)
+
+        async with Session() as session:
+            row = (await session.execute(statement)).first()
+            if row is None:
+                await session.rollback()
+                return await missing_task_response(session, parsed_id)
+            await commit_task_write(session, events=[('updated', task_to_dict(row))])
+        return task_response(row)
+    except Exception as e:
+        return error_response(str(e), 500)
+
+
+async def update_task(request):
+    """Update a task in a single UPDATE ... RETURNING statement."""
+    data = await read_json(request) or {}
+    values = {
+        field: data[field]
+        for field in ('title', 'description', 'priority', 'completed')
+        if field in data
+    }
+    return await write_task(request, values)
+
+
+async def toggle_task(request):
+    """Flip a task's completed flag in the database and return the task."""
+    return await write_task(request, {'completed': ~Task.__table__.c.completed})
+
+
+async def delete_task(request):
+    """Delete a task in a single DELETE ... RETURNING statement."""
+    parsed_id = parse_task_id(request.path_params['task_id'])
+    if parsed_id is None:
+        return error_response('Task not found', 404)
+    try:
+        table = Task.__table__
+        statement = delete(table).where(table.c.id == parsed_id)
+        condition = if_match_condition(parse_etags(request.headers.get('if-match')))
+        if condition is not None:
+            statement = statement.where(condition)
+
+        async with Session() as session:
+            row = (await session.execute(statement.returning(*table.c))).first()
+            if row is None:
+                await session.rollback()
+                return await missing_task_response(session, parsed_id)
+            await commit_task_write(session, events=[('deleted', task_to_dict(row))])
+        return JSONResponse({'message': 'Task deleted successfully', 'task': task_to_dict(row)})
+    except Exception as e:
+        return error_response(str(e), 500)
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    try:
+        # Schema setup runs once, on the sync engine, before serving
+        init_db()
+        database.engine.dispose()
+    except Exception as e:
+        print(f"Database initialization error: {e}")
+    yield
+    await engine.dispose()
+
+
+routes = [
+    Route('/health', health_check),
+    Route('/metrics', metrics_endpoint),
+    Route('/api/tasks', get_tasks, methods=['GET']),
+    Route('/api/tasks', create_task, methods=['POST']),
+    Route('/api/tasks/stats', get_task_stats, methods=['GET']),
+    Route('/api/tasks/search', search_tasks, methods=['GET']),
+    Route('/api/tasks/export', export_tasks, methods=['GET']),
+    Route('/api/tasks/batch', batch_tasks, methods=['POST']),
+    Route('/api/tasks/events', task_events, methods=['GET']),
+    Route('/api/tasks/{task_id}', get_task, methods=['GET']),
+    Route('/api/tasks/{task_id}', update_task, methods=['PUT']),
+    Route('/api/tasks/{task_id}', delete_task, methods=['DELETE']),
+    Route('/api/tasks/{task_id}/toggle', toggle_task, methods=['POST']),
+]
+
+app = Starlette(routes=routes, lifespan=lifespan,
+                middleware=[Middleware(metrics.MetricsMiddleware, routes=routes, pool=engine.pool)])
@@ -0,0 +1,222 @@
+import socket
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlparse
+
+
+class CacheError(Exception):
+    """Error reply from the Redis server."""
+
+
+class Cache:
+    """Base class for response caches; tracks hit/miss/error counts."""
+
+    enabled = True
+    backend = 'base'
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._stats_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    def _count(self, name):
+        with self._stats_lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def get(self, key):
+        """Return the bytes cached under ``key``, or None."""
+        try:
+            value = self._get(key)
+        except (OSError, CacheError):
+            # A cache outage degrades to a miss rather than a failed request
+            self._count('errors')
+            value = None
+        self._count('hits' if value is not None else 'misses')
+        return value
+
+    def set(self, key, value, ttl=None):
+        """Cache ``value`` (bytes) under ``key`` for ``ttl`` seconds."""
+        try:
+            self._set(key, value, self.ttl if ttl is None else ttl)
+        except (OSError, CacheError):
+            self._count('errors')
+
+    def delete(self, *keys):
+        """Remove ``keys`` from the cache."""
+        if not keys:
+            return
+        try:
+            self._delete(keys)
+        except (OSError, CacheError):
+            self._count('errors')
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                'backend': self.backend,
+                'hits': self.hits,
+                'misses': self.misses,
+                'errors': self.errors
+            }
+
+
+class NullCache(Cache):
+    """Cache that stores nothing, for CACHE_URL=none."""
+
+    enabled = False
+    backend = 'none'
+
+    def _get(self, key):
+        return None
+
+    def _set(self, key, value, ttl):
+        pass
+
+    def _delete(self, keys):
+        pass
+
+
+class LRUCache(Cache):
+    """In-process LRU cache with a per-entry TTL.
+
+    Each gunicorn worker has its own copy, so entries another worker has
+    invalidated can be served until their TTL runs out.
+    """
+
+    backend = 'memory'
+
+    def __init__(self, ttl, max_entries):
+        super().__init__(ttl)
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def _set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _delete(self, keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def stats(self):
+        stats = super().stats()
+        with self._lock:
+            stats['entries'] = len(self._entries)
+        return stats
+
+
+class RedisCache(Cache):
+    """Cache backed by any server speaking the Redis protocol (RESP).
+
+    Implements just the commands the cache needs over a plain socket, with
+    one connection per thread, so no Redis client library is required.
+    Entries are shared by every worker and pod using the same server.
+    """
+
+    backend = 'redis'
+
+    def __init__(self, url, ttl, prefix='taskmanager:', timeout=0.5):
+        super().__init__(ttl)
+        parsed = urlparse(url)
+        self.host = parsed.hostname or 'localhost'
+        self.port = parsed.port or 6379
+        self.db = int(parsed.path.lstrip('/') or 0)
+        self.password = parsed.password
+        self.prefix = prefix
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+            connection = (sock, sock.makefile('rb'))
+            self._local.connection = connection
+            if self.password:
+                self._send(b'AUTH', self.password)
+            if self.db:
+                self._send(b'SELECT', str(self.db))
+        return connection
+
+    def _send(self, *args):
+        sock, reader = self._connection()
+        parts = [b'*%d\r\n' % len(args)]
+        for arg in args:
+            if isinstance(arg, str):
+                arg = arg.encode()
+            parts.append(b'$%d\r\n%s\r\n' % (len(arg), arg))
+        try:
+            sock.sendall(b''.join(parts))
+            return self._read_reply(reader)
+        except OSError:
+            # Drop the broken connection so the next call reconnects
+            self._local.connection = None
+            sock.close()
+            raise
+
+    def _read_reply(self, reader):
+        line = reader.readline()
+        if not line:
+            raise ConnectionError('Connection closed by Redis server')
+        kind, rest = line[:1], line[1:-2]
+        if kind == b'+':
+            return rest
+        if kind == b'-':
+            raise CacheError(rest.decode())
+        if kind == b':':
+            return int(rest)
+        if kind == b'$':
+            length = int(rest)
+            if length == -1:
+                return None
+            data = reader.read(length + 2)
+            return data[:-2]
+        if kind == b'*':
+            count = int(rest)
+            return None if count == -1 else [self._read_reply(reader) for _ in range(count)]
+        raise CacheError(f'Unexpected reply: {line!r}')
+
+    def _get(self, key):
+        return self._send(b'GET', self.prefix + key)
+
+    def _set(self, key, value, ttl):
+        self._send(b'SET', self.prefix + key, value, b'PX', str(int(ttl * 1000)))
+
+    def _delete(self, keys):
+        self._send(b'DEL', *[self.prefix + key for key in keys])
+
+
+def create_cache(url, ttl, max_entries):
+    """Build the cache named by ``url``: memory://, redis://host:port/db or none."""
+    scheme = url.split('://', 1)[0]
+    if scheme == 'none':
+        return NullCache(ttl)
+    if scheme == 'memory':
+        return LRUCache(ttl, max_entries)
+    if scheme == 'redis':
+        return RedisCache(url, ttl)
+    raise ValueError(f'Unsupported CACHE_URL: {url}')
+
+
+def task_cache_key(task_id):
+    return f'tasks:item:{task_id}'
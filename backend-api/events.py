@@ -0,0 +1,226 @@
+"""Fan-out of task change events to Server-Sent Event streams.
+
+Write handlers record each change in the task_events table (see
+queries.task_event_statements) and, on Postgres, NOTIFY the task_events
+channel. Each process runs one EventBroadcaster thread. It LISTENs on a
+single dedicated connection and, when woken, reads new events with one
+query and hands the formatted messages to every subscribed stream. Without
+LISTEN (SQLite, or DB_PGBOUNCER without TASK_EVENTS_LISTEN_URL) it polls
+the table instead.
+
+Event ids are task_events ids, so a client reconnecting with
+``Last-Event-ID`` gets every retained event it missed. If that id has
+already been pruned, the stream sends a ``reset`` event telling the client
+to reload.
+"""
+import asyncio
+import os
+import queue
+import select
+import threading
+import time
+from sqlalchemy import create_engine, func
+from sqlalchemy import select as select_statement
+from sqlalchemy.pool import NullPool
+from database import DB_PGBOUNCER
+from models import TaskEvent
+from queries import EVENTS_CHANNEL
+
+# Direct Postgres URL to LISTEN on when DATABASE_URL goes through PgBouncer,
+# which can't hold a LISTEN in transaction pooling mode
+EVENTS_LISTEN_URL = os.environ.get('TASK_EVENTS_LISTEN_URL')
+# How often to read the table when not listening; with LISTEN, a safety net
+EVENTS_POLL_SECONDS = float(os.environ.get('TASK_EVENTS_POLL_SECONDS', 2))
+# Comment line sent on idle streams so proxies don't time them out
+EVENTS_HEARTBEAT_SECONDS = float(os.environ.get('TASK_EVENTS_HEARTBEAT_SECONDS', 15))
+# Streams end after this long; EventSource reconnects with Last-Event-ID,
+# so sync workers are handed back regularly
+EVENTS_STREAM_SECONDS = float(os.environ.get('TASK_EVENTS_STREAM_SECONDS', 300))
+# Events read per query while catching up
+EVENTS_BATCH_SIZE = 500
+# Client reconnection delay, in milliseconds
+EVENTS_RETRY_MS = 3000
+
+
+def parse_last_event_id(value):
+    """Parse a Last-Event-ID header or query parameter; None if absent."""
+    if not value:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError(f'Invalid value for Last-Event-ID: {value}')
+
+
+def format_event(event_id, event_type, data):
+    return f'id: {event_id}\nevent: {event_type}\ndata: {data}\n\n'
+
+
+class Subscription:
+    def __init__(self, broadcaster, deliver, position):
+        self.broadcaster = broadcaster
+        self.deliver = deliver
+        self.position = position  # id of the last event delivered
+
+    def close(self):
+        self.broadcaster.unsubscribe(self)
+
+
+class EventBroadcaster:
+    """Reads new task events once per wake-up and delivers them to every subscriber."""
+
+    def __init__(self, engine, listen_url=None, poll_seconds=EVENTS_POLL_SECONDS):
+        self.engine = engine
+        self.listen_url = listen_url
+        self.poll_seconds = poll_seconds
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._wake_read, self._wake_write = os.pipe()
+        self.listening = False
+
+    def subscribe(self, deliver, last_event_id=None):
+        """Call ``deliver(text)`` from the broadcaster thread with each batch of messages.
+
+        Starts after ``last_event_id`` if given, otherwise with the next
+        event written.
+        """
+        if last_event_id is None:
+            with self.engine.connect() as connection:
+                last_event_id = connection.execute(
+                    select_statement(func.coalesce(func.max(TaskEvent.id), 0))
+                ).scalar()
+        subscription = Subscription(self, deliver, last_event_id)
+        with self._lock:
+            self._subscribers.add(subscription)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='task-events', daemon=True)
+                self._thread.start()
+        self.wake()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def wake(self):
+        os.write(self._wake_write, b'.')
+
+    def stream(self, last_event_id=None, max_seconds=EVENTS_STREAM_SECONDS):
+        """Blocking generator of SSE text, for WSGI responses."""
+        messages = queue.Queue()
+        subscription = self.subscribe(messages.put, last_event_id)
+        deadline = time.monotonic() + max_seconds
+        try:
+            yield f'retry: {EVENTS_RETRY_MS}\n\n'
+            while (remaining := deadline - time.monotonic()) > 0:
+                try:
+                    yield messages.get(timeout=min(remaining, EVENTS_HEARTBEAT_SECONDS))
+                except queue.Empty:
+                    yield ': keep-alive\n\n'
+        finally:
+            subscription.close()
+
+    async def stream_async(self, last_event_id=None, max_seconds=EVENTS_STREAM_SECONDS):
+        """Async generator of SSE text, for ASGI responses."""
+        loop = asyncio.get_running_loop()
+        messages = asyncio.Queue()
+        subscription = await loop.run_in_executor(
+            None, self.subscribe,
+            lambda text: loop.call_soon_threadsafe(messages.put_nowait, text), last_event_id
+        )
+        deadline = loop.time() + max_seconds
+        try:
+            yield f'retry: {EVENTS_RETRY_MS}\n\n'
+            while (remaining := deadline - loop.time()) > 0:
+                try:
+                    yield await asyncio.wait_for(messages.get(), min(remaining, EVENTS_HEARTBEAT_SECONDS))
+                except asyncio.TimeoutError:
+                    yield ': keep-alive\n\n'
+        finally:
+            subscription.close()
+
+    def _listen_url(self):
+        if self.listen_url:
+            return self.listen_url
+        if self.engine.dialect.name == 'postgresql' and not DB_PGBOUNCER:
+            return self.engine.url
+        return None
+
+    def _listen(self):
+        """Open the LISTEN connection, or return None to poll instead."""
+        url = self._listen_url()
+        if url is None:
+            return None
+        try:
+            connection = create_engine(url, poolclass=NullPool).raw_connection()
+            driver_connection = connection.driver_connection
+            driver_connection.autocommit = True
+            with driver_connection.cursor() as cursor:
+                cursor.execute(f'LISTEN {EVENTS_CHANNEL}')
+        except Exception as e:
+            print(f"Task events LISTEN failed, polling instead: {e}")
+            return None
+        return connection
+
+    def _run(self):
+        listener = self._listen()
+        last_listen_attempt = time.monotonic()
+        while True:
+            self.listening = listener is not None
+            watched = [self._wake_read]
+            if listener is not None:
+                watched.append(listener.driver_connection)
+            # Notifications make polling a rare safety net while listening
+            timeout = self.poll_seconds if listener is None else max(self.poll_seconds, 30)
+            ready, _, _ = select.select(watched, [], [], timeout)
+            if self._wake_read in ready:
+                os.read(self._wake_read, 4096)
+            if listener is not None and listener.driver_connection in ready:
+                try:
+                    listener.driver_connection.poll()
+                    listener.driver_connection.notifies.clear()
+                except Exception as e:
+                    print(f"Task events LISTEN connection lost: {e}")
+                    listener.invalidate()
+                    listener = None
+            if listener is None and time.monotonic() - last_listen_attempt > 30:
+                listener = self._listen()
+                last_listen_attempt = time.monotonic()
+            try:
+                self._dispatch()
+            except Exception as e:
+                print(f"Task events dispatch failed: {e}")
+
+    def _dispatch(self):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        if not subscribers:
+            return
+        position = min(subscription.position for subscription in subscribers)
+        with self.engine.connect() as connection:
+            oldest = connection.execute(select_statement(func.min(TaskEvent.id))).scalar()
+            while True:
+                rows = connection.execute(
+                    select_statement(TaskEvent.id, TaskEvent.type, TaskEvent.data)
+                    .where(TaskEvent.id > position)
+                    .order_by(TaskEvent.id)
+                    .limit(EVENTS_BATCH_SIZE)
+                ).all()
+                if not rows:
+                    break
+                # Format each event once, however many streams receive it
+                messages = [(row.id, format_event(row.id, row.type, row.data)) for row in rows]
+                for subscription in subscribers:
+                    if oldest is not None and subscription.position < oldest - 1:
+                        # Events after its Last-Event-ID were pruned
+                        subscription.deliver(format_event(rows[-1].id, 'reset', '{}'))
+                        subscription.position = rows[-1].id
+                        continue
+                    text = ''.join(message for event_id, message in messages if event_id > subscription.position)
+                    if text:
+                        subscription.deliver(text)
+                        subscription.position = rows[-1].id
+                position = rows[-1].id
+                if len(rows) < EVENTS_BATCH_SIZE:
+                    break
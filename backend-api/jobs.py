@@ -0,0 +1,461 @@
+"""Background jobs for bulk task operations.
+
+Imports, exports and purges of many tasks can run for longer than a
+request may hold a worker, so POST /api/jobs queues them instead and
+clients poll GET /api/jobs/<id> for status and progress.
+
+Jobs are rows in the jobs table. Runners are threads: JOBS_WORKER_THREADS
+per API worker process, plus any number of standalone ``python jobs.py``
+processes (``SERVER_MODE=worker``). Each claims the oldest due job with
+SELECT ... FOR UPDATE SKIP LOCKED, so no job runs twice and runners never
+wait on each other's locks; throughput grows with the number of runners.
+
+A running job's heartbeat is refreshed every third of JOBS_LEASE_SECONDS by
+a thread of its own, however long a batch takes, and again whenever the job
+records progress. One whose heartbeat is older than JOBS_LEASE_SECONDS lost its runner (the
+process was killed or restarted) and is claimed again. A failed attempt is
+retried after JOBS_RETRY_BACKOFF_SECONDS, doubling with every attempt,
+until the job has made JOBS_MAX_ATTEMPTS attempts.
+
+Job types and their payloads:
+
+- ``import``: ``{"tasks": [{"title": ...}, ...]}`` creates the tasks in
+  batches of JOBS_BATCH_SIZE. Each batch commits together with the job's
+  progress, so a retry carries on after the last committed batch.
+- ``purge_completed``: ``{"updated_before": "2024-01-01T00:00"}`` (optional)
+  deletes completed tasks, in batches.
+- ``export``: ``{"filters": {"priority": "high", ...}}`` (the list filters,
+  optional) writes the matching tasks as gzip-compressed NDJSON, served by
+  GET /api/jobs/<id>/output.
+"""
+import json
+import os
+import random
+import signal
+import socket
+import threading
+import time
+import uuid
+import zlib
+from datetime import datetime, timedelta
+from sqlalchemy import and_, delete, func, insert, or_, select, tuple_, update
+from sqlalchemy.orm import sessionmaker
+import metrics
+from models import Job, JOB_COLUMNS, Task, task_to_dict, tasks_to_dicts
+from queries import (
+    EXPORT_BATCH_SIZE, batch_create_rows, export_statement, filter_tasks, parse_datetime,
+    task_write_statements, validate_task_fields
+)
+
+# Runner threads per API worker process; 0 leaves jobs to standalone workers
+JOBS_WORKER_THREADS = int(os.environ.get('JOBS_WORKER_THREADS', 1))
+# How often idle runners look for due jobs (submissions wake local runners at once)
+JOBS_POLL_SECONDS = float(os.environ.get('JOBS_POLL_SECONDS', 1))
+# A running job whose heartbeat is older than this is claimed again
+JOBS_LEASE_SECONDS = float(os.environ.get('JOBS_LEASE_SECONDS', 120))
+JOBS_MAX_ATTEMPTS = int(os.environ.get('JOBS_MAX_ATTEMPTS', 3))
+JOBS_RETRY_BACKOFF_SECONDS = float(os.environ.get('JOBS_RETRY_BACKOFF_SECONDS', 5))
+JOBS_MAX_BACKOFF_SECONDS = 600
+# Tasks written or deleted per transaction
+JOBS_BATCH_SIZE = int(os.environ.get('JOBS_BATCH_SIZE', 500))
+# Largest number of tasks one import job accepts
+JOBS_MAX_IMPORT_TASKS = int(os.environ.get('JOBS_MAX_IMPORT_TASKS', 100000))
+
+EXPORT_FILTERS = ('completed', 'priority', 'created_after', 'created_before')
+
+
+class JobError(Exception):
+    """A failure that retrying won't fix; the job fails without further attempts."""
+
+
+class LeaseLost(Exception):
+    """Another runner claimed the job after this one's lease ran out."""
+
+
+def retry_delay(attempts):
+    """Seconds to wait before the next attempt after ``attempts`` failed ones.
+
+    Doubles with every attempt, with jitter so jobs that failed together
+    (say, during a database outage) don't all retry at the same moment.
+    """
+    delay = min(JOBS_RETRY_BACKOFF_SECONDS * 2 ** (attempts - 1), JOBS_MAX_BACKOFF_SECONDS)
+    return delay * random.uniform(0.5, 1)
+
+
+def record_task_changes(session, events):
+    """Bump the tasks change counter and add change events, as commit_task_write does."""
+    for statement in task_write_statements(events, session.get_bind().dialect.name):
+        session.execute(statement)
+
+
+def validate_import(payload):
+    tasks = payload.get('tasks')
+    if not isinstance(tasks, list) or not tasks:
+        raise ValueError('payload.tasks must be a non-empty list')
+    if len(tasks) > JOBS_MAX_IMPORT_TASKS:
+        raise ValueError(f'At most {JOBS_MAX_IMPORT_TASKS} tasks per import')
+    values = []
+    for index, task in enumerate(tasks):
+        try:
+            if not isinstance(task, dict):
+                raise ValueError('Task must be an object')
+            values.append(validate_task_fields(task, creating=True))
+        except ValueError as e:
+            raise ValueError(f'tasks[{index}]: {e}')
+    return {'tasks': values}
+
+
+def run_import(context):
+    tasks = context.payload['tasks']
+    table = Task.__table__
+    for start in range(context.job.progress, len(tasks), JOBS_BATCH_SIZE):
+        batch = tasks[start:start + JOBS_BATCH_SIZE]
+        created = context.session.execute(
+            insert(table).returning(*table.c, sort_by_parameter_order=True),
+            batch_create_rows([(None, values) for values in batch], datetime.utcnow())
+        )
+        record_task_changes(context.session, [('created', task_to_dict(row)) for row in created])
+        context.commit(start + len(batch), len(tasks))
+    return {'created': len(tasks)}
+
+
+def purge_condition(payload):
+    condition = Task.completed.is_(True)
+    if 'updated_before' in payload:
+        condition = and_(condition, Task.updated_at < parse_datetime(payload['updated_before'], 'updated_before'))
+    return condition
+
+
+def validate_purge(payload):
+    updated_before = payload.get('updated_before')
+    if updated_before is None:
+        return {}
+    if not isinstance(updated_before, str):
+        raise ValueError('updated_before must be an ISO 8601 string')
+    purge_condition({'updated_before': updated_before})
+    return {'updated_before': updated_before}
+
+
+def run_purge(context):
+    table = Task.__table__
+    condition = purge_condition(context.payload)
+    deleted = context.job.progress
+    remaining = context.session.execute(select(func.count()).where(condition)).scalar()
+    context.commit(deleted, deleted + remaining)
+    while True:
+        batch = select(table.c.id).where(condition).limit(JOBS_BATCH_SIZE).scalar_subquery()
+        rows = context.session.execute(delete(table).where(table.c.id.in_(batch)).returning(*table.c)).all()
+        if not rows:
+            break
+        record_task_changes(context.session, [('deleted', task_to_dict(row)) for row in rows])
+        deleted += len(rows)
+        context.commit(deleted)
+        context.tasks_changed([row.id for row in rows])
+    return {'deleted': deleted}
+
+
+def validate_export(payload):
+    filters = payload.get('filters') or {}
+    if not isinstance(filters, dict):
+        raise ValueError('payload.filters must be an object')
+    unknown = set(filters) - set(EXPORT_FILTERS)
+    if unknown:
+        raise ValueError(f'Unknown filters: {", ".join(sorted(unknown))}')
+    # JSON true/false become the query string spelling the filters parse
+    filters = {name: str(value).lower() if isinstance(value, bool) else str(value) for name, value in filters.items()}
+    filter_tasks(select(Task.id), filters)
+    return {'filters': filters}
+
+
+def run_export(context):
+    filters = context.payload['filters']
+    total = context.session.execute(filter_tasks(select(func.count(Task.id)), filters)).scalar()
+    # wbits=31 writes a gzip header and trailer
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    chunks, exported, after = [], 0, None
+    while True:
+        # Keyset pages, each read in a short transaction committed with the
+        # progress, rather than one transaction open for the whole export
+        statement = export_statement(filters).limit(EXPORT_BATCH_SIZE)
+        if after is not None:
+            statement = statement.where(tuple_(Task.created_at, Task.id) > after)
+        rows = context.session.execute(statement).all()
+        if not rows:
+            break
+        after = (rows[-1].created_at, rows[-1].id)
+        lines = ''.join(json.dumps(task, separators=(',', ':')) + '\n' for task in tasks_to_dicts(rows))
+        chunks.append(compressor.compress(lines.encode()))
+        exported += len(rows)
+        context.commit(exported, max(total, exported))
+    chunks.append(compressor.flush())
+    context.output = b''.join(chunks)
+    return {'exported': exported, 'bytes': len(context.output)}
+
+
+# name: (validate payload at submission, run)
+JOB_TYPES = {
+    'import': (validate_import, run_import),
+    'purge_completed': (validate_purge, run_purge),
+    'export': (validate_export, run_export)
+}
+
+
+def validate_job(job_type, payload):
+    """Check a submitted job, returning the payload to store; raises ValueError."""
+    if job_type not in JOB_TYPES:
+        raise ValueError(f'Invalid job type: {job_type}')
+    if not isinstance(payload, dict):
+        raise ValueError('payload must be an object')
+    validate, _ = JOB_TYPES[job_type]
+    return validate(payload)
+
+
+def enqueue(session, job_type, payload, max_attempts=JOBS_MAX_ATTEMPTS):
+    """Add a job to ``session``'s transaction, returning its JOB_COLUMNS row.
+
+    ``payload`` must already have passed validate_job. The job becomes
+    visible to runners when the caller commits.
+    """
+    jobs = Job.__table__
+    now = datetime.utcnow()
+    return session.execute(
+        insert(jobs).values(
+            id=uuid.uuid4(), type=job_type, status='queued', payload=json.dumps(payload, separators=(',', ':')),
+            progress=0, attempts=0, max_attempts=max_attempts, run_after=now, created_at=now
+        ).returning(*JOB_COLUMNS)
+    ).first()
+
+
+class JobContext:
+    """A claimed job as its handler sees it.
+
+    Handlers write through ``session`` (on the primary) and call commit()
+    to commit their writes together with the job's progress.
+    """
+
+    def __init__(self, runner, job):
+        self.runner = runner
+        self.job = job
+        self.payload = json.loads(job.payload)
+        self.session = runner.Session()
+        self.output = None
+
+    def _update(self):
+        jobs = Job.__table__
+        return update(jobs).where(jobs.c.id == self.job.id, jobs.c.locked_by == self.job.locked_by)
+
+    def commit(self, progress, total=None):
+        """Record ``progress`` and commit it with the handler's pending writes."""
+        values = {'progress': progress, 'heartbeat_at': datetime.utcnow()}
+        if total is not None:
+            values['total'] = total
+        if self.session.execute(self._update().values(**values)).rowcount != 1:
+            raise LeaseLost(self.job.id)
+        self.session.commit()
+
+    def keep_alive(self, interval, stop):
+        """Refresh the heartbeat every ``interval`` seconds until ``stop`` is set.
+
+        Runs on its own thread and connection, so a handler that spends
+        longer than the lease on one batch keeps its job.
+        """
+        while not stop.wait(interval):
+            try:
+                with self.runner.engine.begin() as connection:
+                    if connection.execute(self._update().values(heartbeat_at=datetime.utcnow())).rowcount != 1:
+                        # Another runner has the job; the handler's next commit finds out
+                        return
+            except Exception as e:
+                print(f"Job {self.job.id} heartbeat failed: {e}")
+
+    def tasks_changed(self, task_ids):
+        """Report committed changes to tasks, so cached copies are dropped."""
+        if self.runner.on_tasks_changed is not None:
+            self.runner.on_tasks_changed(*task_ids)
+
+    def succeed(self, result):
+        now = datetime.utcnow()
+        values = {'status': 'succeeded', 'result': json.dumps(result), 'error': None,
+                  'finished_at': now, 'heartbeat_at': now}
+        if self.output is not None:
+            values['output'] = self.output
+        if self.session.execute(self._update().values(**values)).rowcount != 1:
+            raise LeaseLost(self.job.id)
+        self.session.commit()
+        return 'succeeded'
+
+    def fail(self, error):
+        """Queue a retry after a backoff, or fail the job for good; returns which."""
+        now = datetime.utcnow()
+        values = {'error': str(error) or type(error).__name__, 'heartbeat_at': now}
+        if isinstance(error, JobError) or self.job.attempts >= self.job.max_attempts:
+            outcome = 'failed'
+            values.update(status='failed', finished_at=now)
+        else:
+            outcome = 'retried'
+            values.update(status='queued', run_after=now + timedelta(seconds=retry_delay(self.job.attempts)))
+        with self.runner.engine.begin() as connection:
+            if connection.execute(self._update().values(**values)).rowcount != 1:
+                raise LeaseLost(self.job.id)
+        return outcome
+
+
+class JobRunner:
+    """Claims and runs jobs on ``threads`` daemon threads.
+
+    ``on_tasks_changed(*task_ids)`` is called after a job commits changes
+    to existing tasks, to invalidate cached copies.
+    """
+
+    def __init__(self, engine, threads=JOBS_WORKER_THREADS, poll_seconds=JOBS_POLL_SECONDS,
+                 lease_seconds=JOBS_LEASE_SECONDS, on_tasks_changed=None):
+        self.engine = engine
+        self.Session = sessionmaker(bind=engine)
+        self.threads = threads
+        self.poll_seconds = poll_seconds
+        self.lease_seconds = lease_seconds
+        self.on_tasks_changed = on_tasks_changed
+        self.name = f'{socket.gethostname()}:{os.getpid()}'
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._threads = []
+        self._lock = threading.Lock()
+        self._running = 0
+        self._outcomes = {'succeeded': 0, 'retried': 0, 'failed': 0, 'lost': 0}
+
+    def start(self):
+        if self._threads:
+            return
+        for index in range(self.threads):
+            thread = threading.Thread(target=self._loop, name=f'job-runner-{index}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout=None):
+        """Stop claiming jobs and wait for the current ones to finish."""
+        self._stopping.set()
+        self._wake.set()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def wake(self):
+        """Look for jobs now rather than at the next poll."""
+        self._wake.set()
+
+    def _loop(self):
+        while not self._stopping.is_set():
+            try:
+                ran = self.run_next()
+            except Exception as e:
+                # Typically the database being unreachable; try again after a poll
+                print(f"Job runner error: {e}")
+                ran = False
+            if not ran:
+                self._wake.wait(self.poll_seconds)
+                self._wake.clear()
+
+    def claimable(self, now):
+        """Due queued jobs, and running jobs whose lease has run out."""
+        jobs = Job.__table__
+        return or_(
+            and_(jobs.c.status == 'queued', jobs.c.run_after <= now),
+            and_(jobs.c.status == 'running', jobs.c.heartbeat_at < now - timedelta(seconds=self.lease_seconds))
+        )
+
+    def claim(self):
+        """Take the oldest claimable job for this runner, or return None.
+
+        FOR UPDATE SKIP LOCKED passes over rows another runner is claiming
+        rather than waiting for it. SQLite ignores the clause, so the UPDATE
+        re-checks the job is still claimable and only one runner can win.
+        """
+        jobs = Job.__table__
+        now = datetime.utcnow()
+        with self.engine.begin() as connection:
+            job_id = connection.execute(
+                select(jobs.c.id).where(self.claimable(now)).order_by(jobs.c.run_after).limit(1)
+                .with_for_update(skip_locked=True)
+            ).scalar()
+            if job_id is None:
+                return None
+            return connection.execute(
+                update(jobs).where(jobs.c.id == job_id, self.claimable(now)).values(
+                    status='running', attempts=jobs.c.attempts + 1, heartbeat_at=now,
+                    locked_by=f'{self.name}:{uuid.uuid4().hex[:12]}',
+                    started_at=func.coalesce(jobs.c.started_at, now)
+                ).returning(*jobs.c)
+            ).first()
+
+    def run_next(self):
+        """Claim and run one job; returns False if none was due."""
+        job = self.claim()
+        if job is None:
+            return False
+        with self._lock:
+            self._running += 1
+        started = time.perf_counter()
+        context = JobContext(self, job)
+        stop_heartbeat = threading.Event()
+        heartbeat = threading.Thread(target=context.keep_alive, args=(self.lease_seconds / 3, stop_heartbeat),
+                                     name=f'job-heartbeat-{job.id}', daemon=True)
+        heartbeat.start()
+        try:
+            _, run = JOB_TYPES.get(job.type, (None, None))
+            if run is None:
+                raise JobError(f'Unknown job type: {job.type}')
+            outcome = context.succeed(run(context))
+        except LeaseLost:
+            context.session.rollback()
+            outcome = 'lost'
+        except Exception as e:
+            context.session.rollback()
+            try:
+                outcome = context.fail(e)
+            except LeaseLost:
+                outcome = 'lost'
+        finally:
+            stop_heartbeat.set()
+            heartbeat.join()
+            context.session.close()
+            with self._lock:
+                self._running -= 1
+        with self._lock:
+            self._outcomes[outcome] += 1
+        metrics.observe_job(job.type, outcome, time.perf_counter() - started)
+        return True
+
+    def run_pending(self):
+        """Run due jobs on the calling thread until none is left; returns how many ran."""
+        count = 0
+        while self.run_next():
+            count += 1
+        return count
+
+    def stats(self):
+        with self._lock:
+            return {'threads': len(self._threads), 'running': self._running, **self._outcomes}
+
+
+def main():
+    """Run jobs in this process until SIGTERM or SIGINT (``SERVER_MODE=worker``)."""
+    from cache import create_cache, task_cache_key
+    from database import engine, init_db
+
+    init_db()
+    # Only a shared cache (Redis) holds entries the API workers read
+    cache = create_cache(os.environ.get('CACHE_URL', 'memory://'), ttl=0, max_entries=1)
+    runner = JobRunner(
+        engine, threads=max(JOBS_WORKER_THREADS, 1),
+        on_tasks_changed=lambda *task_ids: cache.delete(*[task_cache_key(task_id) for task_id in task_ids])
+    )
+    stopping = threading.Event()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, lambda *_: stopping.set())
+    runner.start()
+    print(f"Job worker {runner.name} running {runner.threads} threads")
+    stopping.wait()
+    runner.stop()
+
+
+if __name__ == '__main__':
+    main()
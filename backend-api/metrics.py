@@ -0,0 +1,192 @@
+"""Prometheus metrics for the backend API.
+
+Requests are timed per route template, method and status. Each request
+also reports the SQL statements it ran, the time they took and how many
+task rows it serialized. Statement timing hooks every SQLAlchemy engine,
+so the sync app, the async app and the event broadcaster are all covered.
+
+With several gunicorn or uvicorn workers, set PROMETHEUS_MULTIPROC_DIR
+to an empty directory the workers share (start.sh and gunicorn.conf.py
+do). Each worker then writes its values to files there, and /metrics
+reports the sum over all workers, whichever one serves the scrape.
+"""
+import os
+import time
+from contextvars import ContextVar
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+)
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import QueuePool
+
+MULTIPROCESS = bool(os.environ.get('PROMETHEUS_MULTIPROC_DIR'))
+# Label for requests that matched no route, so unknown paths can't add series
+UNMATCHED_ROUTE = 'unmatched'
+
+registry = CollectorRegistry()
+
+REQUEST_DURATION = Histogram(
+    'http_request_duration_seconds', 'Time until the response starts, by route',
+    ['method', 'route', 'status'], registry=registry
+)
+REQUEST_QUERIES = Histogram(
+    'http_request_db_queries', 'SQL statements run per request',
+    ['route'], buckets=(0, 1, 2, 3, 4, 6, 8, 12, 20, 50), registry=registry
+)
+REQUEST_QUERY_SECONDS = Histogram(
+    'http_request_db_seconds', 'Time spent in SQL statements per request',
+    ['route'], registry=registry
+)
+QUERY_DURATION = Histogram(
+    'db_query_duration_seconds', 'SQL statement execution time',
+    buckets=(.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5), registry=registry
+)
+ROWS_SERIALIZED = Counter(
+    'tasks_serialized', 'Task rows converted to JSON-ready dicts',
+    ['route'], registry=registry
+)
+POOL_CONNECTIONS = Gauge(
+    'db_pool_connections', 'Primary pool connections by state, summed over live workers',
+    ['state'], multiprocess_mode='livesum', registry=registry
+)
+POOL_CHECKOUT_WAIT = Histogram(
+    'db_pool_checkout_wait_seconds', 'Time spent waiting for a pooled connection',
+    buckets=(.0001, .001, .005, .01, .05, .1, .5, 1, 5, 30), registry=registry
+)
+POOL_CHECKOUT_TIMEOUTS = Counter(
+    'db_pool_checkout_timeouts', 'Checkouts that gave up waiting for a connection',
+    registry=registry
+)
+JOBS_FINISHED = Counter(
+    'jobs_finished', 'Background job attempts by type and outcome (succeeded, retried, failed)',
+    ['type', 'outcome'], registry=registry
+)
+JOB_DURATION = Histogram(
+    'job_duration_seconds', 'Time taken by one background job attempt',
+    ['type'], buckets=(.1, .5, 1, 5, 10, 30, 60, 120, 300, 600, 1800), registry=registry
+)
+
+
+class RequestStats:
+    """Work done while serving one request."""
+    __slots__ = ('queries', 'query_seconds', 'rows')
+
+    def __init__(self):
+        self.queries = 0
+        self.query_seconds = 0.0
+        self.rows = 0
+
+
+_request_stats = ContextVar('request_stats', default=None)
+
+
+def begin_request():
+    """Start collecting RequestStats for the request in the current context."""
+    stats = RequestStats()
+    _request_stats.set(stats)
+    return stats
+
+
+def observe_request(method, route, status, seconds):
+    REQUEST_DURATION.labels(method, route, status).observe(seconds)
+
+
+def end_request(stats, route):
+    """Report a finished request's statement and serialization counts."""
+    REQUEST_QUERIES.labels(route).observe(stats.queries)
+    REQUEST_QUERY_SECONDS.labels(route).observe(stats.query_seconds)
+    if stats.rows:
+        ROWS_SERIALIZED.labels(route).inc(stats.rows)
+
+
+def count_serialized(rows):
+    """Add ``rows`` task rows to the current request's serialized count."""
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.rows += rows
+
+
+def observe_checkout(seconds, timed_out=False):
+    POOL_CHECKOUT_WAIT.observe(seconds)
+    if timed_out:
+        POOL_CHECKOUT_TIMEOUTS.inc()
+
+
+def observe_job(job_type, outcome, seconds):
+    JOBS_FINISHED.labels(job_type, outcome).inc()
+    JOB_DURATION.labels(job_type).observe(seconds)
+
+
+def update_pool_gauges(pool):
+    """Sample a pool's occupancy into the pool gauges.
+
+    Pools without a fixed size (NullPool, SQLite's defaults) are skipped.
+    """
+    if not isinstance(pool, QueuePool):
+        return
+    POOL_CONNECTIONS.labels('checked_out').set(pool.checkedout())
+    POOL_CONNECTIONS.labels('checked_in').set(pool.checkedin())
+    POOL_CONNECTIONS.labels('overflow').set(max(pool.overflow(), 0))
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _start_query_timer(connection, cursor, statement, parameters, context, executemany):
+    context.metrics_started = time.perf_counter()
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _stop_query_timer(connection, cursor, statement, parameters, context, executemany):
+    seconds = time.perf_counter() - context.metrics_started
+    QUERY_DURATION.observe(seconds)
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.query_seconds += seconds
+
+
+def render():
+    """The /metrics response body and content type."""
+    if MULTIPROCESS:
+        # Read every worker's files rather than this process's registry
+        source = CollectorRegistry()
+        multiprocess.MultiProcessCollector(source)
+    else:
+        source = registry
+    return generate_latest(source), CONTENT_TYPE_LATEST
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording request metrics for a Starlette app.
+
+    Requests are labelled with the path of the matching entry in
+    ``routes``. After each request, ``pool``'s occupancy is sampled.
+    """
+
+    def __init__(self, app, routes, pool=None):
+        self.app = app
+        self.routes = {route.endpoint: route.path for route in routes}
+        self.pool = pool
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+        started = time.perf_counter()
+        stats = begin_request()
+
+        async def send_timed(message):
+            if message['type'] == 'http.response.start':
+                observe_request(scope['method'], self.route(scope), message['status'],
+                                time.perf_counter() - started)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_timed)
+        finally:
+            end_request(stats, self.route(scope))
+            if self.pool is not None:
+                update_pool_gauges(self.pool)
+
+    def route(self, scope):
+        # The router stores the matched endpoint in the shared scope
+        return self.routes.get(scope.get('endpoint'), UNMATCHED_ROUTE)
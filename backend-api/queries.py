@@ -0,0 +1,485 @@
+"""Request parsing and statement building shared by app.py and async_app.py.
+
+Nothing here touches a session, so the sync and asyncio apps run exactly
+the same SQL and return the same payloads.
+"""
+from collections import defaultdict
+from datetime import datetime
+import base64
+import itertools
+import json
+import os
+import re
+import uuid
+from sqlalchemy import and_, bindparam, case, delete, func, insert, or_, select, text, tuple_, update
+from models import (
+    TASK_COLUMNS, SEARCH_CONFIG, TableVersion, Task, TaskEvent, project_task_rows, search_vector,
+    tasks_to_dicts
+)
+
+# Pagination settings for GET /api/tasks
+DEFAULT_PAGE_SIZE = int(os.environ.get('TASKS_PAGE_SIZE', 50))
+MAX_PAGE_SIZE = int(os.environ.get('TASKS_MAX_PAGE_SIZE', 500))
+
+# Sortable columns; every sort is keyed on (column, id) so pages are stable
+SORT_COLUMNS = {
+    'created_at': Task.created_at,
+    'updated_at': Task.updated_at,
+}
+PRIORITIES = ('low', 'medium', 'high')
+
+# Rows fetched per server-side cursor round trip by the export endpoint
+EXPORT_BATCH_SIZE = int(os.environ.get('TASKS_EXPORT_BATCH_SIZE', 1000))
+
+# Largest number of operations accepted by POST /api/tasks/batch
+MAX_BATCH_SIZE = int(os.environ.get('TASKS_MAX_BATCH_SIZE', 1000))
+
+# Change feed: channel NOTIFYed after writes, number of events kept for
+# resuming streams, and how many event-writing commits per process go by
+# between prunes
+EVENTS_CHANNEL = 'task_events'
+EVENTS_RETENTION = int(os.environ.get('TASK_EVENTS_RETENTION', 10000))
+EVENTS_PRUNE_EVERY = 500
+_event_commits = itertools.count(1)
+
+
+def parse_bool(value, name):
+    """Parse a boolean query parameter."""
+    lowered = value.lower()
+    if lowered in ('true', '1', 'yes'):
+        return True
+    if lowered in ('false', '0', 'no'):
+        return False
+    raise ValueError(f'Invalid value for {name}: {value}')
+
+
+def parse_datetime(value, name):
+    """Parse an ISO 8601 query parameter."""
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f'Invalid value for {name}: {value}')
+
+
+def parse_task_id(task_id):
+    """Parse a task id from the URL, returning None if it isn't a UUID."""
+    try:
+        return uuid.UUID(task_id)
+    except ValueError:
+        return None
+
+
+def encode_cursor(sort, value, task_id):
+    """Build an opaque cursor pointing just past the given row."""
+    payload = json.dumps([sort, value.isoformat(), str(task_id)])
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+
+def decode_cursor(cursor, sort):
+    """Decode a cursor produced by encode_cursor for the same sort order."""
+    try:
+        cursor_sort, value, task_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        value = datetime.fromisoformat(value)
+        task_id = uuid.UUID(task_id)
+    except (ValueError, TypeError):
+        raise ValueError('Invalid cursor')
+    if cursor_sort != sort:
+        raise ValueError('Cursor does not match sort order')
+    return value, task_id
+
+
+def filter_tasks(query, args):
+    """Apply the completed/priority/created-at filters from the query string."""
+    if 'completed' in args:
+        query = query.filter(Task.completed == parse_bool(args['completed'], 'completed'))
+    if 'priority' in args:
+        priorities = args['priority'].split(',')
+        unknown = [p for p in priorities if p not in PRIORITIES]
+        if unknown:
+            raise ValueError(f'Invalid value for priority: {",".join(unknown)}')
+        query = query.filter(Task.priority.in_(priorities))
+    if 'created_after' in args:
+        query = query.filter(Task.created_at >= parse_datetime(args['created_after'], 'created_after'))
+    if 'created_before' in args:
+        query = query.filter(Task.created_at < parse_datetime(args['created_before'], 'created_before'))
+    return query
+
+
+def parse_limit(args):
+    """Page size from the ``limit`` query parameter, capped at MAX_PAGE_SIZE."""
+    try:
+        limit = int(args.get('limit', DEFAULT_PAGE_SIZE))
+    except ValueError:
+        limit = DEFAULT_PAGE_SIZE
+    if limit < 1:
+        raise ValueError('limit must be positive')
+    return min(limit, MAX_PAGE_SIZE)
+
+
+def parse_fields(args):
+    """Columns named by the comma-separated ``fields`` query parameter.
+
+    Returned in TASK_COLUMNS order, or None when ``fields`` is absent,
+    meaning every column.
+    """
+    if 'fields' not in args:
+        return None
+    names = set(args['fields'].split(','))
+    unknown = names - {column.key for column in TASK_COLUMNS}
+    if unknown or not args['fields']:
+        raise ValueError(f'Invalid value for fields: {",".join(sorted(unknown))}')
+    return tuple(column for column in TASK_COLUMNS if column.key in names)
+
+
+def with_columns(columns, *required):
+    """``columns`` followed by whichever of ``required`` it lacks."""
+    keys = {column.key for column in columns}
+    return tuple(columns) + tuple(column for column in required if column.key not in keys)
+
+
+def task_statement(task_id, columns=None):
+    """Select one task: ``columns`` (default all) plus what its validators need."""
+    if columns is None:
+        columns = TASK_COLUMNS
+    return select(*with_columns(columns, Task.version, Task.updated_at)).where(Task.id == task_id)
+
+
+class TaskPage:
+    """One keyset-paginated page of GET /api/tasks.
+
+    ``statement`` selects one row more than the page size; pass the rows it
+    returns to ``result`` to build the response payload. With ``fields``,
+    only those columns (plus the cursor's) are read from the database.
+    """
+
+    def __init__(self, args):
+        self.limit = parse_limit(args)
+        self.columns = parse_fields(args)
+
+        self.sort = args.get('sort', 'created_at')
+        descending = self.sort.startswith('-')
+        self.column = SORT_COLUMNS.get(self.sort.lstrip('-'))
+        if self.column is None:
+            raise ValueError(f'Invalid value for sort: {self.sort}')
+
+        if self.columns is None:
+            selected = TASK_COLUMNS
+        else:
+            selected = with_columns(self.columns, self.column, Task.id)
+        statement = filter_tasks(select(*selected), args)
+        if 'cursor' in args:
+            value, task_id = decode_cursor(args['cursor'], self.sort)
+            key = tuple_(self.column, Task.id)
+            statement = statement.filter(key < (value, task_id) if descending else key > (value, task_id))
+        if descending:
+            statement = statement.order_by(self.column.desc(), Task.id.desc())
+        else:
+            statement = statement.order_by(self.column.asc(), Task.id.asc())
+        # Fetch one extra row to learn whether another page follows
+        self.statement = statement.limit(self.limit + 1)
+
+    def result(self, tasks):
+        next_cursor = None
+        if len(tasks) > self.limit:
+            tasks = tasks[:self.limit]
+            last = tasks[-1]
+            next_cursor = encode_cursor(self.sort, getattr(last, self.column.key), last.id)
+        return {
+            'tasks': tasks_to_dicts(tasks) if self.columns is None else project_task_rows(tasks, self.columns),
+            'next_cursor': next_cursor
+        }
+
+
+class TaskSearch:
+    """One page of ranked results for GET /api/tasks/search.
+
+    On Postgres the query is parsed with websearch_to_tsquery, matched
+    against the GIN-indexed ``search_vector`` column and ranked with
+    ts_rank_cd. Other databases require every search word to appear in the
+    title or description (LIKE) and rank title matches above description
+    matches. Results are paged by offset, since rank is not a stable key.
+    """
+
+    def __init__(self, args, dialect_name):
+        query = args.get('q', '').strip()
+        if not query:
+            raise ValueError('q is required')
+        self.limit = parse_limit(args)
+        try:
+            self.offset = int(args.get('offset', 0))
+        except ValueError:
+            raise ValueError(f'Invalid value for offset: {args["offset"]}')
+        if self.offset < 0:
+            raise ValueError('offset must not be negative')
+
+        if dialect_name == 'postgresql':
+            tsquery = func.websearch_to_tsquery(SEARCH_CONFIG, query)
+            condition = search_vector.op('@@')(tsquery)
+            rank = func.ts_rank_cd(search_vector, tsquery)
+        else:
+            words = re.findall(r'\w+', query.lower())
+            if not words:
+                raise ValueError('q is required')
+            in_title = [Task.title.contains(word, autoescape=True) for word in words]
+            in_description = [Task.description.contains(word, autoescape=True) for word in words]
+            condition = and_(*[or_(title, description) for title, description in zip(in_title, in_description)])
+            rank = sum(
+                [case((match, 2), else_=0) for match in in_title]
+                + [case((match, 1), else_=0) for match in in_description]
+            )
+
+        rank = rank.label('rank')
+        self.statement = (
+            filter_tasks(select(*TASK_COLUMNS, rank), args)
+            .where(condition)
+            .order_by(rank.desc(), Task.created_at.desc(), Task.id)
+            .offset(self.offset)
+            .limit(self.limit + 1)
+        )
+
+    def result(self, rows):
+        rows = list(rows)
+        next_offset = None
+        if len(rows) > self.limit:
+            rows = rows[:self.limit]
+            next_offset = self.offset + self.limit
+        return {
+            'tasks': [
+                dict(task, rank=round(float(row.rank), 6))
+                for task, row in zip(tasks_to_dicts(row[:-1] for row in rows), rows)
+            ],
+            'next_offset': next_offset
+        }
+
+
+def export_statement(args):
+    """Every task matching the list filters, in a stable order."""
+    return filter_tasks(select(*TASK_COLUMNS), args).order_by(Task.created_at, Task.id)
+
+
+def stats_statement():
+    """Count tasks per (completed, priority) in a single GROUP BY."""
+    return select(Task.completed, Task.priority, func.count()) \
+        .group_by(Task.completed, Task.priority)
+
+
+def stats_result(rows):
+    """Fold the stats_statement rows into totals by completion and priority."""
+    stats = {
+        'total': 0,
+        'completed': 0,
+        'pending': 0,
+        'by_priority': {priority: 0 for priority in PRIORITIES}
+    }
+    for completed, priority, count in rows:
+        stats['total'] += count
+        stats['completed' if completed else 'pending'] += count
+        stats['by_priority'][priority] = stats['by_priority'].get(priority, 0) + count
+    return stats
+
+
+def tasks_version_statement():
+    """Select the tasks table's change counter and the time it last changed."""
+    versions = TableVersion.__table__
+    return select(versions.c.version, versions.c.updated_at) \
+        .where(versions.c.name == Task.__tablename__)
+
+
+def bump_tasks_version_statement():
+    """Increment the tasks change counter; run in the same transaction as the write."""
+    versions = TableVersion.__table__
+    return (
+        update(versions)
+        .where(versions.c.name == Task.__tablename__)
+        .values(version=versions.c.version + 1, updated_at=datetime.utcnow())
+    )
+
+
+def task_event_statements(events, dialect_name):
+    """Statements recording task change events; run in the write's transaction.
+
+    ``events`` are (type, task dict) pairs, with type ``created``,
+    ``updated`` or ``deleted``. On Postgres a NOTIFY, delivered when the
+    transaction commits, wakes the event broadcasters. Every
+    EVENTS_PRUNE_EVERY-th call also drops events beyond EVENTS_RETENTION.
+    """
+    now = datetime.utcnow()
+    statements = [insert(TaskEvent).values([
+        {
+            'task_id': uuid.UUID(task['id']), 'type': event_type, 'created_at': now,
+            'data': json.dumps(task, separators=(',', ':'), sort_keys=True)
+        }
+        for event_type, task in events
+    ])]
+    if next(_event_commits) % EVENTS_PRUNE_EVERY == 0:
+        newest = select(func.max(TaskEvent.id)).scalar_subquery()
+        statements.append(delete(TaskEvent).where(TaskEvent.id <= newest - EVENTS_RETENTION))
+    if dialect_name == 'postgresql':
+        statements.append(text(f'NOTIFY {EVENTS_CHANNEL}'))
+    return statements
+
+
+def task_write_statements(events, dialect_name):
+    """Statements that finish a task write: bump the change counter, then record ``events``.
+
+    The counter is bumped first. Its row lock then makes concurrent writers
+    insert their events, and so take event ids, one after another in the
+    order they commit. Were the events inserted first, a writer could
+    commit event N+1 while event N was still uncommitted, and streams that
+    had moved past N+1 would never see N.
+    """
+    statements = [bump_tasks_version_statement()]
+    if events:
+        statements.extend(task_event_statements(events, dialect_name))
+    return statements
+
+
+def batch_events(results, deleted):
+    """Change events for the successful operations in a batch's results.
+
+    ``deleted`` maps the id of each deleted task to the task as it was, so
+    deletes carry the whole task like every other ``deleted`` event.
+    """
+    events = []
+    for result in results:
+        if result['status'] == 201:
+            events.append(('created', result['task']))
+        elif result['status'] == 200:
+            if 'task' in result:
+                events.append(('updated', result['task']))
+            else:
+                events.append(('deleted', deleted[result['id']]))
+    return events
+
+
+def if_match_condition(if_match):
+    """Translate parsed If-Match ETags into a version condition for a write.
+
+    Returns None when the write is unconditional.
+    """
+    if not if_match or if_match.star_tag:
+        return None
+    # Weak tags count too: compressed responses carry the version as one
+    versions = [int(tag) for tag in if_match.as_set(include_weak=True) if tag.isdigit()]
+    return Task.__table__.c.version.in_(versions)
+
+
+def validate_task_fields(data, creating):
+    """Validate writable task fields, returning the column values to store."""
+    values = {}
+    if 'title' in data:
+        if not isinstance(data['title'], str) or not data['title'].strip():
+            raise ValueError('Title must be a non-empty string')
+        values['title'] = data['title']
+    elif creating:
+        raise ValueError('Title is required')
+    if 'description' in data:
+        if not isinstance(data['description'], str):
+            raise ValueError('Description must be a string')
+        values['description'] = data['description']
+    if 'priority' in data:
+        if data['priority'] not in PRIORITIES:
+            raise ValueError(f'Invalid value for priority: {data["priority"]}')
+        values['priority'] = data['priority']
+    if 'completed' in data:
+        if not isinstance(data['completed'], bool):
+            raise ValueError('Completed must be a boolean')
+        values['completed'] = data['completed']
+    return values
+
+
+def validate_batch(operations):
+    """Validate every batch operation before anything is written.
+
+    Returns (creates, updates, deletes) as lists of (index, payload) pairs,
+    or raises ValueError carrying the per-item errors.
+    """
+    creates, updates, deletes = [], [], []
+    errors = []
+    seen_ids = set()
+    for index, operation in enumerate(operations):
+        try:
+            if not isinstance(operation, dict):
+                raise ValueError('Operation must be an object')
+            op = operation.get('op')
+            if op == 'create':
+                creates.append((index, validate_task_fields(operation, creating=True)))
+                continue
+            if op not in ('update', 'delete'):
+                raise ValueError(f'Invalid op: {op}')
+            task_id = parse_task_id(str(operation.get('id')))
+            if task_id is None:
+                raise ValueError('A valid task id is required')
+            if task_id in seen_ids:
+                raise ValueError('Task id appears more than once in the batch')
+            seen_ids.add(task_id)
+            if op == 'update':
+                values = validate_task_fields(operation, creating=False)
+                if not values:
+                    raise ValueError('No fields to update')
+                updates.append((index, (task_id, values)))
+            else:
+                deletes.append((index, task_id))
+        except ValueError as e:
+            errors.append({'index': index, 'status': 400, 'error': str(e)})
+    if errors:
+        raise ValueError(errors)
+    return creates, updates, deletes
+
+
+def batch_create_rows(creates, now):
+    """Full row values for batch creates, in operation order."""
+    return [
+        {
+            'id': uuid.uuid4(),
+            'description': '',
+            'priority': 'medium',
+            'completed': False,
+            **values,
+            'created_at': now,
+            'updated_at': now
+        }
+        for _, values in creates
+    ]
+
+
+def batch_update_statements(updates, now):
+    """Plan batch updates using as few statements as possible.
+
+    Updates setting identical values share one ``UPDATE ... WHERE id IN``;
+    the rest are grouped by the columns they touch and sent as executemany.
+    Returns (statement, params) pairs, where params is None for a single
+    execution.
+    """
+    table = Task.__table__
+    ids_by_values = defaultdict(list)
+    for task_id, values in updates:
+        ids_by_values[tuple(sorted(values.items()))].append(task_id)
+
+    statements = []
+    params_by_columns = defaultdict(list)
+    for values, task_ids in ids_by_values.items():
+        if len(task_ids) > 1:
+            statements.append((
+                update(table).where(table.c.id.in_(task_ids))
+                .values(**dict(values), updated_at=now, version=table.c.version + 1),
+                None
+            ))
+        else:
+            columns = tuple(column for column, _ in values)
+            params = {f'v_{column}': value for column, value in values}
+            params['v_id'] = task_ids[0]
+            params_by_columns[columns].append(params)
+
+    for columns, params in params_by_columns.items():
+        statement = (
+            update(table)
+            .where(table.c.id == bindparam('v_id'))
+            .values(
+                **{column: bindparam(f'v_{column}') for column in columns},
+                updated_at=now,
+                version=table.c.version + 1
+            )
+        )
+        statements.append((statement, params))
+    return statements
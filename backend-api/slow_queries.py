@@ -0,0 +1,74 @@
+"""Capture of slow SQL statements, with their query plans.
+
+Every statement taking at least SLOW_QUERY_MS (0 turns capture off) is
+kept in a ring buffer of the last SLOW_QUERY_BUFFER_SIZE, shown by the
+admin endpoint. Statements run while serving a request of the sync app
+are explained after the request, on a connection of its own, so a plan
+never runs inside the request's transaction or holds up its response.
+Statements are kept without their parameters, though Postgres plans show
+the values they were planned for.
+"""
+import os
+import time
+from contextvars import ContextVar
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from profiling import RingBuffer
+
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', 500))
+SLOW_QUERY_BUFFER_SIZE = int(os.environ.get('SLOW_QUERY_BUFFER_SIZE', 50))
+
+# Statements EXPLAIN accepts; others (NOTIFY, DDL, ...) are kept without a plan
+EXPLAINABLE = ('select', 'insert', 'update', 'delete', 'with')
+
+
+class SlowQueryLog:
+    def __init__(self, threshold_ms=SLOW_QUERY_MS, buffer_size=SLOW_QUERY_BUFFER_SIZE):
+        self.threshold = threshold_ms / 1000
+        self.entries = RingBuffer(buffer_size)
+        self._pending = ContextVar('slow_queries', default=None)
+        event.listen(Engine, 'before_cursor_execute', self._start_timer)
+        event.listen(Engine, 'after_cursor_execute', self._check)
+
+    def begin_request(self):
+        """Hold slow statements of the current request for explain_pending()."""
+        self._pending.set([])
+
+    def explain_pending(self, engine):
+        """Record the current request's slow statements with their plans from ``engine``."""
+        pending = self._pending.get()
+        self._pending.set(None)
+        for entry, parameters, executemany in pending or ():
+            entry['plan'] = None if executemany else self._explain(engine, entry['statement'], parameters)
+            self.entries.append(entry)
+
+    def _start_timer(self, connection, cursor, statement, parameters, context, executemany):
+        context.slow_query_started = time.perf_counter()
+
+    def _check(self, connection, cursor, statement, parameters, context, executemany):
+        seconds = time.perf_counter() - context.slow_query_started
+        if not self.threshold or seconds < self.threshold or context.execution_options.get('explain'):
+            return
+        entry = {'statement': statement, 'duration_ms': round(seconds * 1000, 3),
+                 'database': connection.engine.url.render_as_string(hide_password=True)}
+        pending = self._pending.get()
+        if pending is None:
+            # Outside a sync request: no safe point to explain it
+            self.entries.append({**entry, 'plan': None})
+        else:
+            pending.append((entry, parameters, executemany))
+
+    @staticmethod
+    def _explain(engine, statement, parameters):
+        if not statement.lstrip().lower().startswith(EXPLAINABLE):
+            return None
+        prefix = 'EXPLAIN QUERY PLAN' if engine.dialect.name == 'sqlite' else 'EXPLAIN'
+        try:
+            with engine.connect() as connection:
+                rows = connection.exec_driver_sql(
+                    f'{prefix} {statement}', parameters, execution_options={'explain': True}
+                ).all()
+        except Exception as e:
+            return f'EXPLAIN failed: {e}'
+        # The plan text is the last column on both Postgres and SQLite
+        return '\n'.join(str(row[-1]) for row in rows)
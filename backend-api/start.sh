@@ -0,0 +1,25 @@
+#!/bin/sh
+# Start the backend API in the serving mode chosen by SERVER_MODE:
+#   sync  (default) - Flask app (app.py) under gunicorn threaded workers, so
+#                     open /api/tasks/events streams each hold a thread
+#                     rather than a whole worker
+#   async           - Starlette app (async_app.py) under uvicorn workers
+#   worker          - no HTTP server; runs background jobs (jobs.py)
+set -e
+
+WORKERS="${WEB_CONCURRENCY:-2}"
+PORT="${PORT:-5000}"
+
+if [ "${SERVER_MODE:-sync}" = "worker" ]; then
+    exec python jobs.py
+fi
+if [ "${SERVER_MODE:-sync}" = "async" ]; then
+    # Workers share Prometheus metric files here (gunicorn.conf.py does
+    # this for the sync mode)
+    export PROMETHEUS_MULTIPROC_DIR="${PROMETHEUS_MULTIPROC_DIR:-/tmp/prometheus}"
+    rm -rf "$PROMETHEUS_MULTIPROC_DIR"
+    mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+    exec uvicorn async_app:app --host 0.0.0.0 --port "$PORT" --workers "$WORKERS" --no-access-log
+fi
+exec gunicorn --config gunicorn.conf.py --bind "0.0.0.0:$PORT" --workers "$WORKERS" \
+    --worker-class gthread --threads "${GUNICORN_THREADS:-8}" --timeout 120 app:app
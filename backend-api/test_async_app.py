@@ -0,0 +1,171 @@
+import unittest
+import json
+import os
+import sys
+import tempfile
+
+# Run against a throwaway SQLite database instead of Postgres. If the sync
+# suite was imported first, the database module already points at its file.
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+os.environ.setdefault('DATABASE_URL', f'sqlite:///{os.path.join(tempfile.mkdtemp(), "tasks.db")}')
+sys.path.insert(0, BACKEND_DIR)
+
+from starlette.testclient import TestClient
+
+import async_app
+import metrics
+from database import db_session, init_db
+from models import Task
+
+
+class TestAsyncBackendAPI(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.client = TestClient(async_app.app)
+        cls.client.__enter__()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.client.__exit__(None, None, None)
+
+    def setUp(self):
+        """Clear tasks before each test"""
+        init_db()
+        db_session.query(Task).delete()
+        db_session.commit()
+        db_session.remove()
+
+    def create(self, title, **fields):
+        response = self.client.post('/api/tasks', json={'title': title, **fields})
+        self.assertEqual(response.status_code, 201)
+        return response.json()
+
+    def test_health_check(self):
+        """Test the async health check reports the database"""
+        data = self.client.get('/health').json()
+        self.assertEqual(data['database'], 'healthy')
+        self.assertEqual(data['server'], 'async')
+
+    def test_metrics_label_requests_by_route(self):
+        """Test the middleware records route templates and per-request SQL statements"""
+        task = self.create('Measured')
+        labels = {'method': 'GET', 'route': '/api/tasks/{task_id}', 'status': '200'}
+        route = {'route': '/api/tasks/{task_id}'}
+        sample = metrics.registry.get_sample_value
+        before = [sample('http_request_duration_seconds_count', labels) or 0,
+                  sample('http_request_db_queries_sum', route) or 0]
+
+        self.client.get(f'/api/tasks/{task["id"]}')
+
+        self.assertEqual(sample('http_request_duration_seconds_count', labels), before[0] + 1)
+        self.assertGreater(sample('http_request_db_queries_sum', route), before[1])
+        self.assertIn('http_request_duration_seconds_bucket', self.client.get('/metrics').text)
+
+    def test_create_get_update_delete(self):
+        """Test the single-task routes match the sync API"""
+        task = self.create('Async task', priority='high')
+        self.assertEqual(task['version'], 1)
+
+        response = self.client.get(f'/api/tasks/{task["id"]}')
+        self.assertEqual(response.json()['title'], 'Async task')
+        self.assertEqual(response.headers['etag'], '"1"')
+
+        response = self.client.get(f'/api/tasks/{task["id"]}', headers={'If-None-Match': '"1"'})
+        self.assertEqual(response.status_code, 304)
+        response = self.client.get(f'/api/tasks/{task["id"]}?fields=title,priority')
+        self.assertEqual(response.json(), {'title': 'Async task', 'priority': 'high'})
+
+        response = self.client.put(f'/api/tasks/{task["id"]}', json={'title': 'Renamed'},
+                                   headers={'If-Match': '"1"'})
+        self.assertEqual(response.json()['version'], 2)
+        response = self.client.put(f'/api/tasks/{task["id"]}', json={'title': 'Stale'},
+                                   headers={'If-Match': '"1"'})
+        self.assertEqual(response.status_code, 412)
+
+        response = self.client.post(f'/api/tasks/{task["id"]}/toggle')
+        self.assertTrue(response.json()['completed'])
+
+        response = self.client.delete(f'/api/tasks/{task["id"]}')
+        self.assertEqual(response.json()['task']['title'], 'Renamed')
+        self.assertEqual(self.client.get(f'/api/tasks/{task["id"]}').status_code, 404)
+        self.assertEqual(self.client.delete('/api/tasks/not-a-uuid').status_code, 404)
+
+    def test_list_paginates_and_revalidates(self):
+        """Test cursor pagination, filters and list ETags"""
+        for i in range(5):
+            self.create(f'Task {i}', priority='high' if i % 2 else 'low')
+
+        seen = []
+        url = '/api/tasks?limit=2'
+        while True:
+            data = self.client.get(url).json()
+            seen.extend(task['title'] for task in data['tasks'])
+            if not data['next_cursor']:
+                break
+            url = f'/api/tasks?limit=2&cursor={data["next_cursor"]}'
+        self.assertEqual(seen, [f'Task {i}' for i in range(5)])
+
+        data = self.client.get('/api/tasks?priority=high').json()
+        self.assertEqual(len(data['tasks']), 2)
+        data = self.client.get('/api/tasks?priority=high&fields=title').json()
+        self.assertEqual(data['tasks'], [{'title': 'Task 1'}, {'title': 'Task 3'}])
+        self.assertEqual(self.client.get('/api/tasks?sort=title').status_code, 400)
+
+        etag = self.client.get('/api/tasks').headers['etag']
+        self.assertEqual(self.client.get('/api/tasks', headers={'If-None-Match': etag}).status_code, 304)
+        self.create('Another')
+        self.assertEqual(self.client.get('/api/tasks', headers={'If-None-Match': etag}).status_code, 200)
+
+    def test_stats(self):
+        """Test counts by completion and priority"""
+        self.create('One', priority='high')
+        task = self.create('Two', priority='low')
+        self.client.post(f'/api/tasks/{task["id"]}/toggle')
+
+        response = self.client.get('/api/tasks/stats')
+        self.assertEqual(response.json(), {
+            'total': 2, 'completed': 1, 'pending': 1,
+            'by_priority': {'low': 1, 'medium': 0, 'high': 1}
+        })
+        response = self.client.get('/api/tasks/stats', headers={'If-None-Match': response.headers['etag']})
+        self.assertEqual(response.status_code, 304)
+
+    def test_search(self):
+        """Test ranked search matches the sync API"""
+        self.create('Buy milk')
+        self.create('Call shop', description='Ask about milk')
+        data = self.client.get('/api/tasks/search?q=milk').json()
+        self.assertEqual([task['title'] for task in data['tasks']], ['Buy milk', 'Call shop'])
+        self.assertEqual(self.client.get('/api/tasks/search?q=').status_code, 400)
+
+    def test_events_rejects_bad_last_event_id(self):
+        """Test the event stream validates Last-Event-ID before streaming"""
+        response = self.client.get('/api/tasks/events', headers={'Last-Event-ID': 'soon'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_batch_and_export(self):
+        """Test batch writes and streamed export"""
+        existing = self.create('Existing')
+        operations = [
+            {'op': 'create', 'title': 'Batch 1'},
+            {'op': 'update', 'id': existing['id'], 'completed': True},
+            {'op': 'delete', 'id': '00000000-0000-0000-0000-000000000000'},
+        ]
+        response = self.client.post('/api/tasks/batch', json={'operations': operations})
+        self.assertEqual([r['status'] for r in response.json()['results']], [201, 200, 404])
+        doomed = self.create('Doomed')
+        response = self.client.post('/api/tasks/batch', json={'operations': [{'op': 'delete', 'id': doomed['id']}]})
+        self.assertEqual(response.json()['results'], [{'index': 0, 'status': 200, 'id': doomed['id']}])
+
+        response = self.client.post('/api/tasks/batch', json={'operations': [{'op': 'bogus'}]})
+        self.assertEqual(response.status_code, 400)
+
+        response = self.client.get('/api/tasks/export')
+        lines = response.text.splitlines()
+        self.assertEqual([json.loads(line)['title'] for line in lines], ['Existing', 'Batch 1'])
+        data = self.client.get('/api/tasks/export?format=json').json()
+        self.assertEqual(len(data), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,885 @@
+import unittest
+from unittest import mock
+import importlib.util
+import gzip
+import json
+import os
+import sys
+import socketserver
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+# Run the backend against a throwaway SQLite database instead of Postgres
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+DB_FILE = os.path.join(tempfile.mkdtemp(), 'tasks.db')
+os.environ['DATABASE_URL'] = f'sqlite:///{DB_FILE}'
+# Tests run jobs on their own thread with job_runner.run_pending()
+os.environ['JOBS_WORKER_THREADS'] = '0'
+sys.path.insert(0, BACKEND_DIR)
+
+# Load backend-api/app.py under its own name so it doesn't clash with the
+# monolith's app module when both test suites run in one session
+spec = importlib.util.spec_from_file_location('backend_app', os.path.join(BACKEND_DIR, 'app.py'))
+backend_app = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(backend_app)
+
+import database
+import events
+import jobs
+import metrics
+from cache import LRUCache, RedisCache
+from database import Base, ReplicaSet, create_db_engine, db_session
+from events import EventBroadcaster
+from profiling import WallClockSession
+from models import Job, Task, TaskEvent
+from queries import task_write_statements
+from sqlalchemy import delete, func, select
+
+
+class RedisStandIn(socketserver.ThreadingTCPServer):
+    """Minimal in-process server for the Redis commands the cache uses"""
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        self.data = {}
+        super().__init__(('127.0.0.1', 0), RedisStandInHandler)
+
+    @property
+    def url(self):
+        return f'redis://127.0.0.1:{self.server_address[1]}/0'
+
+
+class RedisStandInHandler(socketserver.StreamRequestHandler):
+    def read_command(self):
+        line = self.rfile.readline()
+        if not line:
+            return None
+        args = []
+        for _ in range(int(line[1:])):
+            length = int(self.rfile.readline()[1:])
+            args.append(self.rfile.read(length + 2)[:-2])
+        return args
+
+    def handle(self):
+        data = self.server.data
+        while True:
+            args = self.read_command()
+            if args is None:
+                return
+            command = args[0].upper()
+            if command == b'GET':
+                value = data.get(args[1])
+                reply = b'$-1\r\n' if value is None else b'$%d\r\n%s\r\n' % (len(value), value)
+            elif command == b'SET':
+                data[args[1]] = args[2]
+                reply = b'+OK\r\n'
+            elif command == b'DEL':
+                reply = b':%d\r\n' % sum(data.pop(key, None) is not None for key in args[1:])
+            else:
+                reply = b'-ERR unknown command\r\n'
+            self.wfile.write(reply)
+
+
+class TestBackendAPI(unittest.TestCase):
+    def setUp(self):
+        """Set up test client and clear tasks before each test"""
+        self.app = backend_app.app.test_client()
+        self.app.testing = True
+        db_session.query(Task).delete()
+        db_session.query(Job).delete()
+        backend_app.commit_task_write()
+
+    def tearDown(self):
+        db_session.remove()
+
+    def add_tasks(self, count, **fields):
+        """Insert tasks with increasing created_at timestamps"""
+        start = datetime(2024, 1, 1)
+        tasks = []
+        for i in range(count):
+            task = Task(title=f'Task {i}', created_at=start + timedelta(minutes=i),
+                        updated_at=start + timedelta(minutes=i), **fields)
+            db_session.add(task)
+            tasks.append(task)
+        backend_app.commit_task_write()
+        return [str(task.id) for task in tasks]
+
+    def test_create_and_get_task(self):
+        """Test creating a task and fetching it by id"""
+        response = self.app.post('/api/tasks',
+                                 data=json.dumps({'title': 'Test Task', 'priority': 'high'}),
+                                 content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        task_id = response.get_json()['id']
+
+        response = self.app.get(f'/api/tasks/{task_id}')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()['title'], 'Test Task')
+
+    def test_update_task_bumps_version(self):
+        """Test that an update returns the new row and a new ETag"""
+        task_id = self.add_tasks(1)[0]
+
+        response = self.app.put(f'/api/tasks/{task_id}',
+                                data=json.dumps({'title': 'Updated', 'completed': True}),
+                                content_type='application/json')
+
+        self.assertEqual(response.status_code, 200)
+        data = response.get_json()
+        self.assertEqual(data['title'], 'Updated')
+        self.assertTrue(data['completed'])
+        self.assertEqual(data['version'], 2)
+        self.assertEqual(response.headers['ETag'], '"2"')
+
+    def test_toggle_task(self):
+        """Test that toggling flips completed and returns the updated task"""
+        task_id = self.add_tasks(1)[0]
+
+        response = self.app.post(f'/api/tasks/{task_id}/toggle')
+        self.assertEqual(response.status_code, 200)
+        data = response.get_json()
+        self.assertTrue(data['completed'])
+        self.assertEqual(data['version'], 2)
+        self.assertEqual(response.headers['ETag'], '"2"')
+
+        response = self.app.post(f'/api/tasks/{task_id}/toggle', headers={'If-Match': '"1"'})
+        self.assertEqual(response.status_code, 412)
+
+        data = self.app.post(f'/api/tasks/{task_id}/toggle').get_json()
+        self.assertFalse(data['completed'])
+        self.assertEqual(self.app.post('/api/tasks/not-a-uuid/toggle').status_code, 404)
+
+    def test_delete_returns_deleted_task(self):
+        """Test that DELETE responds with the task it removed"""
+        task_id = self.add_tasks(1, description='Doomed')[0]
+
+        response = self.app.delete(f'/api/tasks/{task_id}')
+        self.assertEqual(response.status_code, 200)
+        data = response.get_json()
+        self.assertEqual(data['message'], 'Task deleted successfully')
+        self.assertEqual(data['task']['id'], task_id)
+        self.assertEqual(data['task']['description'], 'Doomed')
+
+    def test_task_stats(self):
+        """Test counts by completion and priority, revalidated by ETag"""
+        self.add_tasks(3, priority='high')
+        self.add_tasks(2, priority='low', completed=True)
+
+        response = self.app.get('/api/tasks/stats')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json(), {
+            'total': 5, 'completed': 2, 'pending': 3,
+            'by_priority': {'low': 2, 'medium': 0, 'high': 3}
+        })
+        etag = response.headers['ETag']
+        self.assertEqual(self.app.get('/api/tasks/stats', headers={'If-None-Match': etag}).status_code, 304)
+
+        self.add_tasks(1)
+        response = self.app.get('/api/tasks/stats', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()['total'], 6)
+
+    def test_search_ranks_title_matches_first(self):
+        """Test search matches every word and ranks title hits higher"""
+        db_session.add_all([
+            Task(title='Buy milk', description='From the corner shop'),
+            Task(title='Call shop', description='Ask whether they sell milk'),
+            Task(title='Walk dog', description='Around the park'),
+        ])
+        backend_app.commit_task_write()
+
+        response = self.app.get('/api/tasks/search?q=milk')
+        self.assertEqual(response.status_code, 200)
+        data = response.get_json()
+        self.assertEqual([task['title'] for task in data['tasks']], ['Buy milk', 'Call shop'])
+        self.assertGreater(data['tasks'][0]['rank'], data['tasks'][1]['rank'])
+        self.assertIsNone(data['next_offset'])
+
+        data = self.app.get('/api/tasks/search?q=milk+shop').get_json()
+        self.assertEqual(len(data['tasks']), 2)
+        data = self.app.get('/api/tasks/search?q=milk&limit=1').get_json()
+        self.assertEqual(data['next_offset'], 1)
+        data = self.app.get('/api/tasks/search?q=milk&limit=1&offset=1').get_json()
+        self.assertEqual([task['title'] for task in data['tasks']], ['Call shop'])
+        self.assertEqual(self.app.get('/api/tasks/search?q=park&completed=true').get_json()['tasks'], [])
+
+        self.assertEqual(self.app.get('/api/tasks/search').status_code, 400)
+        self.assertEqual(self.app.get('/api/tasks/search?q=milk&offset=-1').status_code, 400)
+
+    def test_update_and_delete_missing_task(self):
+        """Test 404s for unknown and malformed task ids"""
+        missing = '00000000-0000-0000-0000-000000000000'
+        response = self.app.put(f'/api/tasks/{missing}', data=json.dumps({'title': 'x'}),
+                                content_type='application/json')
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(self.app.delete(f'/api/tasks/{missing}').status_code, 404)
+        self.assertEqual(self.app.delete('/api/tasks/not-a-uuid').status_code, 404)
+
+    def test_conditional_update_and_delete(self):
+        """Test If-Match optimistic concurrency on writes"""
+        task_id = self.add_tasks(1)[0]
+
+        response = self.app.put(f'/api/tasks/{task_id}', data=json.dumps({'title': 'First'}),
+                                content_type='application/json', headers={'If-Match': '"1"'})
+        self.assertEqual(response.status_code, 200)
+
+        # A second writer still holding version 1 loses
+        response = self.app.put(f'/api/tasks/{task_id}', data=json.dumps({'title': 'Second'}),
+                                content_type='application/json', headers={'If-Match': '"1"'})
+        self.assertEqual(response.status_code, 412)
+        self.assertEqual(self.app.delete(f'/api/tasks/{task_id}', headers={'If-Match': '"1"'}).status_code, 412)
+
+        response = self.app.delete(f'/api/tasks/{task_id}', headers={'If-Match': '"2"'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(db_session.query(Task).count(), 0)
+
+    def test_get_tasks_paginates_with_cursor(self):
+        """Test that following next_cursor walks every task exactly once"""
+        ids = self.add_tasks(7)
+
+        seen = []
+        url = '/api/tasks?limit=3'
+        while True:
+            data = self.app.get(url).get_json()
+            seen.extend(task['id'] for task in data['tasks'])
+            if not data['next_cursor']:
+                break
+            url = f'/api/tasks?limit=3&cursor={data["next_cursor"]}'
+
+        self.assertEqual(seen, ids)
+
+    def test_get_tasks_descending(self):
+        """Test descending sort order across pages"""
+        ids = self.add_tasks(5)
+
+        first = self.app.get('/api/tasks?limit=2&sort=-created_at').get_json()
+        second = self.app.get(
+            f'/api/tasks?limit=2&sort=-created_at&cursor={first["next_cursor"]}').get_json()
+
+        self.assertEqual([t['id'] for t in first['tasks'] + second['tasks']],
+                         list(reversed(ids))[:4])
+
+    def test_get_tasks_filters(self):
+        """Test completed, priority and created-at filters"""
+        self.add_tasks(2, priority='high', completed=True)
+        self.add_tasks(3, priority='low')
+
+        data = self.app.get('/api/tasks?completed=true').get_json()
+        self.assertEqual(len(data['tasks']), 2)
+        data = self.app.get('/api/tasks?priority=low,medium').get_json()
+        self.assertEqual(len(data['tasks']), 3)
+        data = self.app.get('/api/tasks?created_before=2024-01-01T00:01:00').get_json()
+        self.assertEqual(len(data['tasks']), 2)
+
+    def test_get_tasks_invalid_parameters(self):
+        """Test that malformed query parameters are rejected"""
+        self.assertEqual(self.app.get('/api/tasks?sort=title').status_code, 400)
+        self.assertEqual(self.app.get('/api/tasks?cursor=garbage').status_code, 400)
+        self.assertEqual(self.app.get('/api/tasks?priority=urgent').status_code, 400)
+
+    def test_fields_projection(self):
+        """Test fields= returns and selects only the requested columns"""
+        task_id = self.add_tasks(3, description='Long body')[0]
+
+        data = self.app.get('/api/tasks?fields=title,completed&limit=2').get_json()
+        self.assertEqual(data['tasks'], [{'title': 'Task 0', 'completed': False},
+                                         {'title': 'Task 1', 'completed': False}])
+        data = self.app.get(f'/api/tasks?fields=title&limit=2&cursor={data["next_cursor"]}').get_json()
+        self.assertEqual(data['tasks'], [{'title': 'Task 2'}])
+
+        page = backend_app.TaskPage({'fields': 'id,title'})
+        self.assertNotIn('description', str(page.statement))
+
+        response = self.app.get(f'/api/tasks/{task_id}?fields=id,created_at')
+        self.assertEqual(response.get_json(), {'id': task_id, 'created_at': '2024-01-01 00:00'})
+        self.assertEqual(response.headers['ETag'], '"1"')
+        self.assertEqual(self.app.get(f'/api/tasks/{task_id}').get_json()['description'], 'Long body')
+
+        self.assertEqual(self.app.get('/api/tasks?fields=title,secret').status_code, 400)
+        self.assertEqual(self.app.get(f'/api/tasks/{task_id}?fields=').status_code, 400)
+
+    def test_json_matches_default_provider(self):
+        """Test responses are byte-identical to Flask's default JSON encoding"""
+        from flask.json.provider import DefaultJSONProvider
+        default = DefaultJSONProvider(backend_app.app)
+        payload = {
+            'b': [1, 2.5, 1e16, 1e-7, None, True, 2 ** 70], 'a': 'café \x7f \x1f "q"',
+            'when': datetime(2024, 1, 2, 3, 4, 5), 'id': uuid.UUID(int=1)
+        }
+        with backend_app.app.app_context():
+            for value in (payload, {'plain': 'ascii', 'n': [1, 2, 3]}, {'small': [1e-05, 1.291529344142946e-05]},
+                          {2: 'int', 1: 'keys'}):
+                self.assertEqual(backend_app.app.json.response(value).get_data(),
+                                 default.response(value).get_data())
+
+        ids = self.add_tasks(2, description='Grüße')
+        expected = json.dumps({'next_cursor': None, 'tasks': [{
+            'id': task_id, 'title': f'Task {i}', 'description': 'Grüße', 'priority': 'medium',
+            'completed': False, 'version': 1,
+            'created_at': f'2024-01-01 00:0{i}', 'updated_at': f'2024-01-01 00:0{i}'
+        } for i, task_id in enumerate(ids)]}, separators=(',', ':'), sort_keys=True)
+        self.assertEqual(self.app.get('/api/tasks').get_data(as_text=True), expected + '\n')
+
+    def test_metrics_count_requests_queries_and_rows(self):
+        """Test /metrics reports per-route latency, SQL statements and serialized rows"""
+        self.add_tasks(3)
+        labels = {'method': 'GET', 'route': '/api/tasks', 'status': '200'}
+        route = {'route': '/api/tasks'}
+        sample = metrics.registry.get_sample_value
+        before = [sample('http_request_duration_seconds_count', labels) or 0,
+                  sample('http_request_db_queries_sum', route) or 0,
+                  sample('tasks_serialized_total', route) or 0]
+
+        self.assertEqual(self.app.get('/api/tasks').status_code, 200)
+        self.app.get('/no/such/path')
+
+        self.assertEqual(sample('http_request_duration_seconds_count', labels), before[0] + 1)
+        self.assertGreater(sample('http_request_db_queries_sum', route), before[1])
+        self.assertEqual(sample('tasks_serialized_total', route), before[2] + 3)
+        self.assertGreater(sample('db_query_duration_seconds_count'), 0)
+        response = self.app.get('/metrics')
+        self.assertTrue(response.content_type.startswith('text/plain'))
+        body = response.get_data(as_text=True)
+        self.assertIn('route="unmatched",status="404"', body)
+        self.assertNotIn('/no/such/path', body)
+
+    def test_profile_requested_by_admin_header(self):
+        """Test X-Profile needs the admin token and the profile is listed at /admin/profiles"""
+        self.add_tasks(2)
+        self.assertEqual(self.app.get('/admin/profiles').status_code, 404)
+        with mock.patch.object(backend_app.profiler, 'token', 'secret'):
+            response = self.app.get('/api/tasks', headers={'X-Profile': '1', 'X-Admin-Token': 'wrong'})
+            self.assertNotIn('X-Profile-Id', response.headers)
+            # A page not cached yet, so it is read and serialized
+            response = self.app.get('/api/tasks?limit=10', headers={'X-Profile': '1', 'X-Admin-Token': 'secret'})
+            profile_id = int(response.headers['X-Profile-Id'])
+
+            self.assertEqual(self.app.get('/admin/profiles').status_code, 403)
+            data = self.app.get('/admin/profiles', headers={'X-Admin-Token': 'secret'}).get_json()
+        profile = next(entry for entry in data['profiles'] if entry['id'] == profile_id)
+        self.assertEqual((profile['path'], profile['status'], profile['trigger']), ('/api/tasks?limit=10', 200, 'header'))
+        self.assertGreater(profile['sql']['queries'], 0)
+        self.assertEqual(profile['rows_serialized'], 2)
+        self.assertIn('get_tasks', profile['profile'])
+
+    def test_wall_clock_profile_samples_blocked_time(self):
+        """Test the wall-clock profiler sees time spent waiting, not only on CPU"""
+        def wait_for_backend():
+            threading.Event().wait(0.05)
+
+        session = WallClockSession(0.002)
+        wait_for_backend()
+        stacks = session.stop()
+        self.assertIn('wait_for_backend', stacks.splitlines()[0])
+
+    def test_slow_queries_captured_with_plan(self):
+        """Test statements over the threshold are kept unbound, with their EXPLAIN plan"""
+        self.add_tasks(1)
+        with mock.patch.object(backend_app.slow_queries, 'threshold', 1e-9):
+            self.app.get('/api/tasks?priority=high')
+        entry = next(entry for entry in backend_app.slow_queries.entries.entries()
+                     if 'FROM tasks' in entry['statement'] and 'priority' in entry['statement'])
+        self.assertIsNotNone(entry['plan'])
+        self.assertNotIn('EXPLAIN failed', entry['plan'])
+        self.assertNotIn('high', entry['statement'])
+
+    def test_export_ndjson(self):
+        """Test streaming export as NDJSON across several cursor batches"""
+        ids = self.add_tasks(5)
+
+        with mock.patch.object(backend_app, 'EXPORT_BATCH_SIZE', 2):
+            response = self.app.get('/api/tasks/export')
+            body = response.get_data(as_text=True)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'application/x-ndjson')
+        self.assertTrue(body.endswith('\n'))
+        self.assertEqual([json.loads(line)['id'] for line in body.splitlines()], ids)
+
+    def test_export_json_array(self):
+        """Test streaming export as a JSON array with filters applied"""
+        self.add_tasks(4, priority='high')
+        self.add_tasks(1, priority='low')
+
+        with mock.patch.object(backend_app, 'EXPORT_BATCH_SIZE', 2):
+            response = self.app.get('/api/tasks/export?format=json&priority=high')
+            data = json.loads(response.get_data(as_text=True))
+
+        self.assertEqual(len(data), 4)
+        self.assertTrue(all(task['priority'] == 'high' for task in data))
+
+    def test_export_empty(self):
+        """Test exporting with no matching tasks"""
+        self.assertEqual(self.app.get('/api/tasks/export').get_data(as_text=True), '')
+        self.assertEqual(self.app.get('/api/tasks/export?format=json').get_json(), [])
+
+    def read_events(self, broadcaster, last_event_id, count):
+        """Collect ``count`` SSE messages (skipping retry and keep-alive lines)"""
+        stream = broadcaster.stream(last_event_id, max_seconds=5)
+        messages = []
+        for chunk in stream:
+            messages.extend(
+                dict(line.split(': ', 1) for line in message.splitlines())
+                for message in chunk.split('\n\n') if message.startswith('id: ')
+            )
+            if len(messages) >= count:
+                break
+        stream.close()
+        return messages
+
+    def test_task_events_stream_and_resume(self):
+        """Test writes are recorded as events that streams deliver and resume from"""
+        start = db_session.execute(select(func.coalesce(func.max(TaskEvent.id), 0))).scalar()
+        db_session.remove()
+        task_id = self.app.post('/api/tasks', json={'title': 'Watched'}).get_json()['id']
+        self.app.post(f'/api/tasks/{task_id}/toggle')
+        self.app.post('/api/tasks/batch', json={'operations': [
+            {'op': 'create', 'title': 'Batch'}, {'op': 'delete', 'id': task_id}
+        ]})
+
+        broadcaster = EventBroadcaster(database.engine, poll_seconds=0.1)
+        messages = self.read_events(broadcaster, start, 4)
+        self.assertEqual([m['event'] for m in messages], ['created', 'updated', 'created', 'deleted'])
+        self.assertTrue(json.loads(messages[1]['data'])['completed'])
+        self.assertEqual(json.loads(messages[3]['data']), json.loads(messages[1]['data']))
+
+        resumed = self.read_events(broadcaster, int(messages[1]['id']), 2)
+        self.assertEqual([m['id'] for m in resumed], [m['id'] for m in messages[2:]])
+
+        # Live events reach a stream that started with no Last-Event-ID
+        stream = broadcaster.stream(max_seconds=5)
+        next(stream)
+        self.app.post('/api/tasks', json={'title': 'Live'})
+        chunk = next(stream)
+        stream.close()
+        self.assertIn('event: created', chunk)
+        self.assertIn('"title":"Live"', chunk)
+
+    def test_interleaved_writers_commit_events_in_id_order(self):
+        """Test an event committed after a later-numbered one still reaches streams"""
+        start = db_session.execute(select(func.coalesce(func.max(TaskEvent.id), 0))).scalar()
+        db_session.remove()
+        dialect = database.engine.dialect.name
+
+        def event(title):
+            return [('created', {'id': str(uuid.uuid4()), 'title': title})]
+
+        # Writer A has taken its event id but not yet committed
+        first = database.engine.connect()
+        first_transaction = first.begin()
+        remaining = task_write_statements(event('first'), dialect)
+        while remaining:
+            statement = remaining.pop(0)
+            first.execute(statement)
+            if getattr(statement, 'is_insert', False):
+                break
+
+        def second_writer():
+            with database.engine.begin() as connection:
+                for statement in task_write_statements(event('second'), dialect):
+                    connection.execute(statement)
+
+        second = threading.Thread(target=second_writer)
+        second.start()
+        second.join(0.5)
+        delivered = []
+        broadcaster = EventBroadcaster(database.engine)
+        subscription = events.Subscription(broadcaster, delivered.append, start)
+        broadcaster._subscribers.add(subscription)
+        # Writer B waits on A's counter lock instead of committing a later id first
+        broadcaster._dispatch()
+        for statement in remaining:
+            first.execute(statement)
+        first_transaction.commit()
+        first.close()
+        second.join()
+        broadcaster._dispatch()
+
+        titles = [json.loads(line[len('data: '):])['title']
+                  for line in ''.join(delivered).splitlines() if line.startswith('data: ')]
+        self.assertEqual(titles, ['first', 'second'])
+
+    def test_batch_delete_event_carries_the_task(self):
+        """Test a batch delete's event carries the whole task, as a single delete's does"""
+        single, batched = self.add_tasks(2, description='Doomed')
+        start = db_session.execute(select(func.coalesce(func.max(TaskEvent.id), 0))).scalar()
+        db_session.remove()
+        before = {task_id: self.app.get(f'/api/tasks/{task_id}').get_json() for task_id in (single, batched)}
+        self.app.delete(f'/api/tasks/{single}')
+        self.app.post('/api/tasks/batch', json={'operations': [{'op': 'delete', 'id': batched}]})
+
+        events = db_session.execute(
+            select(TaskEvent.type, TaskEvent.data).where(TaskEvent.id > start).order_by(TaskEvent.id)
+        ).all()
+        self.assertEqual([event.type for event in events], ['deleted', 'deleted'])
+        self.assertEqual([json.loads(event.data) for event in events], [before[single], before[batched]])
+
+    def test_task_events_reset_after_prune(self):
+        """Test a stream resuming from a pruned event is told to reload"""
+        self.app.post('/api/tasks', json={'title': 'First'})
+        self.app.post('/api/tasks', json={'title': 'Second'})
+        newest = db_session.execute(select(func.max(TaskEvent.id))).scalar()
+        db_session.execute(delete(TaskEvent).where(TaskEvent.id < newest))
+        db_session.commit()
+
+        broadcaster = EventBroadcaster(database.engine, poll_seconds=0.1)
+        self.assertEqual(self.read_events(broadcaster, newest - 2, 1)[0]['event'], 'reset')
+
+        response = self.app.get('/api/tasks/events', headers={'Last-Event-ID': 'soon'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_batch_create_update_delete(self):
+        """Test a mixed batch returns one result per operation in order"""
+        existing = self.add_tasks(3)
+        missing = '00000000-0000-0000-0000-000000000000'
+        operations = [
+            {'op': 'create', 'title': 'Batch 1', 'priority': 'high'},
+            {'op': 'update', 'id': existing[0], 'completed': True},
+            {'op': 'update', 'id': existing[1], 'completed': True},
+            {'op': 'update', 'id': existing[2], 'title': 'Renamed'},
+            {'op': 'delete', 'id': missing},
+            {'op': 'create', 'title': 'Batch 2'},
+        ]
+
+        response = self.app.post('/api/tasks/batch',
+                                 data=json.dumps({'operations': operations}),
+                                 content_type='application/json')
+
+        self.assertEqual(response.status_code, 200)
+        results = response.get_json()['results']
+        self.assertEqual([r['status'] for r in results], [201, 200, 200, 200, 404, 201])
+        self.assertEqual(results[0]['task']['priority'], 'high')
+        self.assertTrue(results[1]['task']['completed'])
+        self.assertEqual(results[3]['task']['title'], 'Renamed')
+        self.assertEqual(db_session.query(Task).count(), 5)
+
+        response = self.app.post('/api/tasks/batch',
+                                 data=json.dumps({'operations': [{'op': 'delete', 'id': existing[0]}]}),
+                                 content_type='application/json')
+        self.assertEqual(response.get_json()['results'][0]['status'], 200)
+        self.assertEqual(db_session.query(Task).count(), 4)
+
+    def test_batch_validation_rejects_whole_batch(self):
+        """Test that one invalid operation prevents every write"""
+        operations = [
+            {'op': 'create', 'title': 'Valid'},
+            {'op': 'create', 'description': 'No title'},
+            {'op': 'update', 'id': 'not-a-uuid', 'title': 'x'},
+        ]
+
+        response = self.app.post('/api/tasks/batch',
+                                 data=json.dumps({'operations': operations}),
+                                 content_type='application/json')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([r['index'] for r in response.get_json()['results']], [1, 2])
+        self.assertEqual(db_session.query(Task).count(), 0)
+
+    def test_reads_use_replica_until_client_writes(self):
+        """Test replica routing with read-your-writes stickiness"""
+        replica = create_db_engine(f'sqlite:///{os.path.join(os.path.dirname(DB_FILE), "replica.db")}')
+        Base.metadata.create_all(bind=replica)
+        with replica.begin() as connection:
+            connection.execute(Task.__table__.delete())
+            connection.execute(Task.__table__.insert().values(
+                id=uuid.uuid4(), title='Replica Task', created_at=datetime.utcnow(),
+                updated_at=datetime.utcnow()))
+
+        with mock.patch.object(database, 'replicas', ReplicaSet([replica], eject_seconds=30)):
+            titles = [t['title'] for t in self.app.get('/api/tasks').get_json()['tasks']]
+            self.assertEqual(titles, ['Replica Task'])
+
+            # Writes go to the primary and pin this client there for a while
+            self.app.post('/api/tasks', data=json.dumps({'title': 'Primary Task'}),
+                          content_type='application/json')
+            titles = [t['title'] for t in self.app.get('/api/tasks').get_json()['tasks']]
+            self.assertEqual(titles, ['Primary Task'])
+
+    def test_replica_set_ejects_failed_replica(self):
+        """Test that a replica failing to connect is skipped"""
+        bad = create_db_engine('sqlite:////nonexistent/dir/replica.db')
+        good = create_db_engine('sqlite://')
+        replica_set = ReplicaSet([bad, good], eject_seconds=30)
+
+        with self.assertRaises(Exception):
+            bad.connect()
+
+        self.assertEqual({replica_set.choose() for _ in range(4)}, {good})
+        self.assertEqual([r['healthy'] for r in replica_set.status()], [False, True])
+
+    def test_list_conditional_requests(self):
+        """Test list ETag/Last-Modified revalidation against the change counter"""
+        self.add_tasks(2)
+        response = self.app.get('/api/tasks')
+        etag = response.headers['ETag']
+        last_modified = response.headers['Last-Modified']
+
+        response = self.app.get('/api/tasks', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.headers['ETag'], etag)
+        self.assertEqual(response.get_data(), b'')
+        response = self.app.get('/api/tasks', headers={'If-Modified-Since': last_modified})
+        self.assertEqual(response.status_code, 304)
+
+        self.app.post('/api/tasks', data=json.dumps({'title': 'New'}), content_type='application/json')
+        response = self.app.get('/api/tasks', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers['ETag'], etag)
+        self.assertEqual(len(response.get_json()['tasks']), 3)
+
+    def test_task_conditional_requests(self):
+        """Test single-task revalidation against the row version"""
+        task_id = self.add_tasks(1)[0]
+        self.assertEqual(self.app.get(f'/api/tasks/{task_id}',
+                                      headers={'If-None-Match': '"1"'}).status_code, 304)
+
+        self.app.put(f'/api/tasks/{task_id}', data=json.dumps({'title': 'Changed'}),
+                     content_type='application/json')
+        response = self.app.get(f'/api/tasks/{task_id}', headers={'If-None-Match': '"1"'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers['ETag'], '"2"')
+        self.assertEqual(self.app.get(f'/api/tasks/{task_id}',
+                                      headers={'If-None-Match': '"2"'}).status_code, 304)
+
+    def check_cached_reads(self):
+        """Reads are served from the cache until a write invalidates them"""
+        task_id = self.add_tasks(1)[0]
+        self.assertEqual(self.app.get('/api/tasks').get_json()['tasks'][0]['title'], 'Task 0')
+        self.assertEqual(self.app.get(f'/api/tasks/{task_id}').get_json()['title'], 'Task 0')
+
+        # Change the row behind the cache's back: cached copies are still served
+        db_session.query(Task).update({'title': 'Changed'})
+        db_session.commit()
+        hits = backend_app.cache.hits
+        self.assertEqual(self.app.get('/api/tasks').get_json()['tasks'][0]['title'], 'Task 0')
+        self.assertEqual(self.app.get(f'/api/tasks/{task_id}').get_json()['title'], 'Task 0')
+        self.assertEqual(backend_app.cache.hits, hits + 2)
+
+        # A write through the API invalidates the task and every list page
+        backend_app.app.test_client().put(f'/api/tasks/{task_id}', data=json.dumps({'completed': True}),
+                                          content_type='application/json')
+        self.assertEqual(self.app.get('/api/tasks').get_json()['tasks'][0]['title'], 'Changed')
+        response = self.app.get(f'/api/tasks/{task_id}')
+        self.assertEqual(response.get_json()['title'], 'Changed')
+        self.assertEqual(response.headers['ETag'], '"2"')
+
+    def test_columnar_task_list(self):
+        """Test the columnar list encoding chosen by Accept, with its own ETag and cache entry"""
+        ids = self.add_tasks(3, priority='high')
+        plain = self.app.get('/api/tasks?fields=id,priority')
+        response = self.app.get('/api/tasks?fields=id,priority',
+                                headers={'Accept': backend_app.COLUMNAR_MIMETYPE})
+        self.assertEqual(response.mimetype, backend_app.COLUMNAR_MIMETYPE)
+        self.assertIn('Accept', response.vary)
+        self.assertNotEqual(response.headers['ETag'], plain.headers['ETag'])
+        table = json.loads(response.data)['tasks']
+        self.assertEqual(table, {'columns': ['id', 'priority'], 'rows': [[task_id, 'high'] for task_id in ids]})
+
+        # Served again from the response cache, still columnar
+        again = self.app.get('/api/tasks?fields=id,priority', headers={'Accept': backend_app.COLUMNAR_MIMETYPE})
+        self.assertEqual((again.mimetype, again.data), (response.mimetype, response.data))
+        self.assertEqual(self.app.get('/api/tasks?fields=id,priority').get_json(), plain.get_json())
+
+    def test_compression_negotiated_with_threshold(self):
+        """Test gzip/br/zstd negotiation, the size threshold and weak ETags on compressed bodies"""
+        self.add_tasks(40)
+        response = self.app.get('/api/tasks', headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response.vary)
+        etag = response.headers['ETag']
+        self.assertTrue(etag.startswith('W/'))
+        self.assertEqual(len(json.loads(gzip.decompress(response.data))['tasks']), 40)
+        self.assertEqual(self.app.get('/api/tasks', headers={'If-None-Match': etag}).status_code, 304)
+
+        response = self.app.get('/api/tasks', headers={'Accept-Encoding': 'gzip;q=0.5, br, zstd;q=0.9'})
+        self.assertEqual(response.headers['Content-Encoding'], 'br')
+        response = self.app.get('/api/tasks', headers={'Accept-Encoding': '*'})
+        self.assertEqual(response.headers['Content-Encoding'], 'zstd')
+
+        small = self.app.get('/api/tasks?limit=1', headers={'Accept-Encoding': 'gzip'})
+        self.assertNotIn('Content-Encoding', small.headers)
+        self.assertEqual(len(small.get_json()['tasks']), 1)
+
+    def test_compressed_task_etag_still_matches_if_match(self):
+        """Test that a weak ETag from a compressed task response works for a conditional update"""
+        self.add_tasks(1, description='x' * 2000)
+        task_id = self.app.get('/api/tasks').get_json()['tasks'][0]['id']
+        response = self.app.get(f'/api/tasks/{task_id}', headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        response = self.app.put(f'/api/tasks/{task_id}', data=json.dumps({'title': 'Renamed'}),
+                                content_type='application/json', headers={'If-Match': response.headers['ETag']})
+        self.assertEqual(response.status_code, 200)
+
+    def test_export_compressed_while_streaming(self):
+        """Test that a streamed export is gzipped chunk by chunk"""
+        ids = self.add_tasks(5)
+        with mock.patch.object(backend_app, 'EXPORT_BATCH_SIZE', 2):
+            response = self.app.get('/api/tasks/export', headers={'Accept-Encoding': 'gzip'})
+            body = gzip.decompress(response.get_data()).decode()
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertNotIn('Content-Length', response.headers)
+        self.assertEqual([json.loads(line)['id'] for line in body.splitlines()], ids)
+
+    def submit_job(self, job_type, payload):
+        response = self.app.post('/api/jobs', json={'type': job_type, 'payload': payload})
+        self.assertEqual(response.status_code, 202, response.get_data(as_text=True))
+        self.assertEqual(response.headers['Location'], f"/api/jobs/{response.get_json()['id']}")
+        return response.get_json()
+
+    def test_import_job_commits_batches_with_progress(self):
+        """Test an import job creates tasks batch by batch and reports progress"""
+        job = self.submit_job('import', {'tasks': [{'title': f'Imported {i}', 'priority': 'high'} for i in range(5)]})
+        self.assertEqual(job['status'], 'queued')
+        events_before = db_session.query(TaskEvent).count()
+
+        with mock.patch.object(jobs, 'JOBS_BATCH_SIZE', 2):
+            self.assertEqual(backend_app.job_runner.run_pending(), 1)
+        job = self.app.get(f"/api/jobs/{job['id']}").get_json()
+        self.assertEqual(job['status'], 'succeeded')
+        self.assertEqual((job['progress'], job['total'], job['attempts']), (5, 5, 1))
+        self.assertEqual(job['result'], {'created': 5})
+        self.assertEqual(db_session.query(Task).filter(Task.priority == 'high').count(), 5)
+        self.assertEqual(db_session.query(TaskEvent).count() - events_before, 5)
+
+        self.assertEqual(self.app.get(f'/api/jobs/{uuid.uuid4()}').status_code, 404)
+        self.assertEqual(self.app.post('/api/jobs', json={'type': 'explode'}).status_code, 400)
+        response = self.app.post('/api/jobs', json={'type': 'import', 'payload': {'tasks': [{'title': 'ok'}, {}]}})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('tasks[1]', response.get_json()['error'])
+
+    def test_purge_and_export_jobs(self):
+        """Test purging completed tasks and downloading an export job's output"""
+        self.add_tasks(3, completed=True)
+        self.add_tasks(2, completed=False)
+        cutoff = datetime(2024, 1, 1, 0, 2).isoformat()
+        purge = self.submit_job('purge_completed', {'updated_before': cutoff})
+        export = self.submit_job('export', {'filters': {'completed': False}})
+        self.assertEqual(self.app.get(f"/api/jobs/{export['id']}/output").status_code, 409)
+        self.assertEqual(backend_app.job_runner.run_pending(), 2)
+
+        self.assertEqual(self.app.get(f"/api/jobs/{purge['id']}").get_json()['result'], {'deleted': 2})
+        self.assertEqual(db_session.query(Task).filter(Task.completed.is_(True)).count(), 1)
+
+        response = self.app.get(f"/api/jobs/{export['id']}/output", headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        lines = gzip.decompress(response.get_data()).decode().splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertFalse(any(json.loads(line)['completed'] for line in lines))
+        plain = self.app.get(f"/api/jobs/{export['id']}/output", headers={'Accept-Encoding': 'identity'})
+        self.assertEqual(plain.get_data(as_text=True).splitlines(), lines)
+
+    def test_failed_job_retries_with_backoff_then_fails(self):
+        """Test failed attempts are requeued after a backoff until max attempts"""
+        job = self.submit_job('import', {'tasks': [{'title': 'Flaky'}]})
+        runner = backend_app.job_runner
+        failing = {'import': (jobs.validate_import, mock.Mock(side_effect=RuntimeError('database went away')))}
+        with mock.patch.dict(jobs.JOB_TYPES, failing):
+            runner.run_pending()
+            state = self.app.get(f"/api/jobs/{job['id']}").get_json()
+            self.assertEqual((state['status'], state['attempts']), ('queued', 1))
+            self.assertEqual(state['error'], 'database went away')
+            self.assertGreater(datetime.fromisoformat(state['run_after']), datetime.utcnow())
+            # Not due yet, so nothing runs
+            self.assertEqual(runner.run_pending(), 0)
+
+            for attempt in (2, 3):
+                db_session.query(Job).update({'run_after': datetime(2000, 1, 1)})
+                db_session.commit()
+                self.assertEqual(runner.run_pending(), 1)
+        state = self.app.get(f"/api/jobs/{job['id']}").get_json()
+        self.assertEqual((state['status'], state['attempts']), ('failed', 3))
+        self.assertIsNotNone(state['finished_at'])
+        self.assertEqual(db_session.query(Task).count(), 0)
+
+    def test_job_keeps_its_lease_through_a_long_batch(self):
+        """Test a running job's heartbeat is refreshed while it records no progress"""
+        job = self.submit_job('import', {'tasks': [{'title': 'Slow'}]})
+        runner = jobs.JobRunner(database.engine, threads=0, lease_seconds=0.3)
+        other = jobs.JobRunner(database.engine, threads=0, lease_seconds=0.3)
+
+        def slow_batch(context):
+            time.sleep(1)
+            return {'taken_over': other.claim() is not None}
+
+        with mock.patch.dict(jobs.JOB_TYPES, {'import': (jobs.validate_import, slow_batch)}):
+            self.assertEqual(runner.run_pending(), 1)
+        state = self.app.get(f"/api/jobs/{job['id']}").get_json()
+        self.assertEqual((state['status'], state['result']), ('succeeded', {'taken_over': False}))
+
+    def test_job_claims_skip_locked_and_expired_leases(self):
+        """Test runners skip jobs another runner holds and reclaim lapsed leases"""
+        first = self.submit_job('import', {'tasks': [{'title': 'One'}]})
+        runner = backend_app.job_runner
+        if database.engine.dialect.name == 'postgresql':
+            # A job row locked by another runner's claim is skipped, not waited on
+            with database.engine.connect() as other:
+                other.execute(select(Job.id).where(Job.id == uuid.UUID(first['id'])).with_for_update())
+                self.assertIsNone(runner.claim())
+                other.rollback()
+
+        claimed = runner.claim()
+        self.assertEqual(str(claimed.id), first['id'])
+        self.assertIsNone(runner.claim())
+        # The runner died: once its heartbeat is older than the lease, the job is taken over
+        db_session.query(Job).update({'heartbeat_at': datetime.utcnow() - timedelta(seconds=runner.lease_seconds + 1)})
+        db_session.commit()
+        self.assertEqual(runner.run_pending(), 1)
+        state = self.app.get(f"/api/jobs/{first['id']}").get_json()
+        self.assertEqual((state['status'], state['attempts']), ('succeeded', 2))
+
+    def test_cache_memory_backend(self):
+        """Test cached reads and invalidation with the in-process LRU"""
+        with mock.patch.object(backend_app, 'cache', LRUCache(ttl=30, max_entries=100)):
+            self.check_cached_reads()
+
+    def test_cache_redis_backend(self):
+        """Test cached reads and invalidation against a Redis-protocol server"""
+        server = RedisStandIn()
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            with mock.patch.object(backend_app, 'cache', RedisCache(server.url, ttl=30)):
+                self.check_cached_reads()
+                self.assertEqual(backend_app.cache.errors, 0)
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    def test_cached_task_checked_against_other_workers_writes(self):
+        """Test a worker's cached task is not served after another worker changes or deletes it"""
+        task_id = self.add_tasks(1)[0]
+        this_worker, other_worker = LRUCache(ttl=30, max_entries=100), LRUCache(ttl=30, max_entries=100)
+        with mock.patch.object(backend_app, 'cache', this_worker):
+            self.assertEqual(self.app.get(f'/api/tasks/{task_id}').headers['ETag'], '"1"')
+        with mock.patch.object(backend_app, 'cache', other_worker):
+            backend_app.app.test_client().put(f'/api/tasks/{task_id}', json={'title': 'Changed'})
+
+        with mock.patch.object(backend_app, 'cache', this_worker):
+            self.assertEqual(self.app.get(f'/api/tasks/{task_id}',
+                                          headers={'If-None-Match': '"1"'}).status_code, 200)
+            response = self.app.get(f'/api/tasks/{task_id}')
+            self.assertEqual((response.get_json()['title'], response.headers['ETag']), ('Changed', '"2"'))
+
+        with mock.patch.object(backend_app, 'cache', other_worker):
+            backend_app.app.test_client().delete(f'/api/tasks/{task_id}')
+        with mock.patch.object(backend_app, 'cache', this_worker):
+            self.assertEqual(self.app.get(f'/api/tasks/{task_id}').status_code, 404)
+
+    def test_lru_cache_evicts_and_expires(self):
+        """Test LRU eviction order and TTL expiry"""
+        cache = LRUCache(ttl=30, max_entries=2)
+        cache.set('a', b'1')
+        cache.set('b', b'2')
+        cache.get('a')
+        cache.set('c', b'3')
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), b'1')
+        cache.set('d', b'4', ttl=0)
+        self.assertIsNone(cache.get('d'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,348 @@
+"""Closed-loop HTTP load generator for the task manager servers.
+
+Each of ``--concurrency`` clients holds one keep-alive connection and sends
+requests back to back for ``--duration`` seconds. Requests either cycle
+through the given GET paths or follow a weighted mix of task operations
+(list, get, create, update, toggle, delete) spoken in the chosen target's
+dialect: the monolith (app.py), the backend API or the frontend. Throughput
+and latency percentiles are printed at the end, overall and per operation.
+Uses only the standard library, so it runs anywhere the apps do.
+
+Examples, after starting the backend in each mode on port 5000:
+
+    python benchmarks/loadgen.py --url http://localhost:5000 --concurrency 128 \\
+        --path /api/tasks?limit=50 --seed 1000
+    python benchmarks/loadgen.py --url http://localhost:5000 --target backend --mix mixed --seed 1000
+
+benchmarks/run.py starts the servers itself and compares runs against a
+saved baseline.
+"""
+import argparse
+import asyncio
+import collections
+import itertools
+import json
+import random
+import statistics
+import sys
+import time
+import urllib.request
+from urllib.parse import urlencode, urlsplit
+
+OPERATIONS = ('list', 'get', 'create', 'update', 'toggle', 'delete')
+
+# Named operation weights
+MIXES = {
+    'read': {'list': 40, 'get': 60},
+    'mixed': {'list': 30, 'get': 40, 'create': 10, 'update': 10, 'toggle': 5, 'delete': 5},
+    'write': {'create': 30, 'update': 30, 'toggle': 20, 'delete': 20}
+}
+
+# How each target serves each operation: (method, path, body encoding).
+# Paths are formatted with the task id; bodies are 'json', 'form' or None.
+TARGET_ROUTES = {
+    'monolith': {
+        'list': ('GET', '/api/tasks', None),
+        'get': ('GET', '/edit_task/{id}', None),
+        'create': ('POST', '/api/tasks', 'json'),
+        'update': ('PUT', '/api/tasks/{id}', 'json'),
+        'toggle': ('GET', '/toggle_task/{id}', None),
+        'delete': ('DELETE', '/api/tasks/{id}', None)
+    },
+    'backend': {
+        'list': ('GET', '/api/tasks?limit=50', None),
+        'get': ('GET', '/api/tasks/{id}', None),
+        'create': ('POST', '/api/tasks', 'json'),
+        'update': ('PUT', '/api/tasks/{id}', 'json'),
+        'toggle': ('POST', '/api/tasks/{id}/toggle', None),
+        'delete': ('DELETE', '/api/tasks/{id}', None)
+    },
+    'frontend': {
+        'list': ('GET', '/', None),
+        'get': ('GET', '/edit_task/{id}', None),
+        'create': ('POST', '/add_task', 'form'),
+        'update': ('POST', '/edit_task/{id}', 'form'),
+        'toggle': ('GET', '/toggle_task/{id}', None),
+        'delete': ('GET', '/delete_task/{id}', None)
+    }
+}
+PRIORITIES = ('low', 'medium', 'high')
+
+
+def parse_mix(value):
+    """A preset name from MIXES, or weights like ``list=3,get=1``."""
+    if value in MIXES:
+        return dict(MIXES[value])
+    mix = {}
+    for part in value.split(','):
+        operation, _, weight = part.partition('=')
+        if operation not in OPERATIONS:
+            raise ValueError(f'Unknown operation {operation!r}; expected one of {", ".join(OPERATIONS)}')
+        mix[operation] = float(weight or 1)
+    return mix
+
+
+def post_json(url, payload):
+    request = urllib.request.Request(
+        url, data=json.dumps(payload).encode(), headers={'Content-Type': 'application/json'}, method='POST'
+    )
+    with urllib.request.urlopen(request) as response:
+        return json.load(response)
+
+
+def seed_tasks(base_url, count, batch=True):
+    """Create ``count`` tasks; returns their ids.
+
+    Uses the backend's batch endpoint, or one POST per task for servers
+    without it (the monolith).
+    """
+    ids = []
+    if not batch:
+        for i in range(count):
+            task = post_json(f'{base_url}/api/tasks',
+                             {'title': f'Benchmark task {i}', 'priority': PRIORITIES[i % 3]})
+            ids.append(task['id'])
+        return ids
+    for start in range(0, count, 500):
+        operations = [
+            {'op': 'create', 'title': f'Benchmark task {i}', 'priority': PRIORITIES[i % 3]}
+            for i in range(start, min(start + 500, count))
+        ]
+        results = post_json(f'{base_url}/api/tasks/batch', {'operations': operations})['results']
+        ids.extend(result['task']['id'] for result in results)
+    return ids
+
+
+class PathWorkload:
+    """GET requests cycling through fixed paths."""
+
+    def __init__(self, paths):
+        self._paths = itertools.cycle(paths)
+
+    def next_request(self, rng):
+        return 'get', 'GET', next(self._paths), None, None
+
+    def completed(self, operation, status, body):
+        pass
+
+
+class MixWorkload:
+    """Requests drawn from weighted task operations against one target.
+
+    Reads, updates and toggles pick from ``ids``. Deletes consume
+    ``disposable`` ids, topped up with the ids of tasks the run creates
+    when the target returns them; once none are left, a delete is sent
+    as a create instead.
+    """
+
+    def __init__(self, target, mix, ids, disposable=()):
+        self.routes = TARGET_ROUTES[target]
+        self.operations = list(mix)
+        self.weights = [mix[operation] for operation in self.operations]
+        self.ids = list(ids)
+        self.disposable = collections.deque(disposable)
+        if not self.ids and any(operation in mix for operation in ('get', 'update', 'toggle')):
+            raise ValueError('Seed tasks for get, update and toggle operations')
+
+    def next_request(self, rng):
+        operation = rng.choices(self.operations, self.weights)[0]
+        if operation == 'delete':
+            if self.disposable:
+                task_id = self.disposable.popleft()
+            else:
+                operation, task_id = 'create', None
+        else:
+            task_id = rng.choice(self.ids) if self.ids else None
+        method, path, encoding = self.routes[operation]
+        fields = {'title': f'Benchmark {operation} {rng.randrange(10 ** 6)}',
+                  'description': 'Written by the load generator', 'priority': rng.choice(PRIORITIES)}
+        if encoding == 'json':
+            body, content_type = json.dumps(fields).encode(), 'application/json'
+        elif encoding == 'form':
+            body, content_type = urlencode(fields).encode(), 'application/x-www-form-urlencoded'
+        else:
+            body = content_type = None
+        return operation, method, path.format(id=task_id), body, content_type
+
+    def completed(self, operation, status, body):
+        if operation == 'create' and status == 201:
+            try:
+                self.disposable.append(json.loads(body)['id'])
+            except (ValueError, KeyError, TypeError):
+                pass
+
+
+async def read_response(reader):
+    """Read one HTTP/1.1 response; returns (status code, keep-alive, body)."""
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError('Server closed the connection')
+    status = int(status_line.split()[1])
+    length = None
+    chunked = False
+    keep_alive = True
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        name = name.strip().lower()
+        if name == 'content-length':
+            length = int(value)
+        elif name == 'transfer-encoding' and 'chunked' in value.lower():
+            chunked = True
+        elif name == 'connection' and 'close' in value.lower():
+            keep_alive = False
+    body = b''
+    if chunked:
+        chunks = []
+        while True:
+            size = int((await reader.readline()).split(b';')[0], 16)
+            chunks.append((await reader.readexactly(size + 2))[:size])
+            if size == 0:
+                break
+        body = b''.join(chunks)
+    elif length:
+        body = await reader.readexactly(length)
+    return status, keep_alive, body
+
+
+async def client(host, port, workload, rng, deadline, samples, errors):
+    reader, writer = await asyncio.open_connection(host, port)
+    while time.perf_counter() < deadline:
+        operation, method, path, body, content_type = workload.next_request(rng)
+        headers = f'{method} {path} HTTP/1.1\r\nHost: {host}\r\nConnection: keep-alive\r\n'
+        if body is not None:
+            headers += f'Content-Type: {content_type}\r\nContent-Length: {len(body)}\r\n'
+        elif method in ('POST', 'PUT'):
+            headers += 'Content-Length: 0\r\n'
+        start = time.perf_counter()
+        try:
+            writer.write(headers.encode() + b'\r\n' + (body or b''))
+            status, keep_alive, response_body = await read_response(reader)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            errors.append((operation, 'connection'))
+            keep_alive = False
+        else:
+            samples.append((operation, time.perf_counter() - start))
+            if status >= 400:
+                errors.append((operation, status))
+            workload.completed(operation, status, response_body)
+        if not keep_alive:
+            # Servers without keep-alive (e.g. gunicorn sync workers) close
+            # after each response; reconnecting is part of the latency
+            writer.close()
+            reader, writer = await asyncio.open_connection(host, port)
+    writer.close()
+
+
+async def run(base_url, workload, concurrency, duration, seed=0):
+    """Drive ``workload`` for ``duration`` seconds; returns (samples, errors, elapsed)."""
+    parts = urlsplit(base_url)
+    host, port = parts.hostname, parts.port or 80
+    samples, errors = [], []
+    deadline = time.perf_counter() + duration
+    started = time.perf_counter()
+    await asyncio.gather(*[
+        client(host, port, workload, random.Random(seed + i), deadline, samples, errors)
+        for i in range(concurrency)
+    ])
+    return samples, errors, time.perf_counter() - started
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(int(len(sorted_values) * fraction), len(sorted_values) - 1)]
+
+
+def latency_summary(latencies):
+    latencies = sorted(latencies)
+    return {
+        'mean': round(statistics.fmean(latencies) * 1000, 2) if latencies else 0.0,
+        'p50': round(percentile(latencies, 0.50) * 1000, 2),
+        'p95': round(percentile(latencies, 0.95) * 1000, 2),
+        'p99': round(percentile(latencies, 0.99) * 1000, 2)
+    }
+
+
+def summarize(samples, errors, elapsed, concurrency):
+    by_operation = collections.defaultdict(list)
+    for operation, seconds in samples:
+        by_operation[operation].append(seconds)
+    errors_by_operation = collections.Counter(operation for operation, _ in errors)
+    return {
+        'concurrency': concurrency,
+        'requests': len(samples),
+        'errors': len(errors),
+        'requests_per_second': round(len(samples) / elapsed, 1),
+        'latency_ms': latency_summary([seconds for _, seconds in samples]),
+        'operations': {
+            operation: {
+                'requests': len(latencies),
+                'errors': errors_by_operation[operation],
+                'latency_ms': latency_summary(latencies)
+            }
+            for operation, latencies in sorted(by_operation.items())
+        }
+    }
+
+
+def format_summary(summary):
+    latency = summary['latency_ms']
+    lines = [
+        f"{summary['requests']} requests, {summary['errors']} errors, "
+        f"{summary['requests_per_second']} req/s at concurrency {summary['concurrency']}",
+        f"latency ms: mean {latency['mean']}  p50 {latency['p50']}  "
+        f"p95 {latency['p95']}  p99 {latency['p99']}"
+    ]
+    if len(summary['operations']) > 1:
+        for operation, stats in summary['operations'].items():
+            latency = stats['latency_ms']
+            lines.append(f"  {operation:<7} {stats['requests']:>7} requests {stats['errors']:>5} errors  "
+                         f"p50 {latency['p50']}  p95 {latency['p95']}  p99 {latency['p99']}")
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', default='http://localhost:5000', help='server base URL')
+    parser.add_argument('--path', action='append', dest='paths',
+                        help='request path, repeatable (default /api/tasks?limit=50)')
+    parser.add_argument('--target', choices=sorted(TARGET_ROUTES), default='backend',
+                        help='server the --mix requests are shaped for')
+    parser.add_argument('--mix', type=parse_mix,
+                        help=f'operation mix instead of --path: {", ".join(MIXES)} or weights like list=3,get=1')
+    parser.add_argument('--seed-url', help='backend URL to seed through (default --url; '
+                                           'set it to the backend when --target is frontend)')
+    parser.add_argument('--concurrency', type=int, default=64, help='simultaneous connections')
+    parser.add_argument('--duration', type=float, default=15, help='seconds to run')
+    parser.add_argument('--warmup', type=float, default=2, help='seconds to run before measuring')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='create this many tasks first; without --mix, add GET /api/tasks/<id> for each')
+    parser.add_argument('--disposable', type=int, default=200,
+                        help='extra tasks to create for --mix deletes to remove')
+    parser.add_argument('--json', action='store_true', help='print the summary as JSON')
+    args = parser.parse_args(argv)
+
+    base_url = args.url.rstrip('/')
+    seed_url = (args.seed_url or args.url).rstrip('/')
+    batch = args.target != 'monolith'
+    ids = seed_tasks(seed_url, args.seed, batch) if args.seed else []
+    if args.mix:
+        disposable = seed_tasks(seed_url, args.disposable, batch) if 'delete' in args.mix else []
+        workload = MixWorkload(args.target, args.mix, ids, disposable)
+    else:
+        workload = PathWorkload((args.paths or ['/api/tasks?limit=50']) + [f'/api/tasks/{task_id}' for task_id in ids])
+
+    if args.warmup:
+        asyncio.run(run(base_url, workload, args.concurrency, args.warmup))
+    summary = summarize(*asyncio.run(run(base_url, workload, args.concurrency, args.duration)),
+                        args.concurrency)
+
+    print(json.dumps(summary, indent=2) if args.json else format_summary(summary))
+    return 1 if summary['errors'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,93 @@
+"""Bytes and CPU per task list response, by encoding and compression.
+
+Encodes pages of synthetic tasks shaped like the backend's (all fields,
+dates as the API formats them) as plain JSON and in the columnar form,
+then compresses each with every coding compression.py can produce.
+Reports the body size and the CPU time to encode and to compress one
+response, averaged over ``--repeat`` runs. Runs in-process; no server or
+database needed.
+
+    python benchmarks/payloads.py --sizes 50,500 --repeat 200
+"""
+import argparse
+import os
+import random
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend-api'))
+
+from flask import Flask  # noqa: E402
+
+from compression import available_encodings, compress  # noqa: E402
+from json_provider import FastJSONProvider, to_columnar  # noqa: E402
+
+PRIORITIES = ('low', 'medium', 'high')
+WORDS = 'review deploy update write fix check plan test draft call email report budget meeting'.split()
+
+
+def make_tasks(count, rng):
+    start = datetime(2024, 1, 1)
+    tasks = []
+    for i in range(count):
+        created = start + timedelta(minutes=rng.randrange(500000))
+        tasks.append({
+            'id': str(uuid.UUID(int=rng.getrandbits(128), version=4)),
+            'title': ' '.join(rng.choices(WORDS, k=rng.randint(2, 6))).capitalize(),
+            'description': ' '.join(rng.choices(WORDS, k=rng.randint(0, 25))),
+            'priority': rng.choice(PRIORITIES),
+            'completed': rng.random() < 0.4,
+            'created_at': created.isoformat(' ', 'minutes'),
+            'updated_at': (created + timedelta(minutes=rng.randrange(5000))).isoformat(' ', 'minutes'),
+            'version': rng.randint(1, 5)
+        })
+    return tasks
+
+
+def cpu_per_call(function, repeat):
+    """Mean CPU seconds per call of ``function``."""
+    started = time.process_time()
+    for _ in range(repeat):
+        function()
+    return (time.process_time() - started) / repeat
+
+
+def measure(tasks, repeat, provider):
+    rows = []
+    payloads = {
+        'json': lambda: provider.dumps_compact({'tasks': tasks, 'next_cursor': None}),
+        'columnar': lambda: provider.dumps_compact({'tasks': to_columnar(tasks), 'next_cursor': None})
+    }
+    for encoding, encode in payloads.items():
+        body = encode()
+        encode_seconds = cpu_per_call(encode, repeat)
+        rows.append((encoding, 'identity', len(body), encode_seconds, 0.0))
+        for coding in available_encodings():
+            compressed = compress(coding, body)
+            compress_seconds = cpu_per_call(lambda: compress(coding, body), repeat)
+            rows.append((encoding, coding, len(compressed), encode_seconds, compress_seconds))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default='50,500', help='comma-separated tasks per response')
+    parser.add_argument('--repeat', type=int, default=200, help='runs averaged for CPU times')
+    args = parser.parse_args(argv)
+
+    provider = FastJSONProvider(Flask(__name__))
+    rng = random.Random(0)
+    print(f"{'tasks':>6} {'encoding':<9} {'coding':<9} {'bytes':>9} {'vs json':>8} "
+          f"{'encode us':>10} {'compress us':>12}")
+    for size in (int(value) for value in args.sizes.split(',')):
+        rows = measure(make_tasks(size, rng), args.repeat, provider)
+        plain = rows[0][2]
+        for encoding, coding, length, encode_seconds, compress_seconds in rows:
+            print(f'{size:>6} {encoding:<9} {coding:<9} {length:>9} {length / plain:>8.0%} '
+                  f'{encode_seconds * 1e6:>10.0f} {compress_seconds * 1e6:>12.0f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,271 @@
+"""Benchmark suite: start each server locally, drive request mixes, compare with a baseline.
+
+For every target and mix, the suite starts fresh servers on free local
+ports, seeds ``--seed`` tasks, warms up, then measures with loadgen.py:
+
+- ``monolith``: app.py under gunicorn, sharing a TASK_STORE_PATH log
+  between workers
+- ``backend``: backend-api/start.sh (``--server-mode`` sync or async)
+- ``frontend``: frontend/app.py under gunicorn, in front of a backend
+
+The backend uses a new SQLite file per run unless ``--database-url``
+names a Postgres database. That database must be a scratch one, because
+every task in it is deleted before each run.
+
+Results are written to ``--output`` as JSON. With ``--save-baseline``
+they also become the baseline. Otherwise, if a baseline exists, the run
+fails (exit status 1) when any result's throughput drops, or its p95
+latency rises, by more than ``--threshold``. Baselines only compare
+fairly on the machine and settings that produced them.
+
+    python benchmarks/run.py --targets backend,frontend --mixes read,mixed --duration 10
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from datetime import datetime
+
+import loadgen
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCHMARKS_DIR = os.path.join(ROOT, 'benchmarks')
+TARGETS = ('monolith', 'backend', 'frontend')
+DEFAULT_BASELINE = os.path.join(BENCHMARKS_DIR, 'baseline.json')
+DEFAULT_OUTPUT = os.path.join(BENCHMARKS_DIR, 'results.json')
+STARTUP_SECONDS = 30
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class Server:
+    """A server process group, stopped together on exit."""
+
+    def __init__(self, name, command, cwd, env, port, log_dir):
+        self.name = name
+        self.url = f'http://127.0.0.1:{port}'
+        self.log_path = os.path.join(log_dir, f'{name}.log')
+        with open(self.log_path, 'wb') as log:
+            self.process = subprocess.Popen(
+                command, cwd=cwd, env={**os.environ, **env}, stdout=log, stderr=subprocess.STDOUT,
+                start_new_session=True
+            )
+
+    def wait_healthy(self):
+        deadline = time.monotonic() + STARTUP_SECONDS
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                break
+            try:
+                with urllib.request.urlopen(f'{self.url}/health', timeout=2) as response:
+                    if response.status == 200:
+                        return
+            except OSError:
+                time.sleep(0.2)
+        raise RuntimeError(f'{self.name} did not become healthy; see {self.log_path}')
+
+    def stop(self):
+        try:
+            os.killpg(self.process.pid, signal.SIGTERM)
+            self.process.wait(10)
+        except ProcessLookupError:
+            pass
+        except subprocess.TimeoutExpired:
+            os.killpg(self.process.pid, signal.SIGKILL)
+            self.process.wait()
+
+
+def gunicorn_command(port, args, *extra):
+    return [sys.executable, '-m', 'gunicorn', *extra, '--bind', f'127.0.0.1:{port}',
+            '--workers', str(args.workers), '--worker-class', 'gthread', '--threads', str(args.threads),
+            'app:app']
+
+
+def reset_database(url):
+    """Delete every task (and change event) so each run starts from the same state."""
+    from sqlalchemy import create_engine, inspect, text
+    engine = create_engine(url)
+    try:
+        tables = set(inspect(engine).get_table_names())
+        with engine.begin() as connection:
+            for table in ('task_events', 'tasks'):
+                if table in tables:
+                    connection.execute(text(f'DELETE FROM {table}'))
+    finally:
+        engine.dispose()
+
+
+def start_backend(args, work_dir):
+    port = free_port()
+    database_url = args.database_url or f'sqlite:///{os.path.join(work_dir, "tasks.db")}'
+    if args.database_url:
+        reset_database(database_url)
+    env = {
+        'PORT': str(port), 'WEB_CONCURRENCY': str(args.workers), 'GUNICORN_THREADS': str(args.threads),
+        'SERVER_MODE': args.server_mode, 'DATABASE_URL': database_url,
+        'PROMETHEUS_MULTIPROC_DIR': os.path.join(work_dir, 'prometheus-backend')
+    }
+    return Server('backend', ['sh', './start.sh'], os.path.join(ROOT, 'backend-api'), env, port, work_dir)
+
+
+def start_servers(target, args, work_dir):
+    """Start ``target`` and what it depends on; returns (servers, URL to load, URL to seed)."""
+    if target == 'monolith':
+        port = free_port()
+        env = {'TASK_STORE_PATH': os.path.join(work_dir, 'tasks.log')}
+        servers = [Server('monolith', gunicorn_command(port, args), ROOT, env, port, work_dir)]
+        url = seed_url = servers[0].url
+    elif target == 'backend':
+        servers = [start_backend(args, work_dir)]
+        url = seed_url = servers[0].url
+    else:
+        backend = start_backend(args, work_dir)
+        port = free_port()
+        env = {'BACKEND_API_URL': backend.url,
+               'PROMETHEUS_MULTIPROC_DIR': os.path.join(work_dir, 'prometheus-frontend')}
+        frontend = Server('frontend', gunicorn_command(port, args, '--config', 'gunicorn.conf.py'),
+                          os.path.join(ROOT, 'frontend'), env, port, work_dir)
+        servers = [backend, frontend]
+        url, seed_url = frontend.url, backend.url
+    try:
+        for server in servers:
+            server.wait_healthy()
+    except Exception:
+        for server in servers:
+            server.stop()
+        raise
+    return servers, url, seed_url
+
+
+def run_benchmark(target, mix, args):
+    with tempfile.TemporaryDirectory(prefix=f'bench-{target}-') as work_dir:
+        servers, url, seed_url = start_servers(target, args, work_dir)
+        try:
+            batch = target != 'monolith'
+            ids = loadgen.seed_tasks(seed_url, args.seed, batch)
+            disposable = loadgen.seed_tasks(seed_url, args.disposable, batch) if 'delete' in mix else []
+            workload = loadgen.MixWorkload(target, mix, ids, disposable)
+            if args.warmup:
+                asyncio.run(loadgen.run(url, workload, args.concurrency, args.warmup, args.random_seed))
+            return loadgen.summarize(
+                *asyncio.run(loadgen.run(url, workload, args.concurrency, args.duration, args.random_seed)),
+                args.concurrency
+            )
+        finally:
+            for server in reversed(servers):
+                server.stop()
+
+
+def compare(baseline, results, threshold):
+    """Describe each result that regressed past ``threshold`` against ``baseline``."""
+    regressions = []
+    for key, current in results.items():
+        previous = baseline.get(key)
+        if previous is None:
+            continue
+        if current['requests_per_second'] < previous['requests_per_second'] * (1 - threshold):
+            regressions.append(f"{key}: {current['requests_per_second']} req/s, "
+                               f"baseline {previous['requests_per_second']}")
+        if current['latency_ms']['p95'] > previous['latency_ms']['p95'] * (1 + threshold):
+            regressions.append(f"{key}: p95 {current['latency_ms']['p95']} ms, "
+                               f"baseline {previous['latency_ms']['p95']}")
+        if current['errors'] > previous['errors']:
+            regressions.append(f"{key}: {current['errors']} errors, baseline {previous['errors']}")
+    return regressions
+
+
+def settings(args):
+    return {
+        'concurrency': args.concurrency, 'duration': args.duration, 'seed': args.seed,
+        'workers': args.workers, 'threads': args.threads, 'server_mode': args.server_mode,
+        'database': 'postgresql' if args.database_url else 'sqlite'
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--targets', default=','.join(TARGETS),
+                        help=f'comma-separated servers to benchmark: {", ".join(TARGETS)}')
+    parser.add_argument('--mixes', default='read,mixed,write',
+                        help=f'comma-separated presets ({", ".join(loadgen.MIXES)}) or name:op=weight+op=weight')
+    parser.add_argument('--concurrency', type=int, default=32, help='simultaneous connections')
+    parser.add_argument('--duration', type=float, default=10, help='seconds to measure each run')
+    parser.add_argument('--warmup', type=float, default=2, help='seconds to run before measuring')
+    parser.add_argument('--seed', type=int, default=500, help='tasks created before each run')
+    parser.add_argument('--disposable', type=int, default=200, help='extra tasks for deletes to remove')
+    parser.add_argument('--random-seed', type=int, default=0, help='seed for choosing operations')
+    parser.add_argument('--workers', type=int, default=2, help='worker processes per server')
+    parser.add_argument('--threads', type=int, default=8, help='threads per gunicorn worker')
+    parser.add_argument('--server-mode', choices=('sync', 'async'), default='sync', help='backend SERVER_MODE')
+    parser.add_argument('--database-url', help='scratch Postgres database for the backend (default SQLite)')
+    parser.add_argument('--output', default=DEFAULT_OUTPUT, help='where to write this run\'s results')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='baseline results to compare with')
+    parser.add_argument('--save-baseline', action='store_true', help='store this run as the baseline')
+    parser.add_argument('--threshold', type=float, default=0.15,
+                        help='allowed throughput drop or p95 rise, as a fraction')
+    args = parser.parse_args(argv)
+
+    targets = [target.strip() for target in args.targets.split(',') if target.strip()]
+    unknown = set(targets) - set(TARGETS)
+    if unknown:
+        parser.error(f'unknown targets: {", ".join(sorted(unknown))}')
+    mixes = {}
+    for spec in args.mixes.split(','):
+        name, _, weights = spec.partition(':')
+        try:
+            mixes[name] = loadgen.parse_mix(weights.replace('+', ',') if weights else name)
+        except ValueError as e:
+            parser.error(str(e))
+
+    results = {}
+    for target in targets:
+        for name, mix in mixes.items():
+            key = f'{target}/{name}'
+            print(f'== {key}', flush=True)
+            results[key] = run_benchmark(target, mix, args)
+            print(loadgen.format_summary(results[key]), flush=True)
+
+    report = {
+        'created_at': datetime.utcnow().isoformat(timespec='seconds'),
+        'machine': {'python': platform.python_version(), 'platform': platform.platform(),
+                    'cpus': os.cpu_count()},
+        'settings': settings(args),
+        'results': results
+    }
+    with open(args.output, 'w') as output:
+        json.dump(report, output, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, 'w') as baseline:
+            json.dump(report, baseline, indent=2)
+        print(f'Saved baseline to {args.baseline}')
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f'No baseline at {args.baseline}; run with --save-baseline to create one')
+        return 0
+    with open(args.baseline) as baseline_file:
+        baseline = json.load(baseline_file)
+    if baseline.get('settings') != report['settings']:
+        print('Warning: baseline was recorded with different settings:', baseline.get('settings'))
+    regressions = compare(baseline['results'], results, args.threshold)
+    for regression in regressions:
+        print(f'REGRESSION {regression}')
+    if not regressions:
+        print(f'No regressions beyond {args.threshold:.0%} of {args.baseline}')
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
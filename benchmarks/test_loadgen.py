@@ -0,0 +1,63 @@
+import unittest
+import json
+import os
+import random
+import sys
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCHMARKS_DIR)
+
+import loadgen
+import run
+
+
+class LoadgenTestCase(unittest.TestCase):
+    def test_parse_mix(self):
+        self.assertEqual(loadgen.parse_mix('read'), {'list': 40, 'get': 60})
+        self.assertEqual(loadgen.parse_mix('list=3,delete'), {'list': 3.0, 'delete': 1.0})
+        with self.assertRaises(ValueError):
+            loadgen.parse_mix('list=1,explode=2')
+
+    def test_mix_workload_speaks_target_routes(self):
+        workload = loadgen.MixWorkload('frontend', {'update': 1}, ids=[7])
+        operation, method, path, body, content_type = workload.next_request(random.Random(0))
+        self.assertEqual((operation, method, path), ('update', 'POST', '/edit_task/7'))
+        self.assertEqual(content_type, 'application/x-www-form-urlencoded')
+        self.assertIn(b'title=', body)
+
+        workload = loadgen.MixWorkload('backend', {'toggle': 1}, ids=[7])
+        self.assertEqual(workload.next_request(random.Random(0))[1:3], ('POST', '/api/tasks/7/toggle'))
+
+    def test_deletes_use_disposable_then_created_tasks(self):
+        workload = loadgen.MixWorkload('backend', {'delete': 1}, ids=[], disposable=[1])
+        rng = random.Random(0)
+        self.assertEqual(workload.next_request(rng)[:3], ('delete', 'DELETE', '/api/tasks/1'))
+        # Nothing left to delete: fall back to a create, then delete what it made
+        operation, method, path, _, _ = workload.next_request(rng)
+        self.assertEqual((operation, method, path), ('create', 'POST', '/api/tasks'))
+        workload.completed('create', 201, json.dumps({'id': 42}).encode())
+        self.assertEqual(workload.next_request(rng)[2], '/api/tasks/42')
+
+    def test_summarize_breaks_down_by_operation(self):
+        samples = [('get', 0.010)] * 9 + [('list', 0.050)]
+        summary = loadgen.summarize(samples, [('list', 'HTTP 500')], elapsed=2.0, concurrency=4)
+        self.assertEqual(summary['requests_per_second'], 5.0)
+        self.assertEqual(summary['latency_ms']['p50'], 10.0)
+        self.assertEqual(summary['operations']['list']['errors'], 1)
+        self.assertEqual(summary['operations']['get']['requests'], 9)
+
+    def test_compare_flags_regressions_past_threshold(self):
+        def result(rps, p95, errors=0):
+            return {'requests_per_second': rps, 'latency_ms': {'p95': p95}, 'errors': errors}
+
+        baseline = {'backend/read': result(1000, 20), 'frontend/read': result(200, 80)}
+        within = {'backend/read': result(950, 21), 'frontend/read': result(190, 85), 'monolith/read': result(1, 1)}
+        self.assertEqual(run.compare(baseline, within, 0.10), [])
+
+        regressed = run.compare(baseline, {'backend/read': result(800, 30, errors=2)}, 0.10)
+        self.assertEqual(len(regressed), 3)
+        self.assertTrue(all(line.startswith('backend/read') for line in regressed))
+
+
+if __name__ == '__main__':
+    unittest.main()
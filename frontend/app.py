@@ -1,7 +1,21 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify
+from flask import (Flask, render_template, request, redirect, url_for, flash, jsonify,
+                   Response, g, has_request_context)
+from collections import OrderedDict
+from markupsafe import Markup
 import os
+import re
+import threading
+import time
 import requests
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Histogram, generate_latest, multiprocess
+)
 from datetime import datetime
+from backend_client import BackendClient
+from compression import ResponseCompressor
+from event_relay import EventRelay
+from profiling import RequestProfiler, is_admin
+from read_cache import NOT_MODIFIED, ReadCache
 
 app = Flask(__name__)
 app.secret_key = os.environ.get('SECRET_KEY', 'dev-secret-key-change-in-production')
@@ -9,23 +23,269 @@ app.secret_key = os.environ.get('SECRET_KEY', 'dev-secret-key-change-in-producti
 # Backend API URL from environment variable
 BACKEND_API_URL = os.environ.get('BACKEND_API_URL', 'http://backend-api:5000')
 
+# Prometheus metrics. With several gunicorn workers, gunicorn.conf.py
+# points PROMETHEUS_MULTIPROC_DIR at a directory they share and /metrics
+# reports the sum over all of them.
+metrics_registry = CollectorRegistry()
+REQUEST_DURATION = Histogram(
+    'http_request_duration_seconds', 'Time until the response starts, by route',
+    ['method', 'route', 'status'], registry=metrics_registry
+)
+BACKEND_DURATION = Histogram(
+    'backend_request_duration_seconds', 'Backend API call latency, by path template',
+    ['method', 'path', 'status'], registry=metrics_registry
+)
+BACKEND_READS = Counter(
+    'backend_cache_reads', 'Backend reads by how the read cache answered them',
+    ['result'], registry=metrics_registry
+)
+# Task ids in backend paths, replaced so each route is one label value
+TASK_ID_SEGMENT = re.compile(r'^/api/tasks/(?!(?:stats|search|export|batch|events)$)[^/]+')
 
-def get_tasks():
-    """Fetch all tasks from backend API."""
+
+# Opt-in request profiles, listed at /admin/profiles
+profiler = RequestProfiler()
+
+# gzip/brotli/zstd for pages and responses of COMPRESSION_MIN_BYTES or more
+compressor = ResponseCompressor()
+
+
+def observe_backend_call(method, path, status, seconds):
+    path = TASK_ID_SEGMENT.sub('/api/tasks/<id>', path)
+    BACKEND_DURATION.labels(method, path, status).observe(seconds)
+    if has_request_context() and 'profile' in g:
+        g.backend_calls.append({'method': method, 'path': path, 'status': status,
+                                'duration_ms': round(seconds * 1000, 3)})
+
+
+# Shared keep-alive client for this worker; pool and retry settings come
+# from the environment / ConfigMap
+backend = BackendClient(
+    BACKEND_API_URL,
+    timeout=float(os.environ.get('BACKEND_TIMEOUT', 5)),
+    pool_size=int(os.environ.get('BACKEND_POOL_SIZE', 10)),
+    retries=int(os.environ.get('BACKEND_RETRIES', 2)),
+    backoff=float(os.environ.get('BACKEND_RETRY_BACKOFF', 0.1)),
+    failure_threshold=int(os.environ.get('BACKEND_CIRCUIT_FAILURES', 5)),
+    reset_timeout=float(os.environ.get('BACKEND_CIRCUIT_RESET_SECONDS', 10)),
+    observer=observe_backend_call
+)
+
+# Number of tasks shown per page
+TASKS_PAGE_SIZE = int(os.environ.get('TASKS_PAGE_SIZE', 50))
+
+# Task fields each page renders; the backend reads and sends only these.
+# The index also needs version and updated_at to key cached task cards.
+INDEX_FIELDS = 'id,title,description,priority,completed,created_at,updated_at,version'
+EDIT_FIELDS = 'id,title,description,priority'
+
+# Local copies of backend list pages and stats, keyed by path and query.
+# Concurrent identical reads share one backend call, copies are reused for
+# a short TTL and then revalidated by ETag, and a recent copy stands in
+# while the backend is slow or down. This worker's writes invalidate them.
+read_cache = ReadCache(
+    ttl=float(os.environ.get('BACKEND_CACHE_TTL_SECONDS', 1)),
+    stale_seconds=float(os.environ.get('BACKEND_CACHE_STALE_SECONDS', 5)),
+    stale_if_error=float(os.environ.get('BACKEND_CACHE_STALE_IF_ERROR_SECONDS', 300)),
+    max_entries=int(os.environ.get('MAX_CACHED_PAGES', 64)),
+    observer=lambda result: BACKEND_READS.labels(result).inc()
+)
+
+# Upstream read timeout for the change feed; longer than the backend's
+# heartbeat interval so an idle stream isn't mistaken for a dead one
+EVENTS_READ_TIMEOUT = float(os.environ.get('EVENTS_READ_TIMEOUT', 45))
+# Open /events streams per worker; each holds a thread, so keep this below
+# the gunicorn thread count to leave threads for pages
+EVENTS_MAX_STREAMS = int(os.environ.get('EVENTS_MAX_STREAMS', 6))
+# Streams end after this long and the browser reconnects, handing threads back
+EVENTS_STREAM_SECONDS = float(os.environ.get('EVENTS_STREAM_SECONDS', 300))
+# Quiet time after a change before tabs get fresh stats, shared by a burst
+EVENTS_STATS_DELAY_SECONDS = float(os.environ.get('EVENTS_STATS_DELAY_SECONDS', 0.5))
+
+# Backend cookie that sends a client's reads to the primary, past the
+# backend's cache, for a few seconds after it writes. The backend sets it
+# on write responses; it is relayed to that user's browser and forwarded
+# with that user's reads only.
+PRIMARY_UNTIL_COOKIE = 'db_primary_until'
+
+# Task list encoding naming each key once (backend-api/json_provider.py)
+COLUMNAR_MIMETYPE = 'application/vnd.tasks.columnar+json'
+
+EMPTY_STATS = {'total': 0, 'completed': 0, 'pending': 0, 'by_priority': {}}
+
+# Rendered task cards, one per task id, stamped with the version and
+# updated_at they were rendered from. A card is rendered again only once
+# its task changes; updated_at alone is kept to the minute, so the
+# version is part of the stamp.
+FRAGMENT_CACHE_SIZE = int(os.environ.get('FRAGMENT_CACHE_SIZE', 4096))
+_fragment_cache = OrderedDict()
+_fragment_cache_lock = threading.Lock()
+fragment_stats = {'hits': 0, 'misses': 0}
+
+# Compile every template once at startup instead of on first use; in
+# production Jinja then serves them from memory without checking the files
+for template_name in app.jinja_env.list_templates():
+    app.jinja_env.get_template(template_name)
+TASK_TEMPLATE = app.jinja_env.get_template('_task.html')
+
+
+def primary_cookies():
+    """The current user's read-your-writes cookie to forward to the backend, or None."""
+    value = request.cookies.get(PRIMARY_UNTIL_COOKIE) if has_request_context() else None
     try:
-        response = requests.get(f'{BACKEND_API_URL}/api/tasks', timeout=5)
+        recent = value is not None and float(value) > time.time()
+    except ValueError:
+        recent = False
+    return {PRIMARY_UNTIL_COOKIE: value} if recent else None
+
+
+def relay_primary_cookie(response):
+    """Pass the read-your-writes cookie from a backend write response on to this user."""
+    value = response.cookies.get(PRIMARY_UNTIL_COOKIE)
+    if value:
+        g.primary_until = value
+
+
+@app.after_request
+def set_primary_cookie(response):
+    if 'primary_until' in g:
+        try:
+            max_age = max(int(float(g.primary_until) - time.time()) + 1, 1)
+        except ValueError:
+            return response
+        response.set_cookie(PRIMARY_UNTIL_COOKIE, g.primary_until, max_age=max_age, httponly=True)
+    return response
+
+
+def fetch_json(path, params=None, fresh=False):
+    """GET a backend resource through the worker's read cache.
+
+    ``fresh`` skips cached copies, for reads that must reflect a change
+    just announced by the backend. A user who wrote moments ago also reads
+    fresh, with their read-your-writes cookie, so they see their change.
+    Task lists are fetched in the columnar encoding, which is smaller, and
+    turned back into dicts here.
+    """
+    key = (path, tuple(sorted((params or {}).items())))
+    cookies = primary_cookies()
+
+    def load(etag):
+        headers = {'Accept': f'{COLUMNAR_MIMETYPE}, application/json;q=0.9'}
+        if etag:
+            headers['If-None-Match'] = etag
+        response = backend.get(path, params=params, headers=headers, cookies=cookies)
+        if response.status_code == 304 and etag:
+            return etag, NOT_MODIFIED
         response.raise_for_status()
-        return response.json()
-    except requests.exceptions.RequestException as e:
-        print(f"Error fetching tasks: {e}")
-        return []
+        data = response.json()
+        if response.headers.get('Content-Type', '').startswith(COLUMNAR_MIMETYPE):
+            table = data['tasks']
+            data['tasks'] = [dict(zip(table['columns'], row)) for row in table['rows']]
+        return response.headers.get('ETag'), data
+
+    return read_cache.get(key, load, fresh=fresh or cookies is not None)
+
+
+@app.template_global()
+def render_task(task):
+    """A task's card HTML, from the fragment cache while the task is unchanged."""
+    stamp = (task.get('version'), task.get('updated_at'))
+    with _fragment_cache_lock:
+        cached = _fragment_cache.get(task['id'])
+        if cached and cached[0] == stamp:
+            _fragment_cache.move_to_end(task['id'])
+            fragment_stats['hits'] += 1
+            return cached[1]
+        fragment_stats['misses'] += 1
+
+    html = Markup(TASK_TEMPLATE.render(task=task))
+    with _fragment_cache_lock:
+        _fragment_cache[task['id']] = (stamp, html)
+        _fragment_cache.move_to_end(task['id'])
+        while len(_fragment_cache) > FRAGMENT_CACHE_SIZE:
+            _fragment_cache.popitem(last=False)
+    return html
+
+
+def fetch_index_page(cursor=None):
+    """Task stats and one page of tasks, starting at ``cursor``."""
+    params = {'limit': TASKS_PAGE_SIZE, 'fields': INDEX_FIELDS}
+    if cursor:
+        params['cursor'] = cursor
+    return fetch_json('/api/tasks/stats'), fetch_json('/api/tasks', params)
+
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    trigger = profiler.trigger(request.headers)
+    if trigger:
+        g.backend_calls = []
+        g.profile = (trigger, profiler.start())
+
+
+@app.after_request
+def record_request_metrics(response):
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    seconds = time.perf_counter() - g.request_started
+    REQUEST_DURATION.labels(request.method, route, response.status_code).observe(seconds)
+    if 'profile' in g:
+        trigger, session = g.pop('profile')
+        entry = profiler.finish(
+            session, trigger=trigger, method=request.method, path=request.full_path.rstrip('?'),
+            status=response.status_code, duration_ms=round(seconds * 1000, 3),
+            backend_calls=g.backend_calls
+        )
+        response.headers['X-Profile-Id'] = str(entry['id'])
+    return response
+
+
+@app.after_request
+def compress_response(response):
+    # Registered after record_request_metrics, so it runs before it and is timed
+    return compressor.apply(request, response)
 
 
 @app.route('/')
 def index():
-    """Main page with task list."""
-    tasks = get_tasks()
-    return render_template('index.html', tasks=tasks)
+    """Main page with task stats and one page of tasks."""
+    cursor = request.args.get('cursor')
+    try:
+        stats, page = fetch_index_page(cursor)
+    except requests.exceptions.RequestException as e:
+        print(f"Error fetching tasks: {e}")
+        stats, page = EMPTY_STATS, {'tasks': [], 'next_cursor': None}
+    return render_template('index.html', tasks=page['tasks'], stats=stats,
+                           cursor=cursor, next_cursor=page['next_cursor'])
+
+
+@app.route('/task_fragments', methods=['POST'])
+def task_fragments():
+    """What changed on one page of tasks since the browser rendered it.
+
+    Takes ``{"cursor": ..., "versions": {task id: version}}`` for the
+    cards on the page. Returns the page's task ids in order, card HTML for
+    the tasks that are new or changed only, and fresh stats.
+    """
+    data = request.get_json(silent=True) or {}
+    versions = data.get('versions')
+    if not isinstance(versions, dict):
+        return jsonify({'error': 'versions must map task ids to versions'}), 400
+    try:
+        stats, page = fetch_index_page(data.get('cursor'))
+    except requests.exceptions.RequestException as e:
+        return jsonify({'error': f'Tasks unavailable: {e}'}), 503
+
+    changed = {
+        task['id']: render_task(task) for task in page['tasks']
+        if versions.get(task['id']) != str(task.get('version'))
+    }
+    return jsonify({
+        'ids': [task['id'] for task in page['tasks']],
+        'changed': changed,
+        'stats': stats,
+        'next_cursor': page['next_cursor']
+    })
 
 
 @app.route('/add_task', methods=['POST'])
@@ -40,15 +300,16 @@ def add_task():
         return redirect(url_for('index'))
     
     try:
-        response = requests.post(
-            f'{BACKEND_API_URL}/api/tasks',
+        response = backend.post(
+            '/api/tasks',
             json={
                 'title': title,
                 'description': description,
                 'priority': priority
-            },
-            timeout=5
+            }
         )
+        read_cache.invalidate()
+        relay_primary_cookie(response)
         response.raise_for_status()
         flash('Task added successfully!', 'success')
     except requests.exceptions.RequestException as e:
@@ -61,20 +322,14 @@ def add_task():
 def toggle_task(task_id):
     """Toggle task completion status."""
     try:
-        # Get current task
-        response = requests.get(f'{BACKEND_API_URL}/api/tasks/{task_id}', timeout=5)
+        # The backend flips the flag atomically and returns the updated task
+        response = backend.post(f'/api/tasks/{task_id}/toggle')
+        read_cache.invalidate()
+        relay_primary_cookie(response)
         response.raise_for_status()
         task = response.json()
         
-        # Toggle completion
-        response = requests.put(
-            f'{BACKEND_API_URL}/api/tasks/{task_id}',
-            json={'completed': not task['completed']},
-            timeout=5
-        )
-        response.raise_for_status()
-        
-        status = 'completed' if not task['completed'] else 'incomplete'
+        status = 'completed' if task['completed'] else 'incomplete'
         flash(f'Task "{task["title"]}" marked as {status}!', 'info')
     except requests.exceptions.RequestException as e:
         flash(f'Error toggling task: {str(e)}', 'error')
@@ -86,17 +341,12 @@ def toggle_task(task_id):
 def delete_task(task_id):
     """Delete a task."""
     try:
-        # Get task first for flash message
-        response = requests.get(f'{BACKEND_API_URL}/api/tasks/{task_id}', timeout=5)
-        if response.status_code == 200:
-            task = response.json()
-            title = task.get('title', 'Task')
-        else:
-            title = 'Task'
-        
-        # Delete task
-        response = requests.delete(f'{BACKEND_API_URL}/api/tasks/{task_id}', timeout=5)
+        # The delete response carries the removed task for the flash message
+        response = backend.delete(f'/api/tasks/{task_id}')
+        read_cache.invalidate()
+        relay_primary_cookie(response)
         response.raise_for_status()
+        title = response.json().get('task', {}).get('title', 'Task')
         
         flash(f'Task "{title}" deleted successfully!', 'success')
     except requests.exceptions.RequestException as e:
@@ -118,15 +368,16 @@ def edit_task(task_id):
             return redirect(url_for('edit_task', task_id=task_id))
         
         try:
-            response = requests.put(
-                f'{BACKEND_API_URL}/api/tasks/{task_id}',
+            response = backend.put(
+                f'/api/tasks/{task_id}',
                 json={
                     'title': title,
                     'description': description,
                     'priority': priority
-                },
-                timeout=5
+                }
             )
+            read_cache.invalidate()
+            relay_primary_cookie(response)
             response.raise_for_status()
             flash('Task updated successfully!', 'success')
             return redirect(url_for('index'))
@@ -135,7 +386,8 @@ def edit_task(task_id):
     
     # GET request - fetch task
     try:
-        response = requests.get(f'{BACKEND_API_URL}/api/tasks/{task_id}', timeout=5)
+        response = backend.get(f'/api/tasks/{task_id}', params={'fields': EDIT_FIELDS},
+                               cookies=primary_cookies())
         response.raise_for_status()
         task = response.json()
         return render_template('edit_task.html', task=task)
@@ -144,22 +396,92 @@ def edit_task(task_id):
         return redirect(url_for('index'))
 
 
+def open_task_events(last_event_id):
+    """Open the backend change feed, resuming after ``last_event_id`` if given."""
+    headers = {'Last-Event-ID': str(last_event_id)} if last_event_id is not None else {}
+    upstream = backend.get('/api/tasks/events', headers=headers, stream=True,
+                           timeout=(backend.timeout, EVENTS_READ_TIMEOUT))
+    upstream.raise_for_status()
+    return upstream
+
+
+def render_change(event_type, task):
+    """What tabs receive for one task change: its id, and its card unless deleted."""
+    change = {'id': task['id']}
+    if event_type != 'deleted':
+        # Runs on the relay thread; the card's url_for() needs a request context
+        with app.test_request_context():
+            change['html'] = render_task(task)
+    return change
+
+
+# One upstream change feed per worker, shared by every open tab
+relay = EventRelay(
+    open_task_events, render_change, lambda: fetch_json('/api/tasks/stats', fresh=True),
+    max_streams=EVENTS_MAX_STREAMS, stats_delay=EVENTS_STATS_DELAY_SECONDS
+)
+
+
+@app.route('/events')
+def task_events():
+    """Relay the backend's task change feed with each task rendered as HTML.
+
+    Tabs share this worker's single upstream stream (see event_relay.py).
+    Counts arrive separately as ``stats`` events, at most one per
+    EVENTS_STATS_DELAY_SECONDS. Past EVENTS_MAX_STREAMS open streams a tab
+    gets a ``busy`` event and reconnects later.
+    """
+    try:
+        last_event_id = int(request.headers.get('Last-Event-ID', ''))
+    except ValueError:
+        last_event_id = None
+    return Response(relay.stream(last_event_id, EVENTS_STREAM_SECONDS),
+                    mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
 @app.route('/health')
 def health_check():
     """Health check endpoint."""
     # Check backend connectivity
     try:
-        response = requests.get(f'{BACKEND_API_URL}/health', timeout=3)
+        response = backend.get('/health', timeout=3)
         backend_status = 'healthy' if response.status_code == 200 else 'unhealthy'
-    except:
+    except requests.exceptions.RequestException:
         backend_status = 'unhealthy'
     
     return jsonify({
         'status': 'healthy',
         'timestamp': datetime.utcnow().isoformat(),
-        'backend': backend_status
+        'backend': backend_status,
+        'backend_client': backend.stats(),
+        'fragment_cache': {**fragment_stats, 'size': len(_fragment_cache)},
+        'read_cache': read_cache.stats(),
+        'events': relay.stats()
     })
 
 
+@app.route('/metrics')
+def metrics():
+    """Prometheus metrics for every worker of this instance."""
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = metrics_registry
+    return Response(generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
+
+
+
+@app.route('/admin/profiles')
+def list_profiles():
+    """Recent request profiles of this worker."""
+    if not profiler.token:
+        return jsonify({'error': 'Not found'}), 404
+    if not is_admin(request.headers, profiler.token):
+        return jsonify({'error': 'Admin token required'}), 403
+    return jsonify({'pid': os.getpid(), 'profiles': profiler.profiles.entries()})
+
+
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=8080, debug=True)
@@ -0,0 +1,173 @@
+import threading
+import time
+from http.cookiejar import DefaultCookiePolicy
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """Raised instead of calling the backend while the circuit is open."""
+
+
+class CircuitBreaker:
+    """Stops calls to a failing backend, then lets one trial call through.
+
+    After ``failure_threshold`` consecutive failures the circuit opens and
+    calls fail fast for ``reset_timeout`` seconds. The next call is a trial:
+    success closes the circuit, failure opens it again.
+    """
+
+    def __init__(self, failure_threshold, reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._opened_at is None:
+                return 'closed'
+            if time.monotonic() - self._opened_at >= self.reset_timeout:
+                return 'half-open'
+            return 'open'
+
+    def allow(self):
+        """Whether a call may go to the backend now."""
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at < self.reset_timeout or self._trial_in_flight:
+                return False
+            self._trial_in_flight = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_in_flight = False
+            if self._opened_at is not None or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+
+
+class RejectAllCookies(DefaultCookiePolicy):
+    """Cookie policy that stores nothing.
+
+    The client is shared by every user of a worker, so a cookie the backend
+    sets in answer to one user's request must not go out with the next
+    user's. Callers forward a user's cookies explicitly with ``cookies=``.
+    """
+
+    def set_ok(self, cookie, request):
+        return False
+
+
+class BackendClient:
+    """Keep-alive HTTP client for backend API calls.
+
+    One instance per worker process shares a pooled ``requests.Session``,
+    so calls reuse TCP connections instead of opening one each. Idempotent
+    calls are retried with exponential backoff on connection errors and
+    502/503/504 responses. A circuit breaker fails calls fast while the
+    backend is down. The session keeps no cookies, since it serves every user
+    of the worker; pass a user's cookies per call (``cookies=``) and read
+    the ones the backend sets from the response.
+
+    If given, ``observer(method, path, status, seconds)`` is called after
+    each call that reached the network, with status ``'error'`` when no
+    response came back.
+    """
+
+    IDEMPOTENT_METHODS = frozenset(['GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'])
+
+    def __init__(self, base_url, timeout=5, pool_size=10, retries=2, backoff=0.1,
+                 failure_threshold=5, reset_timeout=10, observer=None):
+        self.base_url = base_url.rstrip('/')
+        self.observer = observer
+        self.timeout = timeout
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.session = requests.Session()
+        self.session.cookies.set_policy(RejectAllCookies())
+        retry = Retry(
+            total=retries,
+            backoff_factor=backoff,
+            allowed_methods=self.IDEMPOTENT_METHODS,
+            status_forcelist=(502, 503, 504),
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self._stats_lock = threading.Lock()
+        self.requests = 0
+        self.failures = 0
+        self.rejected = 0
+
+    def request(self, method, path, **kwargs):
+        """Send a request to the backend; raises requests exceptions on failure."""
+        if not self.breaker.allow():
+            with self._stats_lock:
+                self.rejected += 1
+            raise CircuitOpenError(f'Backend circuit is open; not calling {method} {path}')
+        kwargs.setdefault('timeout', self.timeout)
+        with self._stats_lock:
+            self.requests += 1
+        started = time.perf_counter()
+        try:
+            response = self.session.request(method, self.base_url + path, **kwargs)
+        except requests.exceptions.RequestException:
+            self._observe(method, path, 'error', started)
+            self._record_failure()
+            raise
+        self._observe(method, path, response.status_code, started)
+        if response.status_code >= 500:
+            self._record_failure()
+        else:
+            self.breaker.record_success()
+        return response
+
+    def _observe(self, method, path, status, started):
+        if self.observer is not None:
+            self.observer(method, path, status, time.perf_counter() - started)
+
+    def _record_failure(self):
+        with self._stats_lock:
+            self.failures += 1
+        self.breaker.record_failure()
+
+    def get(self, path, **kwargs):
+        return self.request('GET', path, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.request('POST', path, **kwargs)
+
+    def put(self, path, **kwargs):
+        return self.request('PUT', path, **kwargs)
+
+    def delete(self, path, **kwargs):
+        return self.request('DELETE', path, **kwargs)
+
+    def stats(self):
+        """Request counts and how many TCP connections they needed."""
+        connections = 0
+        for adapter in set(self.session.adapters.values()):
+            for key in adapter.poolmanager.pools.keys():
+                connections += adapter.poolmanager.pools[key].num_connections
+        with self._stats_lock:
+            return {
+                'requests': self.requests,
+                'failures': self.failures,
+                'rejected_by_circuit': self.rejected,
+                'connections_opened': connections,
+                'connections_reused': max(self.requests - connections, 0),
+                'circuit': self.breaker.state
+            }
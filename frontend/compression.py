@@ -0,0 +1,150 @@
+"""Negotiated compression of Flask responses.
+
+Responses with a compressible content type are compressed with the best
+coding the client lists in Accept-Encoding: zstd, then brotli, then gzip
+(COMPRESSION_ENCODINGS changes the order or drops codings). zstd and
+brotli need the zstandard and brotli packages and are skipped without
+them. Bodies under COMPRESSION_MIN_BYTES are sent as they are, since the
+saving would not pay for the CPU. Streamed bodies (the export) are
+compressed chunk by chunk as they are produced. Server-Sent Events are
+never compressed: compressors hold data back, which would delay events.
+
+Compressed bodies of responses with an ETag are kept in a small
+per-worker cache, so a list page served from the response cache is
+compressed once rather than on every hit.
+"""
+import os
+import threading
+import zlib
+from collections import OrderedDict
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+COMPRESSION_MIN_BYTES = int(os.environ.get('COMPRESSION_MIN_BYTES', 1024))
+COMPRESSION_CACHE_SIZE = int(os.environ.get('COMPRESSION_CACHE_SIZE', 256))
+
+# Levels favouring speed: most of the size saving for a fraction of the CPU
+GZIP_LEVEL = 5
+BROTLI_QUALITY = 4
+ZSTD_LEVEL = 3
+
+COMPRESSIBLE_TYPES = {
+    'application/json', 'application/x-ndjson', 'application/vnd.tasks.columnar+json',
+    'text/html', 'text/plain', 'text/css', 'text/csv', 'application/javascript'
+}
+
+
+def available_encodings(preference=None):
+    """Codings in order of preference that this worker can produce."""
+    preference = preference or os.environ.get('COMPRESSION_ENCODINGS', 'zstd,br,gzip')
+    supported = {'gzip': True, 'br': brotli is not None, 'zstd': zstandard is not None}
+    return tuple(coding for coding in (c.strip() for c in preference.split(',')) if supported.get(coding))
+
+
+def negotiate(accept_encodings, encodings):
+    """The coding to use for a request's Accept-Encoding, or None.
+
+    Among the codings the client rates highest, ``encodings`` order decides.
+    """
+    best, best_quality = None, 0
+    for coding in encodings:
+        quality = accept_encodings[coding]
+        if quality > best_quality:
+            best, best_quality = coding, quality
+    return best
+
+
+def compress(coding, data):
+    if coding == 'zstd':
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    if coding == 'br':
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    # wbits=31 writes a gzip header and trailer
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+    return compressor.compress(data) + compressor.flush()
+
+
+def compress_stream(coding, chunks):
+    """Compress an iterable of chunks lazily, yielding output as it is produced."""
+    if coding == 'zstd':
+        compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compressobj()
+        process, finish = compressor.compress, compressor.flush
+    elif coding == 'br':
+        compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        process, finish = compressor.process, compressor.finish
+    else:
+        compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+        process, finish = compressor.compress, compressor.flush
+    try:
+        for chunk in chunks:
+            output = process(chunk.encode() if isinstance(chunk, str) else chunk)
+            if output:
+                yield output
+        yield finish()
+    finally:
+        # Let the wrapped generator run its cleanup (e.g. stream_with_context)
+        close = getattr(chunks, 'close', None)
+        if close is not None:
+            close()
+
+
+class ResponseCompressor:
+    """Compresses Flask responses; call ``apply`` from an after_request hook."""
+
+    def __init__(self, min_bytes=COMPRESSION_MIN_BYTES, encodings=None, cache_size=COMPRESSION_CACHE_SIZE):
+        self.min_bytes = min_bytes
+        self.encodings = available_encodings(encodings)
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def apply(self, request, response):
+        if (response.status_code < 200 or response.status_code in (204, 206, 304)
+                or response.direct_passthrough or 'Content-Encoding' in response.headers
+                or response.mimetype not in COMPRESSIBLE_TYPES):
+            return response
+        response.vary.add('Accept-Encoding')
+        coding = negotiate(request.accept_encodings, self.encodings)
+        if coding is None:
+            return response
+
+        if response.is_streamed:
+            response.response = compress_stream(coding, response.response)
+            response.headers.pop('Content-Length', None)
+        else:
+            data = response.get_data()
+            if len(data) < self.min_bytes:
+                return response
+            etag, weak = response.get_etag()
+            key = (request.full_path, etag, coding) if etag and not weak else None
+            response.set_data(self._compressed(key, coding, data))
+        response.headers['Content-Encoding'] = coding
+        # The compressed bytes differ from the identity ones, so their ETag is
+        # weak; it still matches If-None-Match for either representation
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+        return response
+
+    def _compressed(self, key, coding, data):
+        if key is None or not self.cache_size:
+            return compress(coding, data)
+        with self._lock:
+            body = self._cache.get(key)
+            if body is not None:
+                self._cache.move_to_end(key)
+                return body
+        body = compress(coding, data)
+        with self._lock:
+            self._cache[key] = body
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return body
@@ -0,0 +1,223 @@
+"""Fan-out of the backend's task change feed to browser tabs.
+
+Each frontend worker runs one EventRelay. While any tab is subscribed, it
+holds a single upstream /api/tasks/events stream, renders each changed
+task once and hands the formatted message to every tab, the way
+backend-api/events.py fans out its one LISTEN connection. A worker
+therefore takes one backend thread however many tabs it serves, and tabs
+above ``max_streams`` are asked to come back later instead of taking
+every thread in the worker.
+
+Recent messages are kept, so a tab reconnecting with Last-Event-ID gets
+what it missed, or a ``reset`` event if those messages are gone. Stats are
+not fetched per event: ``stats_delay`` seconds after a change, one
+``stats`` event carries fresh counts to every tab, however many changes
+came in meanwhile.
+"""
+import json
+import queue
+import threading
+import time
+from collections import deque
+
+# Client reconnection delay, in milliseconds
+EVENTS_RETRY_MS = 3000
+# Reconnection delay for tabs turned away because the worker is at its limit
+EVENTS_BUSY_RETRY_MS = 30000
+# Comment line sent on idle streams so proxies don't time them out
+EVENTS_HEARTBEAT_SECONDS = 15
+
+
+def read_events(response):
+    """Yield (fields, raw) for each message of an upstream SSE stream.
+
+    Comment-only messages (heartbeats) come through with empty fields.
+    """
+    fields, raw = {}, []
+    for line in response.iter_lines(decode_unicode=True):
+        if line:
+            raw.append(line)
+            if not line.startswith(':'):
+                name, _, value = line.partition(':')
+                fields[name] = value[1:] if value.startswith(' ') else value
+            continue
+        if raw:
+            yield fields, '\n'.join(raw) + '\n\n'
+        fields, raw = {}, []
+
+
+class RelayFull(Exception):
+    """The worker already serves its maximum number of streams."""
+
+
+class Subscription:
+    def __init__(self, relay, deliver):
+        self.relay = relay
+        self.deliver = deliver
+
+    def close(self):
+        self.relay.unsubscribe(self)
+
+
+class EventRelay:
+    """One upstream change feed per worker, delivered to every subscribed tab.
+
+    ``open_stream(last_event_id)`` returns an open streaming response from
+    the backend. ``render(event_type, task)`` builds the data sent to tabs
+    for a change; ``fetch_stats()`` returns the current task stats.
+    """
+
+    def __init__(self, open_stream, render, fetch_stats, max_streams=6, replay_size=500,
+                 stats_delay=0.5, retry_seconds=1.0):
+        self.open_stream = open_stream
+        self.render = render
+        self.fetch_stats = fetch_stats
+        self.max_streams = max_streams
+        self.stats_delay = stats_delay
+        self.retry_seconds = retry_seconds
+        self._lock = threading.Lock()
+        self._subscribers = set()
+        self._replay = deque(maxlen=replay_size)
+        self._thread = None
+        self._stats_timer = None
+        self.position = None  # id of the last upstream event relayed
+        self.connected = False
+        self.turned_away = 0
+
+    def subscribe(self, deliver, last_event_id=None):
+        """Call ``deliver(text)`` with each message; raises RelayFull at the limit.
+
+        Starts after ``last_event_id`` if given, otherwise with the next change.
+        """
+        with self._lock:
+            if len(self._subscribers) >= self.max_streams:
+                self.turned_away += 1
+                raise RelayFull()
+            subscription = Subscription(self, deliver)
+            if self._thread is None:
+                # Nothing is relayed yet: start the upstream where this tab left off
+                self._replay.clear()
+                self.position = last_event_id
+                self._thread = threading.Thread(target=self._run, name='task-events-relay', daemon=True)
+                self._thread.start()
+            elif last_event_id is not None and (self.position is None or last_event_id < self.position):
+                kept = [(event_id, text) for event_id, text in self._replay if event_id > last_event_id]
+                if self._replay and self._replay[0][0] <= last_event_id + 1:
+                    for _, text in kept:
+                        deliver(text)
+                else:
+                    deliver(self._reset_message())
+            self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def stream(self, last_event_id=None, max_seconds=300):
+        """Blocking generator of SSE text for one tab."""
+        messages = queue.Queue()
+        try:
+            subscription = self.subscribe(messages.put, last_event_id)
+        except RelayFull:
+            # The page refreshes its tasks once it gets a stream again
+            yield f'retry: {EVENTS_BUSY_RETRY_MS}\n\nevent: busy\ndata: {{}}\n\n'
+            return
+        deadline = time.monotonic() + max_seconds
+        try:
+            yield f'retry: {EVENTS_RETRY_MS}\n\n'
+            while (remaining := deadline - time.monotonic()) > 0:
+                try:
+                    yield messages.get(timeout=min(remaining, EVENTS_HEARTBEAT_SECONDS))
+                except queue.Empty:
+                    yield ': keep-alive\n\n'
+        finally:
+            subscription.close()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'streams': len(self._subscribers),
+                'max_streams': self.max_streams,
+                'turned_away': self.turned_away,
+                'upstream_connected': self.connected,
+                'last_event_id': self.position
+            }
+
+    def _reset_message(self):
+        # Called with the lock held
+        event_id = f'id: {self.position}\n' if self.position is not None else ''
+        return f'{event_id}event: reset\ndata: {{}}\n\n'
+
+    def _deliver_all(self, text):
+        # Called with the lock held; deliver only queues the text
+        for subscription in self._subscribers:
+            subscription.deliver(text)
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if not self._subscribers:
+                    self._thread = None
+                    self.connected = False
+                    return
+                position = self.position
+            try:
+                upstream = self.open_stream(position)
+                self.connected = True
+                try:
+                    for fields, _ in read_events(upstream):
+                        self._relay(fields)
+                        with self._lock:
+                            if not self._subscribers:
+                                break
+                finally:
+                    upstream.close()
+            except Exception as e:
+                # Reconnect below, resuming after the last relayed event
+                print(f"Task events relay: upstream failed: {e}")
+            self.connected = False
+            time.sleep(self.retry_seconds)
+
+    def _relay(self, fields):
+        event_type = fields.get('event')
+        if event_type == 'reset':
+            with self._lock:
+                self.position = int(fields['id']) if fields.get('id') else self.position
+                self._replay.clear()
+                self._deliver_all(self._reset_message())
+            self._schedule_stats()
+            return
+        if event_type not in ('created', 'updated', 'deleted'):
+            # Retry and heartbeat lines; each tab stream sends its own
+            return
+        event_id = int(fields['id'])
+        if self.position is not None and event_id <= self.position:
+            return
+        change = self.render(event_type, json.loads(fields['data']))
+        text = f'id: {event_id}\nevent: {event_type}\ndata: {json.dumps(change)}\n\n'
+        with self._lock:
+            self.position = event_id
+            self._replay.append((event_id, text))
+            self._deliver_all(text)
+        self._schedule_stats()
+
+    def _schedule_stats(self):
+        with self._lock:
+            if self._stats_timer is not None:
+                return
+            self._stats_timer = threading.Timer(self.stats_delay, self._send_stats)
+            self._stats_timer.daemon = True
+            self._stats_timer.start()
+
+    def _send_stats(self):
+        with self._lock:
+            # Changes from here on schedule another update
+            self._stats_timer = None
+        try:
+            stats = self.fetch_stats()
+        except Exception as e:
+            print(f"Task events relay: stats unavailable: {e}")
+            return
+        with self._lock:
+            self._deliver_all(f'event: stats\ndata: {json.dumps(stats)}\n\n')
@@ -0,0 +1,19 @@
+"""Gunicorn settings for the sync apps.
+
+Workers write Prometheus metrics to files under PROMETHEUS_MULTIPROC_DIR,
+so /metrics can report all of them whichever worker serves the scrape.
+The directory is emptied when gunicorn starts, and each dead worker's
+files are marked so its live gauges stop counting.
+"""
+import os
+import shutil
+
+# Set before any worker imports prometheus_client
+_multiproc_dir = os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', '/tmp/prometheus')
+shutil.rmtree(_multiproc_dir, ignore_errors=True)
+os.makedirs(_multiproc_dir)
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
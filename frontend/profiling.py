@@ -0,0 +1,138 @@
+"""Opt-in request profiling for the Flask apps.
+
+A request is profiled when it sends ``X-Profile: 1`` together with the
+admin token in ``X-Admin-Token``, or at random with probability
+PROFILE_SAMPLE_RATE. PROFILE_MODE picks the profiler:
+
+- ``cprofile``: deterministic, per function, sorted by cumulative time.
+  It shows where CPU went but slows the profiled request down.
+- ``wall``: samples the request thread's stack every PROFILE_INTERVAL_MS
+  and reports collapsed stacks (flame graph input) by sample count.
+  It includes time spent blocked on the database or the network.
+
+Each worker keeps its last PROFILE_BUFFER_SIZE profiles in memory. The
+admin endpoint lists them, and is disabled unless ADMIN_TOKEN is set.
+"""
+import cProfile
+import collections
+import hmac
+import io
+import itertools
+import os
+import pstats
+import random
+import sys
+import threading
+from datetime import datetime
+
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN')
+PROFILE_MODE = os.environ.get('PROFILE_MODE', 'cprofile')
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', 0))
+PROFILE_BUFFER_SIZE = int(os.environ.get('PROFILE_BUFFER_SIZE', 50))
+PROFILE_INTERVAL_MS = float(os.environ.get('PROFILE_INTERVAL_MS', 5))
+# cProfile lines or distinct stacks kept from each profile
+PROFILE_TOP = 40
+
+PROFILE_HEADER = 'X-Profile'
+ADMIN_TOKEN_HEADER = 'X-Admin-Token'
+
+
+def is_admin(headers, token=ADMIN_TOKEN):
+    """Whether the request carries the admin token; always False without one."""
+    supplied = headers.get(ADMIN_TOKEN_HEADER)
+    if not token or supplied is None:
+        return False
+    return hmac.compare_digest(supplied.encode(), token.encode())
+
+
+class RingBuffer:
+    """The last ``size`` entries recorded, each stamped with an increasing id."""
+
+    def __init__(self, size):
+        self._entries = collections.deque(maxlen=size)
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def append(self, entry):
+        with self._lock:
+            entry = {'id': next(self._ids), 'recorded_at': datetime.utcnow().isoformat(), **entry}
+            self._entries.append(entry)
+        return entry
+
+    def entries(self):
+        """Recorded entries, newest first."""
+        with self._lock:
+            return list(reversed(self._entries))
+
+
+class CProfileSession:
+    def __init__(self):
+        self._profile = cProfile.Profile()
+        self._profile.enable()
+
+    def stop(self):
+        self._profile.disable()
+        output = io.StringIO()
+        pstats.Stats(self._profile, stream=output).sort_stats('cumulative').print_stats(PROFILE_TOP)
+        return output.getvalue()
+
+
+class WallClockSession:
+    """Samples the calling thread's stack from a helper thread until stopped."""
+
+    def __init__(self, interval):
+        self._thread_id = threading.get_ident()
+        self._interval = interval
+        self._stacks = collections.Counter()
+        self._stopped = threading.Event()
+        self._sampler = threading.Thread(target=self._sample, name='profile-sampler', daemon=True)
+        self._sampler.start()
+
+    def _sample(self):
+        while not self._stopped.wait(self._interval):
+            frame = sys._current_frames().get(self._thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+                frame = frame.f_back
+            self._stacks[';'.join(reversed(stack))] += 1
+
+    def stop(self):
+        self._stopped.set()
+        self._sampler.join()
+        return '\n'.join(f'{stack} {count}' for stack, count in self._stacks.most_common(PROFILE_TOP))
+
+
+class RequestProfiler:
+    """Decides which requests to profile and keeps the recent profiles."""
+
+    MODES = ('cprofile', 'wall')
+
+    def __init__(self, mode=PROFILE_MODE, sample_rate=PROFILE_SAMPLE_RATE,
+                 buffer_size=PROFILE_BUFFER_SIZE, interval_ms=PROFILE_INTERVAL_MS, token=ADMIN_TOKEN):
+        if mode not in self.MODES:
+            raise ValueError(f'Invalid value for PROFILE_MODE: {mode}')
+        self.mode = mode
+        self.sample_rate = sample_rate
+        self.interval = interval_ms / 1000
+        self.token = token
+        self.profiles = RingBuffer(buffer_size)
+
+    def trigger(self, headers):
+        """Why a request with ``headers`` should be profiled ('header' or 'sample'), or None."""
+        if headers.get(PROFILE_HEADER) and is_admin(headers, self.token):
+            return 'header'
+        if self.sample_rate and random.random() < self.sample_rate:
+            return 'sample'
+        return None
+
+    def start(self):
+        """Start profiling the current thread; pass the result to finish()."""
+        if self.mode == 'cprofile':
+            return CProfileSession()
+        return WallClockSession(self.interval)
+
+    def finish(self, session, **details):
+        """Stop ``session`` and record its profile with ``details``; returns the entry."""
+        return self.profiles.append({**details, 'mode': self.mode, 'profile': session.stop()})
@@ -0,0 +1,143 @@
+import threading
+import time
+from collections import OrderedDict
+
+# Returned by a load function when the backend answered 304 Not Modified
+NOT_MODIFIED = object()
+
+
+class _Entry:
+    __slots__ = ('etag', 'data', 'fetched_at', 'invalidated')
+
+    def __init__(self, etag, data, fetched_at):
+        self.etag = etag
+        self.data = data
+        self.fetched_at = fetched_at
+        self.invalidated = False
+
+
+class _Flight:
+    """One backend call that concurrent readers of a key wait on."""
+    __slots__ = ('done', 'data', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.data = None
+        self.error = None
+
+
+class ReadCache:
+    """Backend reads shared between the requests of one frontend worker.
+
+    - Concurrent reads of the same key share one backend call (single-flight).
+    - A result is reused without asking the backend for ``ttl`` seconds.
+    - For ``stale_seconds`` after that, the old result is served at once
+      while one background call refreshes it (stale-while-revalidate).
+    - If the backend call fails, a result up to ``stale_if_error`` seconds
+      old is served instead of the error.
+
+    Entries keep the ETag they were sent with, so refreshing an unchanged
+    resource costs the backend a 304. invalidate() is called after this
+    worker's own writes: every later read goes to the backend, so users
+    see their change on the next page even within the TTL.
+    """
+
+    RESULTS = ('hit', 'miss', 'coalesced', 'stale', 'stale_error')
+
+    def __init__(self, ttl=1.0, stale_seconds=5.0, stale_if_error=300.0, max_entries=64, observer=None):
+        self.ttl = ttl
+        self.stale_seconds = stale_seconds
+        self.stale_if_error = stale_if_error
+        self.max_entries = max_entries
+        self._observer = observer
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._flights = {}
+        self._generation = 0
+        self._counts = dict.fromkeys(self.RESULTS, 0)
+
+    def get(self, key, load, fresh=False):
+        """The data for ``key``, calling ``load(etag)`` when the cache can't answer.
+
+        ``load`` returns ``(etag, data)``, with NOT_MODIFIED as the data
+        when the backend confirmed the cached copy. ``fresh`` skips cached
+        data and in-flight calls, for reads that must follow a known change.
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and not entry.invalidated and not fresh:
+                age = now - entry.fetched_at
+                if age < self.ttl:
+                    self._entries.move_to_end(key)
+                    self._count('hit')
+                    return entry.data
+                if age < self.ttl + self.stale_seconds:
+                    if key not in self._flights:
+                        flight = self._flights[key] = _Flight()
+                        threading.Thread(target=self._load, args=(key, load, entry, flight),
+                                         name='read-cache-refresh', daemon=True).start()
+                    self._count('stale')
+                    return entry.data
+            flight = None if fresh else self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+            self._count('miss' if leader else 'coalesced')
+
+        if leader:
+            self._load(key, load, entry, flight)
+        else:
+            flight.done.wait()
+        if flight.error is None:
+            return flight.data
+        if entry is not None and now - entry.fetched_at < self.stale_if_error:
+            with self._lock:
+                self._count('stale_error')
+            return entry.data
+        raise flight.error
+
+    def invalidate(self):
+        """Make every read after this one ask the backend.
+
+        Entries are kept for their ETags and as a fallback on errors. Calls
+        already in flight may predate the write, so later reads don't join them.
+        """
+        with self._lock:
+            self._generation += 1
+            self._flights.clear()
+            for entry in self._entries.values():
+                entry.invalidated = True
+
+    def stats(self):
+        with self._lock:
+            return {**self._counts, 'size': len(self._entries), 'in_flight': len(self._flights)}
+
+    def _count(self, result):
+        # Called with the lock held
+        self._counts[result] += 1
+        if self._observer is not None:
+            self._observer(result)
+
+    def _load(self, key, load, entry, flight):
+        with self._lock:
+            generation = self._generation
+        try:
+            etag, data = load(entry.etag if entry is not None else None)
+            if data is NOT_MODIFIED:
+                data = entry.data
+            flight.data = data
+            with self._lock:
+                stored = self._entries[key] = _Entry(etag, data, time.monotonic())
+                # A write since the call started may not be in its result
+                stored.invalidated = generation != self._generation
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        except Exception as e:
+            flight.error = e
+        finally:
+            with self._lock:
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+            flight.done.set()
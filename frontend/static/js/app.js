@@ -10,26 +10,10 @@ document.addEventListener('DOMContentLoaded', function() {
         }, 5000);
     });
 
-    // Add priority-based styling to task items
-    const taskItems = document.querySelectorAll('.task-item');
-    taskItems.forEach(item => {
-        const priorityBadge = item.querySelector('.badge');
-        if (priorityBadge) {
-            const priority = priorityBadge.textContent.toLowerCase().trim();
-            item.classList.add(`${priority}-priority`);
-        }
-    });
+    document.querySelectorAll('.task-item').forEach(setUpTaskItem);
 
-    // Add smooth transitions for task completion
-    const toggleButtons = document.querySelectorAll('a[href*="toggle_task"]');
-    toggleButtons.forEach(button => {
-        button.addEventListener('click', function(e) {
-            const taskItem = this.closest('.task-item');
-            if (taskItem) {
-                taskItem.style.transition = 'all 0.3s ease';
-            }
-        });
-    });
+    // Keep the list and counters current as tasks change elsewhere
+    followTaskEvents();
 
     // Form validation
     const addTaskForm = document.querySelector('form[action*="add_task"]');
@@ -56,16 +40,6 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     }
 
-    // Delete confirmation
-    const deleteButtons = document.querySelectorAll('a[href*="delete_task"]');
-    deleteButtons.forEach(button => {
-        button.addEventListener('click', function(e) {
-            if (!confirm('Are you sure you want to delete this task?')) {
-                e.preventDefault();
-            }
-        });
-    });
-
     // Add loading state to buttons
     const submitButtons = document.querySelectorAll('button[type="submit"]');
     submitButtons.forEach(button => {
@@ -99,6 +73,149 @@ document.addEventListener('DOMContentLoaded', function() {
     });
 });
 
+// Priority styling, completion transition and delete confirmation for one task card
+function setUpTaskItem(item) {
+    const priorityBadge = item.querySelector('.badge');
+    if (priorityBadge) {
+        const priority = priorityBadge.textContent.toLowerCase().trim();
+        item.classList.add(`${priority}-priority`);
+    }
+
+    const toggleButton = item.querySelector('a[href*="toggle_task"]');
+    if (toggleButton) {
+        toggleButton.addEventListener('click', function() {
+            item.style.transition = 'all 0.3s ease';
+        });
+    }
+
+    const deleteButton = item.querySelector('a[href*="delete_task"]');
+    if (deleteButton) {
+        deleteButton.addEventListener('click', function(e) {
+            if (!confirm('Are you sure you want to delete this task?')) {
+                e.preventDefault();
+            }
+        });
+    }
+}
+
+// Apply task changes pushed over /events to the page in place
+function followTaskEvents() {
+    if (!window.EventSource || !document.getElementById('stat-total')) {
+        return;
+    }
+
+    const source = new EventSource('/events');
+    const findTask = id => document.querySelector(`.task-item[data-task-id="${CSS.escape(id)}"]`);
+
+    source.addEventListener('created', e => {
+        const change = JSON.parse(e.data);
+        const list = document.querySelector('.task-list');
+        if (!list) {
+            // The empty-list placeholder is showing
+            window.location.reload();
+            return;
+        }
+        // New tasks sort last, so only the last page shows them
+        if (!findTask(change.id) && !document.querySelector('[data-next-page]')) {
+            list.appendChild(renderTask(change.html));
+        }
+    });
+
+    source.addEventListener('updated', e => {
+        const change = JSON.parse(e.data);
+        const item = findTask(change.id);
+        if (item) {
+            item.replaceWith(renderTask(change.html));
+        }
+    });
+
+    source.addEventListener('deleted', e => {
+        const change = JSON.parse(e.data);
+        const item = findTask(change.id);
+        if (item) {
+            item.remove();
+        }
+    });
+
+    // Counts follow each burst of changes
+    source.addEventListener('stats', e => updateStats(JSON.parse(e.data)));
+
+    // Events were missed and can't be replayed: fetch just the changed cards
+    source.addEventListener('reset', () => refreshTasks());
+
+    // The server had no stream to spare and will take us back later; changes
+    // made meanwhile aren't replayed, so catch up once reconnected
+    let missedEvents = false;
+    source.addEventListener('busy', () => { missedEvents = true; });
+    source.addEventListener('open', () => {
+        if (missedEvents) {
+            missedEvents = false;
+            refreshTasks();
+        }
+    });
+}
+
+// Build a task card from its HTML
+function renderTask(html) {
+    const template = document.createElement('template');
+    template.innerHTML = html.trim();
+    const item = template.content.firstElementChild;
+    setUpTaskItem(item);
+    return item;
+}
+
+function updateStats(stats) {
+    document.getElementById('stat-total').textContent = stats.total;
+    document.getElementById('stat-completed').textContent = stats.completed;
+    document.getElementById('stat-pending').textContent = stats.pending;
+    document.getElementById('task-count').textContent = stats.total;
+}
+
+// Bring this page of tasks up to date, re-rendering only the cards that changed
+async function refreshTasks() {
+    const list = document.querySelector('.task-list');
+    if (!list) {
+        window.location.reload();
+        return;
+    }
+    const items = new Map();
+    const versions = {};
+    list.querySelectorAll('.task-item').forEach(item => {
+        items.set(item.dataset.taskId, item);
+        versions[item.dataset.taskId] = item.dataset.taskVersion;
+    });
+
+    let changes;
+    try {
+        const response = await fetch('/task_fragments', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+            },
+            body: JSON.stringify({
+                cursor: new URLSearchParams(window.location.search).get('cursor'),
+                versions: versions
+            })
+        });
+        if (!response.ok) {
+            throw new Error(`HTTP ${response.status}`);
+        }
+        changes = await response.json();
+    } catch (error) {
+        console.error('Error refreshing tasks:', error);
+        return;
+    }
+
+    // An emptied page or a page that gained or lost its successor needs new pagination
+    const hasNextPage = Boolean(document.querySelector('[data-next-page]'));
+    if (!changes.ids.length || Boolean(changes.next_cursor) !== hasNextPage) {
+        window.location.reload();
+        return;
+    }
+    list.replaceChildren(...changes.ids.map(id => id in changes.changed ? renderTask(changes.changed[id]) : items.get(id)));
+    updateStats(changes.stats);
+}
+
 // Utility function to show alerts
 function showAlert(message, type = 'info') {
     const alertContainer = document.querySelector('.container');
@@ -0,0 +1,463 @@
+import unittest
+import gzip
+import importlib.util
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+from urllib.parse import quote
+
+import requests
+
+FRONTEND_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, FRONTEND_DIR)
+
+from backend_client import BackendClient, CircuitBreaker, CircuitOpenError
+from read_cache import NOT_MODIFIED, ReadCache
+
+
+class StubBackend(ThreadingHTTPServer):
+    """Keep-alive HTTP server standing in for the backend API"""
+    daemon_threads = True
+
+    def __init__(self):
+        self.calls = {}
+        self.cookies = []
+        self.event_ids = []
+        self.failures_left = 0
+        self.task_version = 1
+        self.down = False
+        super().__init__(('127.0.0.1', 0), StubBackendHandler)
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.server_address[1]}'
+
+
+class StubBackendHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def reply(self, status, payload, content_type='application/json'):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        if self.command != 'GET' and status < 400:
+            # Like the backend, pin the writer's reads to the primary for a while
+            self.send_header('Set-Cookie', f'db_primary_until={time.time() + 5}; Max-Age=6; HttpOnly; Path=/')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def handle_any(self):
+        server = self.server
+        key = (self.command, self.path)
+        server.calls[key] = server.calls.get(key, 0) + 1
+        server.cookies.append((self.command, self.path.split('?')[0], self.headers.get('Cookie')))
+        length = int(self.headers.get('Content-Length') or 0)
+        if length:
+            self.rfile.read(length)
+        if server.down:
+            self.reply(503, {'error': 'unavailable'})
+        elif self.path == '/flaky' and server.failures_left > 0:
+            server.failures_left -= 1
+            self.reply(503, {'error': 'unavailable'})
+        elif self.path == '/broken':
+            self.reply(500, {'error': 'broken'})
+        elif self.path == '/api/tasks/events':
+            self.stream_events()
+        elif self.path == '/api/tasks/stats':
+            self.reply(200, {'total': 7, 'completed': 3, 'pending': 4,
+                             'by_priority': {'low': 2, 'medium': 4, 'high': 1}})
+        elif self.path.startswith('/api/tasks?'):
+            # Answered in the columnar encoding the frontend asks for
+            task = {'id': 'abc', 'title': 'Stub task', 'description': '', 'priority': 'low',
+                    'completed': False, 'created_at': '2024-01-01 00:00',
+                    'updated_at': '2024-01-02 00:00', 'version': self.server.task_version}
+            self.reply(200, {
+                'tasks': {'columns': list(task), 'rows': [list(task.values())]},
+                'next_cursor': None if 'cursor=' in self.path else 'page2'
+            }, self.headers['Accept'].split(',')[0])
+        elif self.path.endswith('/toggle'):
+            self.reply(200, {'id': 'abc', 'title': 'Stub task', 'completed': True})
+        elif self.command == 'DELETE':
+            self.reply(200, {'message': 'Task deleted successfully',
+                             'task': {'id': 'abc', 'title': 'Stub task'}})
+        else:
+            self.reply(200, {'status': 'healthy'})
+
+    def stream_events(self):
+        task = {'id': 'abc', 'title': 'Live <task>', 'description': '', 'priority': 'high',
+                'completed': True, 'created_at': '2024-01-01 00:00'}
+        self.server.event_ids.append(self.headers.get('Last-Event-ID'))
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.wfile.write((
+            'retry: 3000\n\n'
+            f'id: 8\nevent: updated\ndata: {json.dumps(task)}\n\n'
+            ': keep-alive\n\n'
+            'id: 9\nevent: deleted\ndata: {"id": "abc"}\n\n'
+        ).encode())
+        self.close_connection = True
+
+    do_GET = do_POST = do_PUT = do_DELETE = handle_any
+
+
+class TestBackendClient(unittest.TestCase):
+    def setUp(self):
+        self.server = StubBackend()
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.client = BackendClient(self.server.url, timeout=2, backoff=0)
+
+    def tearDown(self):
+        self.client.session.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_requests_reuse_one_connection(self):
+        """Sequential calls share a single keep-alive connection"""
+        for _ in range(5):
+            self.assertEqual(self.client.get('/health').status_code, 200)
+        stats = self.client.stats()
+        self.assertEqual(stats['requests'], 5)
+        self.assertEqual(stats['connections_opened'], 1)
+        self.assertEqual(stats['connections_reused'], 4)
+        self.assertEqual(stats['circuit'], 'closed')
+
+    def test_idempotent_calls_are_retried(self):
+        """GET is retried on 503 while POST is sent once"""
+        self.server.failures_left = 2
+        self.assertEqual(self.client.get('/flaky').status_code, 200)
+        self.assertEqual(self.server.calls[('GET', '/flaky')], 3)
+
+        self.server.failures_left = 1
+        self.assertEqual(self.client.post('/flaky', json={}).status_code, 503)
+        self.assertEqual(self.server.calls[('POST', '/flaky')], 1)
+
+    def test_circuit_opens_after_failures(self):
+        """Repeated failures open the circuit and later calls fail fast"""
+        client = BackendClient(self.server.url, retries=0, failure_threshold=2, reset_timeout=60)
+        for _ in range(2):
+            self.assertEqual(client.get('/broken').status_code, 500)
+        with self.assertRaises(CircuitOpenError):
+            client.get('/health')
+        self.assertEqual(self.server.calls.get(('GET', '/health')), None)
+        stats = client.stats()
+        self.assertEqual(stats['circuit'], 'open')
+        self.assertEqual(stats['rejected_by_circuit'], 1)
+        client.session.close()
+
+    def test_circuit_open_error_is_a_request_exception(self):
+        """Routes catching RequestException also handle an open circuit"""
+        self.assertTrue(issubclass(CircuitOpenError, requests.exceptions.RequestException))
+
+    def test_half_open_trial_closes_circuit(self):
+        """After the reset timeout one trial call is let through"""
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+        breaker.record_failure()
+        self.assertFalse(breaker.allow())
+        time.sleep(0.06)
+        self.assertEqual(breaker.state, 'half-open')
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())
+        breaker.record_success()
+        self.assertEqual(breaker.state, 'closed')
+        self.assertTrue(breaker.allow())
+
+    def test_failed_trial_reopens_circuit(self):
+        """A failing trial call opens the circuit again"""
+        breaker = CircuitBreaker(failure_threshold=3, reset_timeout=0.05)
+        for _ in range(3):
+            breaker.record_failure()
+        time.sleep(0.06)
+        self.assertTrue(breaker.allow())
+        breaker.record_failure()
+        self.assertEqual(breaker.state, 'open')
+
+
+class TestReadCache(unittest.TestCase):
+    def test_concurrent_reads_share_one_call(self):
+        """Readers arriving while a call is in flight wait for its result"""
+        cache = ReadCache(ttl=60)
+        release = threading.Event()
+        calls = []
+
+        def load(etag):
+            calls.append(etag)
+            release.wait(5)
+            return 'v1', {'page': 1}
+
+        results = []
+        readers = [threading.Thread(target=lambda: results.append(cache.get('page', load))) for _ in range(5)]
+        for reader in readers:
+            reader.start()
+        while cache.stats()['coalesced'] < 4:
+            time.sleep(0.01)
+        release.set()
+        for reader in readers:
+            reader.join()
+        self.assertEqual(calls, [None])
+        self.assertEqual(results, [{'page': 1}] * 5)
+        self.assertEqual(cache.stats()['miss'], 1)
+
+    def test_ttl_and_invalidation(self):
+        """Copies are reused within the TTL; after a write they are revalidated by ETag"""
+        cache = ReadCache(ttl=60)
+        calls = []
+
+        def load(etag):
+            calls.append(etag)
+            return 'v1', NOT_MODIFIED if etag else {'page': 1}
+
+        self.assertEqual(cache.get('page', load), {'page': 1})
+        self.assertEqual(cache.get('page', load), {'page': 1})
+        self.assertEqual(calls, [None])
+        cache.invalidate()
+        self.assertEqual(cache.get('page', load), {'page': 1})
+        self.assertEqual(calls, [None, 'v1'])
+        self.assertEqual(cache.stats()['hit'], 1)
+
+    def test_stale_copy_served_while_refreshing(self):
+        """Past the TTL the old copy is returned at once and refreshed in the background"""
+        cache = ReadCache(ttl=0, stale_seconds=60)
+        versions = iter([{'page': 1}, {'page': 2}])
+        cache.get('page', lambda etag: (None, next(versions)))
+        self.assertEqual(cache.get('page', lambda etag: (None, next(versions))), {'page': 1})
+        while cache.stats()['in_flight']:
+            time.sleep(0.01)
+        self.assertEqual(cache.get('page', lambda etag: (None, {'page': 3})), {'page': 2})
+        self.assertEqual(cache.stats()['stale'], 2)
+
+    def test_recent_copy_served_on_error(self):
+        """A failed call falls back to a copy younger than stale_if_error"""
+        def fail(etag):
+            raise requests.exceptions.ConnectionError('backend down')
+
+        cache = ReadCache(ttl=0, stale_seconds=0, stale_if_error=60)
+        cache.get('page', lambda etag: (None, {'page': 1}))
+        self.assertEqual(cache.get('page', fail), {'page': 1})
+        self.assertEqual(cache.stats()['stale_error'], 1)
+
+        cache.stale_if_error = 0
+        with self.assertRaises(requests.exceptions.ConnectionError):
+            cache.get('page', fail)
+
+
+def load_frontend_app(backend_url):
+    """Import frontend/app.py pointed at ``backend_url``.
+
+    The module is loaded under its own name so it doesn't clash with the
+    monolith's app module.
+    """
+    os.environ['BACKEND_API_URL'] = backend_url
+    try:
+        spec = importlib.util.spec_from_file_location(
+            'frontend_app', os.path.join(FRONTEND_DIR, 'app.py'))
+        frontend_app = importlib.util.module_from_spec(spec)
+        sys.modules['frontend_app'] = frontend_app
+        spec.loader.exec_module(frontend_app)
+    finally:
+        del os.environ['BACKEND_API_URL']
+    return frontend_app
+
+
+class TestFrontendRoutes(unittest.TestCase):
+    def setUp(self):
+        self.server = StubBackend()
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.frontend = load_frontend_app(self.server.url)
+        self.app = self.frontend.app.test_client()
+
+    def tearDown(self):
+        self.frontend.backend.session.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_health_reports_backend_client_stats(self):
+        """Frontend /health includes backend status and connection stats"""
+        data = json.loads(self.app.get('/health').data)
+        self.assertEqual(data['backend'], 'healthy')
+        self.assertEqual(data['backend_client']['requests'], 1)
+        self.assertEqual(data['backend_client']['circuit'], 'closed')
+
+    def test_index_renders_stats_and_one_page(self):
+        """The home page shows backend stats and a single page of tasks"""
+        response = self.app.get('/')
+        self.assertEqual(response.status_code, 200)
+        html = response.get_data(as_text=True)
+        self.assertIn('Stub task', html)
+        self.assertIn('<h5 class="card-title" id="stat-total">7</h5>', html)
+        self.assertIn('<h5 class="card-title" id="stat-pending">4</h5>', html)
+        self.assertIn('cursor=page2', html)
+        self.assertEqual(sorted(self.server.calls), [
+            ('GET', '/api/tasks/stats'),
+            ('GET', f'/api/tasks?limit={self.frontend.TASKS_PAGE_SIZE}&fields={quote(self.frontend.INDEX_FIELDS)}')
+        ])
+
+        html = self.app.get('/?cursor=page2').get_data(as_text=True)
+        self.assertNotIn('Next page', html)
+        self.assertIn('First page', html)
+
+    def test_pages_compressed_for_browsers(self):
+        """The home page is sent gzipped to clients that accept it"""
+        response = self.app.get('/', headers={'Accept-Encoding': 'gzip, deflate'})
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertIn(b'Stub task', gzip.decompress(response.data))
+
+    def test_task_cards_rendered_once_per_version(self):
+        """Unchanged tasks reuse their cached card; a new version renders again"""
+        html = self.app.get('/').get_data(as_text=True)
+        self.assertIn('data-task-version="1"', html)
+        self.app.get('/')
+        self.assertEqual(self.frontend.fragment_stats, {'hits': 1, 'misses': 1})
+
+        self.server.task_version = 2
+        self.app.get('/toggle_task/abc')
+        self.assertIn('data-task-version="2"', self.app.get('/').get_data(as_text=True))
+        self.assertEqual(self.frontend.fragment_stats, {'hits': 1, 'misses': 2})
+        health = json.loads(self.app.get('/health').data)
+        self.assertEqual(health['fragment_cache']['size'], 1)
+
+    def test_index_served_from_recent_copy_while_backend_down(self):
+        """With the backend failing, the home page shows the last tasks it fetched"""
+        self.app.get('/')
+        self.frontend.read_cache.invalidate()
+        self.server.down = True
+        html = self.app.get('/').get_data(as_text=True)
+        self.assertIn('Stub task', html)
+        self.assertIn('<h5 class="card-title" id="stat-total">7</h5>', html)
+        self.assertEqual(json.loads(self.app.get('/health').data)['read_cache']['stale_error'], 2)
+        self.assertEqual(self.frontend.metrics_registry.get_sample_value(
+            'backend_cache_reads_total', {'result': 'stale_error'}), 2)
+
+    def test_task_fragments_return_only_changed_cards(self):
+        """The fragments endpoint sends HTML only for tasks whose version moved on"""
+        data = json.loads(self.app.post('/task_fragments', json={'versions': {'abc': '1'}}).data)
+        self.assertEqual(data['ids'], ['abc'])
+        self.assertEqual(data['changed'], {})
+        self.assertEqual(data['stats']['total'], 7)
+        self.assertEqual(data['next_cursor'], 'page2')
+
+        self.server.task_version = 2
+        data = json.loads(self.app.post('/task_fragments', json={'cursor': 'page2', 'versions': {'abc': '1'}}).data)
+        self.assertIn('data-task-version="2"', data['changed']['abc'])
+        self.assertIsNone(data['next_cursor'])
+
+        self.assertEqual(self.app.post('/task_fragments', json={'versions': ['abc']}).status_code, 400)
+
+    def test_metrics_time_routes_and_backend_calls(self):
+        """/metrics reports page latency and backend call latency by path template"""
+        self.app.get('/toggle_task/abc')
+        sample = self.frontend.metrics_registry.get_sample_value
+        self.assertEqual(sample('http_request_duration_seconds_count',
+                                {'method': 'GET', 'route': '/toggle_task/<task_id>', 'status': '302'}), 1)
+        self.assertEqual(sample('backend_request_duration_seconds_count',
+                                {'method': 'POST', 'path': '/api/tasks/<id>/toggle', 'status': '200'}), 1)
+        body = self.app.get('/metrics').get_data(as_text=True)
+        self.assertIn('backend_request_duration_seconds_bucket', body)
+        self.assertNotIn('/api/tasks/abc', body)
+
+    def test_sampled_profile_lists_backend_calls(self):
+        """A sampled request's profile shows each backend call and its latency"""
+        with mock.patch.object(self.frontend.profiler, 'sample_rate', 1), \
+                mock.patch.object(self.frontend.profiler, 'token', 'secret'):
+            response = self.app.get('/')
+            self.assertIn('X-Profile-Id', response.headers)
+            data = json.loads(self.app.get('/admin/profiles', headers={'X-Admin-Token': 'secret'}).data)
+        profile = data['profiles'][0]
+        self.assertEqual((profile['path'], profile['trigger'], profile['mode']), ('/', 'sample', 'cprofile'))
+        self.assertEqual([call['path'] for call in profile['backend_calls']], ['/api/tasks/stats', '/api/tasks'])
+        self.assertIn('fetch_json', profile['profile'])
+
+    def test_toggle_makes_one_backend_call(self):
+        """Toggling a task costs a single backend request"""
+        response = self.app.get('/toggle_task/abc')
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.server.calls, {('POST', '/api/tasks/abc/toggle'): 1})
+        with self.app.session_transaction() as session:
+            self.assertIn('"Stub task" marked as completed', session['_flashes'][0][1])
+
+    def test_delete_makes_one_backend_call(self):
+        """Deleting a task costs a single backend request"""
+        response = self.app.get('/delete_task/abc')
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.server.calls, {('DELETE', '/api/tasks/abc'): 1})
+        with self.app.session_transaction() as session:
+            self.assertIn('"Stub task" deleted successfully', session['_flashes'][0][1])
+
+    def test_write_pins_only_that_users_reads(self):
+        """A user's read-your-writes cookie goes with their reads, never another user's"""
+        writer, other = self.app, self.frontend.app.test_client()
+        response = writer.get('/toggle_task/abc')
+        self.assertIn('db_primary_until=', response.headers['Set-Cookie'])
+        self.assertEqual(len(self.frontend.backend.session.cookies), 0)
+
+        self.server.cookies.clear()
+        other.get('/')
+        self.assertEqual({cookie for _, _, cookie in self.server.cookies}, {None})
+        self.server.cookies.clear()
+        other.get('/')
+        self.assertEqual(self.server.cookies, [])  # served from the read cache
+
+        writer.get('/')
+        self.assertEqual({path for _, path, _ in self.server.cookies}, {'/api/tasks/stats', '/api/tasks'})
+        self.assertTrue(all(cookie.startswith('db_primary_until=') for _, _, cookie in self.server.cookies))
+
+    def test_events_relay_rendered_tasks(self):
+        """The change feed reaches the browser as task HTML, then one stats update"""
+        self.frontend.relay.stats_delay = 0.05
+        with mock.patch.object(self.frontend, 'EVENTS_STREAM_SECONDS', 0.5):
+            response = self.app.get('/events', headers={'Last-Event-ID': '7'})
+            self.assertEqual(response.mimetype, 'text/event-stream')
+            body = response.get_data(as_text=True)
+        self.assertEqual(self.server.event_ids[0], '7')
+        self.assertTrue(body.startswith('retry: 3000\n\n'))
+
+        messages = [block.split('\n') for block in body.split('\n\n') if block.startswith('id:')]
+        self.assertEqual([lines[:2] for lines in messages],
+                         [['id: 8', 'event: updated'], ['id: 9', 'event: deleted']])
+        updated = json.loads(messages[0][2][len('data: '):])
+        self.assertIn('data-task-id="abc"', updated['html'])
+        self.assertIn('Live &lt;task&gt;', updated['html'])
+        deleted = json.loads(messages[1][2][len('data: '):])
+        self.assertEqual(deleted, {'id': 'abc'})
+        # Both changes share one stats request and one stats event
+        stats = [block for block in body.split('\n\n') if block.startswith('event: stats')]
+        self.assertEqual(len(stats), 1)
+        self.assertEqual(json.loads(stats[0].split('data: ', 1)[1])['total'], 7)
+        self.assertEqual(self.server.calls[('GET', '/api/tasks/stats')], 1)
+
+    def test_tabs_share_one_upstream_stream_up_to_a_limit(self):
+        """Every tab of a worker is fed from one backend stream; extra tabs are turned away"""
+        relay = self.frontend.relay
+        relay.retry_seconds = 60
+        relay.max_streams = 2
+        tabs = [[], []]
+        subscriptions = [relay.subscribe(tab.append) for tab in tabs]
+        deadline = time.monotonic() + 5
+        while not all(len(tab) == 2 for tab in tabs) and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual([[text.split('\n')[0] for text in tab] for tab in tabs], [['id: 8', 'id: 9']] * 2)
+        self.assertEqual(self.server.calls[('GET', '/api/tasks/events')], 1)
+
+        busy = self.app.get('/events').get_data(as_text=True)
+        self.assertIn('event: busy', busy)
+        # A tab resuming after a replayed id gets only what followed
+        subscriptions[1].close()
+        resumed = []
+        relay.subscribe(resumed.append, last_event_id=8)
+        self.assertEqual([text.split('\n')[0] for text in resumed], ['id: 9'])
+        health = json.loads(self.app.get('/health').data)
+        self.assertEqual((health['events']['streams'], health['events']['turned_away']), (2, 1))
+        subscriptions[0].close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+"""Flask JSON provider that encodes with orjson when it is installed.
+
+Responses are byte-for-byte what Flask's default provider writes: sorted
+keys, ASCII-only, compact separators. orjson output that could differ
+(non-ASCII or DEL characters, floats the stdlib writes in exponent form,
+including those below 1e-4 that orjson writes as 0.0000..., NaN and
+infinities, which orjson writes as null) and objects orjson rejects
+(non-string keys, integers beyond 64 bits) are re-encoded with the stdlib,
+as is anything when orjson isn't available.
+
+Task lists can also be sent in a columnar form, for clients that ask for
+COLUMNAR_MIMETYPE in Accept: ``{"columns": [...], "rows": [[...], ...]}``
+names each key once instead of on every task.
+"""
+import dataclasses
+import math
+import re
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+COMPACT_SEPARATORS = (',', ':')
+COLUMNAR_MIMETYPE = 'application/vnd.tasks.columnar+json'
+# Bytes where orjson and json.dumps(ensure_ascii=True) can disagree
+_STDLIB_ONLY = re.compile(rb'[^\x00-\x7e]|\de|0\.0000')
+
+
+def _has_non_finite(obj):
+    """Whether ``obj`` holds a NaN or infinite float."""
+    if isinstance(obj, float):
+        return not math.isfinite(obj)
+    if isinstance(obj, dict):
+        return any(_has_non_finite(value) for value in obj.values())
+    if isinstance(obj, (list, tuple)):
+        return any(_has_non_finite(value) for value in obj)
+    if dataclasses.is_dataclass(obj) and not isinstance(obj, type):
+        return _has_non_finite(dataclasses.asdict(obj))
+    return False
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    def dumps(self, obj, **kwargs):
+        if kwargs == {'separators': COMPACT_SEPARATORS}:
+            return self.dumps_compact(obj).decode('ascii')
+        return super().dumps(obj, **kwargs)
+
+    def dumps_compact(self, obj):
+        """Encode ``obj`` as compact JSON bytes."""
+        if orjson is not None:
+            try:
+                data = orjson.dumps(obj, default=self.default, option=(
+                    orjson.OPT_SORT_KEYS | orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+                ))
+            except orjson.JSONEncodeError:
+                pass
+            else:
+                # Only output with a null can hide a NaN or infinity
+                if not _STDLIB_ONLY.search(data) and not (b'null' in data and _has_non_finite(obj)):
+                    return data
+        return super().dumps(obj, separators=COMPACT_SEPARATORS).encode('ascii')
+
+    def loads(self, s, **kwargs):
+        if orjson is not None and not kwargs:
+            return orjson.loads(s)
+        return super().loads(s, **kwargs)
+
+    def response(self, *args, **kwargs):
+        if self.compact is False or (self.compact is None and self._app.debug):
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(self.dumps_compact(obj) + b'\n', mimetype=self.mimetype)
+
+
+def wants_columnar(accept_mimetypes):
+    """Whether the client prefers columnar task lists to plain JSON."""
+    return accept_mimetypes.best_match(('application/json', COLUMNAR_MIMETYPE)) == COLUMNAR_MIMETYPE
+
+
+def to_columnar(rows):
+    """Dicts sharing the same keys, in order, as one list of keys and a list of value lists."""
+    return {'columns': list(rows[0]) if rows else [], 'rows': [list(row.values()) for row in rows]}
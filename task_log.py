@@ -0,0 +1,167 @@
+"""Append-only operation log with snapshots for the in-memory task store.
+
+Every write is appended to ``<path>`` as one JSON line: ``put`` carries the
+full task, ``delete`` its id and ``clear`` nothing, so replaying records is
+idempotent. Writers fsync with group commit: a thread whose record isn't
+on disk yet either finds it was covered by another thread's fsync, or
+fsyncs everything written so far on their behalf.
+
+Once the log grows past ``compact_bytes``, the current tasks are written
+to ``<path>.snapshot`` and the log starts over, which bounds startup
+replay time. Both files are read through mmap.
+
+Several processes (e.g. gunicorn workers) can share one log on the same
+host. Access is serialized with ``flock`` on ``<path>.lock``, and each
+process replays records appended by the others before reading or
+writing. A compaction swaps in a new log file, which other processes
+notice by its inode and reload from the snapshot.
+"""
+import fcntl
+import json
+import mmap
+import os
+import threading
+from contextlib import contextmanager
+
+
+class TaskLog:
+    def __init__(self, path, compact_bytes=8 * 1024 * 1024):
+        self.path = path
+        self.snapshot_path = f'{path}.snapshot'
+        self.compact_bytes = compact_bytes
+        self._lock_fd = os.open(f'{path}.lock', os.O_RDWR | os.O_CREAT, 0o644)
+        self._fd = None
+        self._inode = None
+        self._offset = 0
+        self._fsync_lock = threading.Lock()
+        self._written = 0  # sequence number of the last record written
+        self._synced = 0  # sequence number of the last record fsynced
+
+    @contextmanager
+    def shared(self):
+        fcntl.flock(self._lock_fd, fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+
+    @contextmanager
+    def exclusive(self):
+        fcntl.flock(self._lock_fd, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+
+    def replay(self, apply):
+        """Call ``apply(record)`` for every record not seen yet.
+
+        Must hold ``shared()`` or ``exclusive()``. On first use, or after
+        another process compacted the log, ``apply`` first gets a ``clear``
+        record followed by the snapshot.
+        """
+        try:
+            inode = os.stat(self.path).st_ino
+        except FileNotFoundError:
+            inode = None
+        if self._fd is None or inode != self._inode:
+            with self._fsync_lock:
+                # commit() may be fsyncing the old descriptor on another thread
+                self._reopen()
+            apply({'op': 'clear'})
+            if os.path.exists(self.snapshot_path):
+                with open(self.snapshot_path, 'rb') as snapshot:
+                    for record in self._read(snapshot.fileno(), 0)[0]:
+                        apply(record)
+        records, self._offset = self._read(self._fd, self._offset)
+        for record in records:
+            apply(record)
+
+    def append(self, records):
+        """Write records to the log; returns a sequence number for ``commit``.
+
+        Must hold ``exclusive()`` after a ``replay``, so the log ends where
+        this process last read it.
+        """
+        if not records:
+            return self._written
+        data = b''.join(json.dumps(record, separators=(',', ':')).encode() + b'\n' for record in records)
+        if os.fstat(self._fd).st_size != self._offset:
+            # Drop a torn record left by a writer that crashed mid-append
+            os.ftruncate(self._fd, self._offset)
+        os.write(self._fd, data)
+        self._offset += len(data)
+        with self._fsync_lock:
+            self._written += 1
+            return self._written
+
+    def commit(self, seq):
+        """Block until the record with sequence number ``seq`` is on disk."""
+        with self._fsync_lock:
+            if self._synced >= seq:
+                return
+            # Everything written so far goes to disk with this one fsync
+            target = self._written
+            os.fsync(self._fd)
+            self._synced = target
+
+    def should_compact(self):
+        return self._offset >= self.compact_bytes
+
+    def compact(self, records):
+        """Replace the snapshot with ``records`` and start an empty log.
+
+        Must hold ``exclusive()``. A crash between the two renames leaves
+        the new snapshot with the old log, which replays to the same state.
+        """
+        self._write_atomically(self.snapshot_path, records)
+        with self._fsync_lock:
+            self._write_atomically(self.path, [])
+            self._reopen()
+            self._synced = self._written
+
+    def close(self):
+        with self._fsync_lock:
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
+        os.close(self._lock_fd)
+
+    def _reopen(self):
+        # Called with _fsync_lock held, so commit() never fsyncs a closed descriptor
+        if self._fd is not None:
+            os.close(self._fd)
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT | os.O_APPEND, 0o644)
+        self._inode = os.fstat(self._fd).st_ino
+        self._offset = 0
+
+    def _write_atomically(self, path, records):
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'wb') as tmp:
+            for record in records:
+                tmp.write(json.dumps(record, separators=(',', ':')).encode() + b'\n')
+            tmp.flush()
+            os.fsync(tmp.fileno())
+        os.replace(tmp_path, path)
+        dir_fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+    @staticmethod
+    def _read(fd, offset):
+        """Parse complete lines from ``offset``; returns (records, new offset)."""
+        size = os.fstat(fd).st_size
+        if size <= offset:
+            return [], offset
+        records = []
+        with mmap.mmap(fd, size, access=mmap.ACCESS_READ) as mm:
+            while True:
+                end = mm.find(b'\n', offset)
+                if end == -1:
+                    # An unterminated line is a torn write, not a record
+                    break
+                records.append(json.loads(mm[offset:end]))
+                offset = end + 1
+        return records, offset
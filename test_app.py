@@ -1,6 +1,12 @@
 import unittest
+import gzip
 import json
-from app import app as flask_app, tasks, Task
+import os
+import shutil
+import tempfile
+from app import app as flask_app, tasks, Task, TaskStore
+from json_provider import COLUMNAR_MIMETYPE
+from task_log import TaskLog
 
 class TestTaskManager(unittest.TestCase):
     def setUp(self):
@@ -106,6 +112,96 @@ class TestTaskManager(unittest.TestCase):
         from app import tasks
         self.assertEqual(len(tasks), 0)
 
+    def test_api_search_tasks(self):
+        """Test API search ranks title matches above description matches"""
+        for title, description in [('Buy milk', 'From the corner shop'),
+                                   ('Call shop', 'Ask whether they sell milk'),
+                                   ('Walk dog', 'Around the park')]:
+            self.app.post('/api/tasks', data=json.dumps({'title': title, 'description': description}),
+                          content_type='application/json')
+        
+        response = self.app.get('/api/tasks/search?q=Milk')
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data)
+        self.assertEqual([task['title'] for task in data['tasks']], ['Buy milk', 'Call shop'])
+        self.assertGreater(data['tasks'][0]['rank'], data['tasks'][1]['rank'])
+        self.assertIsNone(data['next_offset'])
+        
+        # Every word must match
+        data = json.loads(self.app.get('/api/tasks/search?q=milk+park').data)
+        self.assertEqual(data['tasks'], [])
+        
+        data = json.loads(self.app.get('/api/tasks/search?q=milk&limit=1').data)
+        self.assertEqual(len(data['tasks']), 1)
+        self.assertEqual(data['next_offset'], 1)
+        
+        self.assertEqual(self.app.get('/api/tasks/search').status_code, 400)
+
+    def test_api_search_follows_updates_and_deletes(self):
+        """Test the search index is kept current by writes"""
+        response = self.app.post('/api/tasks', data=json.dumps({'title': 'Old name'}),
+                                 content_type='application/json')
+        task_id = json.loads(response.data)['id']
+        
+        self.app.put(f'/api/tasks/{task_id}', data=json.dumps({'title': 'New name'}),
+                     content_type='application/json')
+        self.assertEqual(json.loads(self.app.get('/api/tasks/search?q=old').data)['tasks'], [])
+        self.assertEqual(len(json.loads(self.app.get('/api/tasks/search?q=new').data)['tasks']), 1)
+        
+        self.app.delete(f'/api/tasks/{task_id}')
+        self.assertEqual(json.loads(self.app.get('/api/tasks/search?q=new').data)['tasks'], [])
+
+    def test_api_filter_tasks(self):
+        """Test filtering the task list by priority and completion status"""
+        for title, priority in [('One', 'high'), ('Two', 'low'), ('Three', 'high')]:
+            self.app.post('/api/tasks', data=json.dumps({'title': title, 'priority': priority}),
+                          content_type='application/json')
+        from app import tasks as app_tasks
+        app_tasks.toggle(app_tasks[2].id)
+        
+        data = json.loads(self.app.get('/api/tasks?priority=high').data)
+        self.assertEqual([task['title'] for task in data], ['One', 'Three'])
+        data = json.loads(self.app.get('/api/tasks?priority=high&completed=false').data)
+        self.assertEqual([task['title'] for task in data], ['One'])
+        data = json.loads(self.app.get('/api/tasks?completed=true').data)
+        self.assertEqual([task['title'] for task in data], ['Three'])
+        self.assertEqual(self.app.get('/api/tasks?completed=maybe').status_code, 400)
+
+    def test_api_tasks_columnar_and_compressed(self):
+        """Test the columnar list encoding and gzip for lists over the size threshold"""
+        for i in range(30):
+            self.app.post('/api/tasks', data=json.dumps({'title': f'Task {i}', 'description': 'Some details'}),
+                          content_type='application/json')
+        response = self.app.get('/api/tasks', headers={'Accept': COLUMNAR_MIMETYPE, 'Accept-Encoding': 'gzip'})
+        self.assertEqual(response.mimetype, COLUMNAR_MIMETYPE)
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        table = json.loads(gzip.decompress(response.data))
+        self.assertEqual(len(table['rows']), 30)
+        self.assertEqual(dict(zip(table['columns'], table['rows'][0]))['title'], 'Task 0')
+
+        response = self.app.get('/api/tasks')
+        self.assertNotIn('Content-Encoding', response.headers)
+        self.assertEqual(len(response.get_json()), 30)
+
+    def test_task_store_indexes(self):
+        """Test the task store keeps order and its indexes in step with writes"""
+        from app import TaskStore
+        store = TaskStore()
+        first, second = store.add(Task('First', priority='low')), store.add(Task('Second'))
+        
+        self.assertIs(store.get(second.id), second)
+        store.update(first.id, priority='high', completed=True)
+        self.assertEqual(store.filter(priority='low'), [])
+        self.assertEqual(store.filter(priority='high', completed=True), [first])
+        self.assertEqual(store.stats(), {'total': 2, 'completed': 1, 'pending': 1})
+        
+        self.assertIs(store.remove(first.id), first)
+        self.assertIsNone(store.remove(first.id))
+        self.assertIsNone(store.update(first.id, title='Gone'))
+        self.assertEqual([task.title for task in store], ['Second'])
+        with self.assertRaises(ValueError):
+            store.update(second.id, id='other')
+
     def test_api_get_nonexistent_task(self):
         """Test API endpoint for getting a non-existent task"""
         # The API doesn't have a GET endpoint for individual tasks
@@ -159,5 +255,94 @@ class TestTaskManager(unittest.TestCase):
         # Check that no task was added
         self.assertEqual(len(tasks), 0)
 
+    def test_json_matches_stdlib_encoding(self):
+        """Test the JSON provider writes what json.dumps does, NaN and infinities included"""
+        for obj in ({'b': [1.5, None], 'a': 'café'}, {'a': float('nan'), 'b': [float('-inf'), None]},
+                    {'small': [1e-05, 1.291529344142946e-05]}):
+            with self.subTest(obj=obj):
+                self.assertEqual(flask_app.json.dumps_compact(obj),
+                                 json.dumps(obj, sort_keys=True, separators=(',', ':')).encode())
+
+class TestTaskLog(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'tasks.log')
+        self.stores = []
+
+    def tearDown(self):
+        for store in self.stores:
+            store._log.close()
+        shutil.rmtree(self.dir)
+
+    def open_store(self, **kwargs):
+        store = TaskStore(TaskLog(self.path, **kwargs))
+        self.stores.append(store)
+        return store
+
+    def test_tasks_survive_restart(self):
+        """Test a new store replays the log to the same tasks, in order"""
+        store = self.open_store()
+        first = store.add(Task('First', 'Body', 'high'))
+        second = store.add(Task('Second'))
+        store.add(Task('Third'))
+        store.toggle(first.id)
+        store.remove(second.id)
+        
+        reopened = self.open_store()
+        self.assertEqual([task.title for task in reopened], ['First', 'Third'])
+        self.assertTrue(reopened.get(first.id).completed)
+        self.assertEqual(reopened.get(first.id).created_at, first.created_at)
+        self.assertEqual(reopened.filter(priority='high'), [reopened.get(first.id)])
+        self.assertEqual(len(reopened.search('body')), 1)
+
+    def test_stores_share_one_log(self):
+        """Test two stores on one log, like two workers, see each other's writes"""
+        one, two = self.open_store(), self.open_store()
+        task = one.add(Task('Shared'))
+        self.assertEqual(two.get(task.id).title, 'Shared')
+        two.update(task.id, title='Renamed')
+        self.assertEqual(one.get(task.id).title, 'Renamed')
+        one.clear()
+        self.assertEqual(len(two), 0)
+
+    def test_compaction_and_torn_write(self):
+        """Test compaction keeps the tasks and a torn last record is ignored"""
+        store = self.open_store(compact_bytes=2048)
+        other = self.open_store()
+        for i in range(50):
+            store.add(Task(f'Task {i}'))
+        self.assertTrue(os.path.exists(f'{self.path}.snapshot'))
+        self.assertLess(os.path.getsize(self.path), 2048)
+        self.assertEqual(len(other), 50)
+        
+        with open(self.path, 'ab') as log:
+            log.write(b'{"op":"clear"')
+        reopened = self.open_store()
+        self.assertEqual(len(reopened), 50)
+        reopened.add(Task('After crash'))
+        self.assertEqual(self.open_store()[-1].title, 'After crash')
+
+class TestSharedModules(unittest.TestCase):
+    # Each service's image is built from its own directory, so these modules
+    # are copied into every service that uses them; an edit must go to all
+    SHARED = {
+        'compression.py': ['.', 'backend-api', 'frontend'],
+        'json_provider.py': ['.', 'backend-api'],
+        'profiling.py': ['backend-api', 'frontend'],
+    }
+
+    def test_copies_are_identical(self):
+        """Test every copy of a shared module matches the first"""
+        root = os.path.dirname(os.path.abspath(__file__))
+        for name, directories in self.SHARED.items():
+            copies = {}
+            for directory in directories:
+                with open(os.path.join(root, directory, name), 'rb') as module:
+                    copies[directory] = module.read()
+            for directory in directories[1:]:
+                with self.subTest(module=name, copy=directory):
+                    self.assertEqual(copies[directory], copies[directories[0]],
+                                     f'{directory}/{name} differs from {directories[0]}/{name}')
+
 if __name__ == '__main__':
     unittest.main()